@@ -1,12 +1,41 @@
 import math
+from collections import deque
+from datetime import datetime, time, timedelta
 import streamlit as st
 import os
 import camera_model
-from drive_client import get_video_url
-from orchestrator import get_container_logs, BASE_CONTAINER_NAME
-from record import base_dir
+import drive_quota
+from drive_client import find_date_path, get_file_url, get_video_urls
+from metrics_server import summary as metrics_summary
+from playback import clip_url, image_url
+from sprites import SPRITE_COLUMNS, SPRITE_ROWS, tile_position
+from orchestrator import (
+    tail_container_logs,
+    recorder_container_name,
+    BASE_CONTAINER_NAME,
+    LOG_LEVELS,
+)
 
 st.set_page_config(page_title="Gerenciador de Câmeras", layout="wide")
+# Consultas do painel usam só a cota do Drive que os uploads deixam livre
+drive_quota.set_priority(drive_quota.PRIORITY_INTERACTIVE)
+
+RECORDS_PER_PAGE = 30
+LOG_MAX_LINES = 500
+PRIORITY_HELP = (
+    "Câmeras com prioridade 0 podem ter gravações ainda não enviadas descartadas "
+    "quando o disco estiver quase cheio"
+)
+MOTION_POLICIES = {
+    camera_model.MOTION_ORIGINAL: "Enviar original",
+    camera_model.MOTION_COMPRESS: "Enviar cópia comprimida",
+    camera_model.MOTION_THUMBNAIL: "Manter só a miniatura",
+}
+MOTION_POLICY_HELP = "O que fazer com gravações sem movimento (abaixo do limiar)"
+MOTION_THRESHOLD_HELP = (
+    "Percentual de pixels alterados entre quadros abaixo do qual a gravação é "
+    "considerada sem movimento"
+)
 
 # Página principal ou detalhe
 page = st.query_params.get("pagina", "home")
@@ -14,10 +43,6 @@ camera_name = st.query_params.get("cam", "")
 camera_id = st.query_params.get("cam_id", "")
 
 
-def normalize_name(name: str):
-    return name.replace(" ", "_").lower()
-
-
 @st.dialog("Editar Câmera", width="large")
 def edit_camera(camera_id: int):
     with st.form("edit_camera"):
@@ -36,6 +61,26 @@ def edit_camera(camera_id: int):
         camera_data.date_range = st.number_input(
             "Dias para manter gravações", min_value=1, value=camera_data.date_range
         )
+        camera_data.priority = st.number_input(
+            "Prioridade",
+            help=PRIORITY_HELP,
+            min_value=0,
+            value=camera_data.priority,
+        )
+        camera_data.motion_policy = st.selectbox(
+            "Gravações sem movimento",
+            list(MOTION_POLICIES),
+            index=list(MOTION_POLICIES).index(camera_data.motion_policy),
+            format_func=MOTION_POLICIES.get,
+            help=MOTION_POLICY_HELP,
+        )
+        camera_data.motion_threshold = st.number_input(
+            "Limiar de movimento (%)",
+            help=MOTION_THRESHOLD_HELP,
+            min_value=0.0,
+            max_value=100.0,
+            value=camera_data.motion_threshold,
+        )
 
         if st.form_submit_button("Salvar", use_container_width=True, type="primary"):
             with st.spinner("Salvando...", show_time=True):
@@ -43,33 +88,69 @@ def edit_camera(camera_id: int):
             st.success(f"Câmera {camera_data.name} atualizada!")
 
 
+def thumbnail_html(record: camera_model.Recording) -> str:
+    """Grid tile: the sprite tile shows at once, the medium thumbnail loads lazily."""
+    style = "position:relative;width:100%;aspect-ratio:16/9;background:#000"
+    if record.sprite_path:
+        column, row = tile_position(record.sprite_index)
+        style += (
+            f";background-image:url('{image_url(record.sprite_path)}')"
+            f";background-size:{SPRITE_COLUMNS * 100}% {SPRITE_ROWS * 100}%"
+            f";background-position:{column / max(SPRITE_COLUMNS - 1, 1):.4%}"
+            f" {row / max(SPRITE_ROWS - 1, 1):.4%}"
+        )
+    image = ""
+    if record.thumbnail_path:
+        image = (
+            f'<img src="{image_url(record.thumbnail_path)}" loading="lazy" '
+            'decoding="async" style="width:100%;height:100%;object-fit:contain">'
+        )
+    return f'<div style="{style}">{image}</div>'
+
+
 @st.dialog("Logs", width="large")
-def get_recorder_logs(last_container_name: str):
-    minutes_range = st.number_input(
+def get_recorder_logs(container_name: str):
+    col1, col2 = st.columns([1, 2])
+    minutes_range = col1.number_input(
         "Buscar ultimos",
         help="Quantidade em minutos de tempo no passado para buscar os logs",
         min_value=1,
         max_value=60,
         value=1,
     )
-    try:
-        logs = get_container_logs(
-            f"{BASE_CONTAINER_NAME}-{last_container_name}", minutes_range
-        )
-    except Exception as err:
-        st.error(err)
-        logs = []
-    for log_line in logs:
-        if not log_line:
-            continue
-        with st.empty():
-            if log_line.startswith("WARNING"):
-                st.warning(log_line.strip())
-                continue
-            if log_line.startswith("ERROR"):
-                st.error(log_line.strip())
-                continue
-            st.info(log_line.strip())
+    levels = col2.multiselect(
+        "Níveis", LOG_LEVELS, default=["INFO", "WARNING", "ERROR", "CRITICAL"]
+    )
+
+    # Mantém cursor e linhas entre atualizações para buscar apenas o que é novo
+    state_key = f"logs_{container_name}"
+    state = st.session_state.get(state_key)
+    if state is None or state["filters"] != (minutes_range, tuple(levels)):
+        state = st.session_state[state_key] = {
+            "filters": (minutes_range, tuple(levels)),
+            "cursor": None,
+            "lines": deque(maxlen=LOG_MAX_LINES),
+        }
+
+    if st.button("🔄 Atualizar", use_container_width=True) or state["cursor"] is None:
+        try:
+            new_lines, state["cursor"] = tail_container_logs(
+                container_name,
+                cursor=state["cursor"],
+                minutes_range=minutes_range,
+                max_lines=LOG_MAX_LINES,
+                levels=levels,
+            )
+            state["lines"].extend(new_lines)
+        except Exception as err:
+            st.error(err)
+
+    if not state["lines"]:
+        st.info("Nenhum log encontrado.")
+        return
+
+    st.caption(f"Últimas {len(state['lines'])} linhas")
+    st.code("\n".join(state["lines"]), language=None)
 
 
 # 📄 Página: gravações da câmera
@@ -81,10 +162,77 @@ if page == "gravacoes" and camera_name:
     )
     st.title(f"🎥 Gravações da câmera: {camera_name}")
     camera_data = camera_model.get_camera_data(camera_id)
-    camera_path = os.path.join(base_dir, normalize_name(camera_name))
 
-    if os.path.exists(camera_path):
-        records = sorted([f for f in os.listdir(camera_path) if f.endswith(".jpg")])
+    with st.expander("⏯️ Reproduzir intervalo"):
+        col1, col2, col3 = st.columns(3)
+        clip_date = col1.date_input("Data", format="DD/MM/YYYY")
+        clip_start = col2.time_input("Início", value=time(0, 0), step=60)
+        clip_end = col3.time_input("Fim", value=time(1, 0), step=60)
+
+        if st.button("Reproduzir", use_container_width=True, type="primary"):
+            start = datetime.combine(clip_date, clip_start)
+            end = datetime.combine(clip_date, clip_end)
+            # Intervalo que atravessa a meia-noite termina no dia seguinte
+            if end <= start:
+                end += timedelta(days=1)
+            url = clip_url(camera_data.wid, start, end)
+            st.video(url)
+            st.link_button("Abrir em nova aba", url, icon="🔗")
+
+    motion_range = st.slider(
+        "Movimento (% de pixels alterados)",
+        min_value=0.0,
+        max_value=100.0,
+        value=(0.0, 100.0),
+        help="Filtra as gravações já analisadas pela intensidade de movimento",
+    )
+    # Faixa completa inclui as gravações ainda não analisadas
+    motion_filters = {}
+    if motion_range[0] > 0:
+        motion_filters["min_motion"] = motion_range[0]
+    if motion_range[1] < 100:
+        motion_filters["max_motion"] = motion_range[1]
+
+    total_records = camera_model.count_recordings(
+        camera_data.wid, with_thumbnail=True, **motion_filters
+    )
+
+    if total_records:
+        total_pages = max(math.ceil(total_records / RECORDS_PER_PAGE), 1)
+        page_number = st.number_input(
+            f"Página (de {total_pages})", min_value=1, max_value=total_pages, value=1
+        )
+        records = camera_model.list_recordings(
+            camera_data.wid,
+            with_thumbnail=True,
+            limit=RECORDS_PER_PAGE,
+            offset=(page_number - 1) * RECORDS_PER_PAGE,
+            descending=True,
+            **motion_filters,
+        )
+
+        # Só consulta o Drive para gravações sem ID registrado no catálogo
+        video_urls = {}
+        missing_by_date = {}
+        for record in records:
+            if not record.drive_id and record.state != camera_model.RECORDING_SKIPPED:
+                missing_by_date.setdefault(record.start_time.date(), []).append(
+                    os.path.basename(record.path)
+                )
+        for record_date, names in missing_by_date.items():
+            date_folder_id = find_date_path(camera_data.uri, record_date)
+            if date_folder_id:
+                video_urls.update(get_video_urls(names, date_folder_id))
+        # Uploads anteriores às pastas por data ficam na pasta da câmera até a migração
+        legacy_names = [
+            name
+            for names in missing_by_date.values()
+            for name in names
+            if not video_urls.get(name)
+        ]
+        if legacy_names:
+            video_urls.update(get_video_urls(legacy_names, camera_data.uri))
+
         rows = [st.columns(3, border=True) for _ in range(math.ceil(len(records) / 3))]
 
         index = 0
@@ -92,16 +240,17 @@ if page == "gravacoes" and camera_name:
             for col in row:
                 if index >= len(records):
                     break
-                thumb_path = os.path.join(camera_path, records[index])
+                record = records[index]
 
-                col.image(thumb_path, caption=records[index])
-                video_filename = os.path.split(records[index])[-1].replace(
-                    ".jpg", ".mp4"
-                )
-                video_url = get_video_url(
-                    video_filename,
-                    camera_data.uri,
-                )
+                caption = os.path.basename(record.path)
+                if record.motion_score is not None:
+                    caption += f" · movimento {record.motion_score:.1f}%"
+                col.markdown(thumbnail_html(record), unsafe_allow_html=True)
+                col.caption(caption)
+                if record.drive_id:
+                    video_url = get_file_url(record.drive_id)
+                else:
+                    video_url = video_urls.get(os.path.basename(record.path))
                 if video_url:
                     col.link_button(
                         "Link do drive",
@@ -110,6 +259,8 @@ if page == "gravacoes" and camera_name:
                         type="primary",
                         icon="▶️",
                     )
+                elif record.state == camera_model.RECORDING_SKIPPED:
+                    col.info("Sem movimento, vídeo não enviado ao drive")
                 else:
                     col.warning("Video não encontrado no drive!")
                 index += 1
@@ -136,6 +287,22 @@ else:
             date_range = st.number_input(
                 "Dias para manter gravações", min_value=1, value=7
             )
+            priority = st.number_input(
+                "Prioridade", help=PRIORITY_HELP, min_value=0, value=1
+            )
+            motion_policy = st.selectbox(
+                "Gravações sem movimento",
+                list(MOTION_POLICIES),
+                format_func=MOTION_POLICIES.get,
+                help=MOTION_POLICY_HELP,
+            )
+            motion_threshold = st.number_input(
+                "Limiar de movimento (%)",
+                help=MOTION_THRESHOLD_HELP,
+                min_value=0.0,
+                max_value=100.0,
+                value=camera_model.MOTION_THRESHOLD,
+            )
 
             if st.form_submit_button("Salvar"):
                 with st.spinner("Salvando...", show_time=True):
@@ -146,18 +313,97 @@ else:
                         passw=passw,
                         segment_duration=segment_duration,
                         date_range=date_range,
+                        priority=priority,
+                        motion_policy=motion_policy,
+                        motion_threshold=motion_threshold,
                     )
                     camera.save()
                 st.success(f"Câmera {name} adicionada!")
 
     st.markdown("---")
 
+    active_policies = [
+        policy
+        for policy, active in camera_model.get_backpressure_policies().items()
+        if active
+    ]
+    if active_policies:
+        st.warning(
+            "Backlog de upload sob pressão, políticas ativas: "
+            + ", ".join(active_policies)
+        )
+
+    with st.expander("📊 Métricas"):
+        stats = metrics_summary()
+        queue = stats["queue"]
+        q_col1, q_col2, q_col3, q_col4 = st.columns(4)
+        q_col1.metric("Fila de upload", queue[camera_model.QUEUE_PENDING])
+        q_col2.metric("Enviando", queue[camera_model.QUEUE_LEASED])
+        q_col3.metric("Falhas definitivas", queue[camera_model.QUEUE_DEAD])
+        q_col4.metric("Item mais antigo", f"{queue['oldest_age'] / 60:.0f} min")
+
+        if queue[camera_model.QUEUE_DEAD]:
+            st.dataframe(
+                [
+                    {
+                        "Arquivo": os.path.basename(dead.filename),
+                        "Tentativas": dead.attempts,
+                        "Último erro": dead.last_error,
+                    }
+                    for dead in camera_model.get_dead_letters()
+                ],
+                use_container_width=True,
+                hide_index=True,
+            )
+            if st.button("🔁 Reenviar falhas definitivas"):
+                requeued = camera_model.requeue_dead_letters()
+                st.success(f"{requeued} uploads devolvidos à fila")
+
+        t_col1, t_col2 = st.columns(2)
+        t_col1.metric("Fila do ffmpeg", f"{stats['transcode']['queued']:.0f}")
+        t_col2.metric("Transcodificando", f"{stats['transcode']['running']:.0f}")
+
+        d_col1, d_col2, d_col3 = st.columns(3)
+        d_col1.metric("Upload", f"{stats['upload_rate'] / 1024**2:.2f} MiB/s")
+        d_col2.metric("Requisições ao Drive", f"{stats['drive_requests']:.0f}")
+        d_col3.metric("Erros no Drive", f"{stats['drive_error_rate']:.1%}")
+
+        quota = stats["drive_quota"]
+        if quota["open_for"]:
+            st.error(
+                f"Chamadas ao Drive suspensas por {quota['open_for']:.0f}s após "
+                f"{quota['failures']} falhas seguidas"
+            )
+        elif quota["blocked_for"]:
+            st.warning(
+                f"Limite do Drive atingido, pausa de {quota['blocked_for']:.0f}s"
+            )
+        st.caption(f"Cota do Drive: {quota['rate']:.1f} req/s")
+
+        for lagging, age in stats["lagging_cameras"]:
+            st.warning(
+                f"Câmera {lagging.name} sem novos segmentos há {age / 60:.0f} min"
+            )
+
+        for title, averages in (
+            ("Latência média do Drive", stats["drive_latency"]),
+            ("Tempo médio do ffmpeg", stats["ffmpeg_runtime"]),
+            ("Espera média por lock do SQLite", stats["lock_wait"]),
+        ):
+            if averages:
+                st.caption(
+                    f"{title}: "
+                    + ", ".join(
+                        f"{key} {value:.2f}s" for key, value in sorted(averages.items())
+                    )
+                )
+
     title_col1, title_col2 = st.columns([6, 1])
     title_col1.subheader("📷 Câmeras cadastradas")
     title_col2.button(
         "_",
         key="orchestrator_logs",
-        on_click=lambda: get_recorder_logs("orchestrator"),
+        on_click=lambda: get_recorder_logs(f"{BASE_CONTAINER_NAME}-orchestrator"),
     )
 
     cameras = camera_model.list_cameras()
@@ -173,7 +419,7 @@ else:
                     "_",
                     key="logs_" + cam.name,
                     on_click=lambda cam_id=cam.wid: get_recorder_logs(
-                        f"monitoring-{cam_id}"
+                        recorder_container_name(cam_id)
                     ),
                 )
                 c_col2.button(
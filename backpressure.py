@@ -0,0 +1,194 @@
+import logging
+import os
+import shutil
+import threading
+from typing import Dict, Optional
+
+import camera_model
+import metrics
+
+# Pressão: fila, backlog ou disco livre além destes limites
+QUEUE_DEPTH_LIMIT = int(os.environ.get("BACKPRESSURE_QUEUE_DEPTH", 200))
+BACKLOG_LIMIT = int(os.environ.get("BACKPRESSURE_BACKLOG_MB", 2048)) * 1024 * 1024
+MIN_FREE_PERCENT = float(os.environ.get("BACKPRESSURE_MIN_FREE_PERCENT", 20))
+# Abaixo deste espaço livre as gravações de câmeras de baixa prioridade são descartadas
+CRITICAL_FREE_PERCENT = float(os.environ.get("BACKPRESSURE_CRITICAL_FREE_PERCENT", 10))
+# Uma política só é desativada quando os valores voltam a esta fração do limite
+RELIEF_RATIO = float(os.environ.get("BACKPRESSURE_RELIEF_RATIO", 0.8))
+CHECK_INTERVAL = int(os.environ.get("BACKPRESSURE_INTERVAL", 30))
+
+POLICY_COMPRESS = "compress"
+POLICY_BITRATE = "bitrate"
+POLICY_SPILL = "spill"
+ENABLED_POLICIES = {
+    policy.strip()
+    for policy in os.environ.get(
+        "BACKPRESSURE_POLICIES", f"{POLICY_COMPRESS},{POLICY_BITRATE},{POLICY_SPILL}"
+    ).split(",")
+    if policy.strip()
+}
+
+# Bitrate de vídeo usado no lugar do stream copy enquanto POLICY_BITRATE estiver ativa
+REDUCED_BITRATE = os.environ.get("BACKPRESSURE_BITRATE", "500k")
+# Câmeras com priority <= este valor entram no descarte
+SPILL_MAX_PRIORITY = int(os.environ.get("BACKPRESSURE_SPILL_MAX_PRIORITY", 0))
+SPILL_BATCH = int(os.environ.get("BACKPRESSURE_SPILL_BATCH", 50))
+
+RECS_DIR = "shared/recs"
+
+
+def free_disk_percent(path: str = RECS_DIR) -> float:
+    os.makedirs(path, exist_ok=True)
+    usage = shutil.disk_usage(path)
+    return usage.free / usage.total * 100
+
+
+def measure() -> Dict[str, float]:
+    return {
+        "queue_depth": camera_model.queue_depth(),
+        "backlog_bytes": camera_model.backlog_bytes(),
+        "free_disk_percent": free_disk_percent(),
+    }
+
+
+def __under_pressure(measures: Dict[str, float], relief: float) -> Optional[str]:
+    """Reason why the limits (scaled by ``relief``) are exceeded, if they are."""
+    if measures["queue_depth"] >= QUEUE_DEPTH_LIMIT * relief:
+        return f"fila com {measures['queue_depth']} itens"
+    if measures["backlog_bytes"] >= BACKLOG_LIMIT * relief:
+        return f"backlog de {measures['backlog_bytes'] / 1024**2:.0f} MiB"
+    if measures["free_disk_percent"] <= MIN_FREE_PERCENT / relief:
+        return f"{measures['free_disk_percent']:.1f}% de disco livre"
+    return None
+
+
+def __critical(measures: Dict[str, float], relief: float) -> Optional[str]:
+    if measures["free_disk_percent"] <= CRITICAL_FREE_PERCENT / relief:
+        return f"{measures['free_disk_percent']:.1f}% de disco livre"
+    return None
+
+
+def evaluate(measures: Dict[str, float]) -> Dict[str, bool]:
+    """Decide which enabled policies should be active and persist the decision.
+
+    A policy turns on when its limit is crossed and only turns off once the
+    measures are back below ``RELIEF_RATIO`` of it, so it does not flap.
+    """
+    current = camera_model.get_backpressure_policies()
+    triggers = {
+        POLICY_COMPRESS: __under_pressure,
+        POLICY_BITRATE: __under_pressure,
+        POLICY_SPILL: __critical,
+    }
+
+    decision = {}
+    for policy, trigger in triggers.items():
+        was_active = current.get(policy, False)
+        reason = None
+        if policy in ENABLED_POLICIES:
+            reason = trigger(measures, RELIEF_RATIO if was_active else 1)
+        active = reason is not None
+        decision[policy] = active
+
+        if active != was_active:
+            logging.warning(
+                f"Backpressure: política {policy} "
+                f"{'ativada (' + reason + ')' if active else 'desativada'}"
+            )
+            camera_model.set_backpressure_policy(policy, active, reason)
+            metrics.inc(
+                "ipcam_backpressure_transitions_total",
+                policy=policy,
+                state="on" if active else "off",
+            )
+        metrics.set_gauge("ipcam_backpressure_policy_active", active, policy=policy)
+
+    return decision
+
+
+def is_active(policy: str) -> bool:
+    """Whether ``policy`` is currently active, as decided by the monitor."""
+    try:
+        return camera_model.get_backpressure_policies().get(policy, False)
+    except Exception as err:
+        logging.error(f"Erro ao consultar backpressure: {err}")
+        return False
+
+
+def recording_bitrate() -> Optional[str]:
+    """Video bitrate recorders should use now, or None to keep stream copy."""
+    return REDUCED_BITRATE if is_active(POLICY_BITRATE) else None
+
+
+def spill():
+    """Drop the oldest un-uploaded segments of low-priority cameras.
+
+    Stops as soon as free space is back above ``CRITICAL_FREE_PERCENT`` divided
+    by the relief ratio, or when there is nothing left to drop.
+    """
+    target = CRITICAL_FREE_PERCENT / RELIEF_RATIO
+    while free_disk_percent() < target:
+        candidates = camera_model.list_spill_candidates(SPILL_MAX_PRIORITY, SPILL_BATCH)
+        if not candidates:
+            logging.error(
+                "Backpressure: disco crítico e nenhuma gravação de baixa prioridade "
+                "para descartar"
+            )
+            return
+
+        for recording in candidates:
+            dropped = 0
+            for path in (
+                recording.path,
+                recording.thumbnail_path,
+                recording.thumbnail_small_path,
+                recording.compressed_path,
+                recording.preview_path,
+            ):
+                if path and os.path.exists(path):
+                    dropped += os.path.getsize(path)
+                    os.remove(path)
+
+            camera_model.delete_queued_uploads(recording.path)
+            camera_model.update_recording(
+                recording.path,
+                state=camera_model.RECORDING_DROPPED,
+                local=False,
+                thumbnail_path=None,
+                thumbnail_small_path=None,
+                sprite_path=None,
+                sprite_index=None,
+                compressed_path=None,
+                preview_path=None,
+            )
+            logging.warning(f"Backpressure: gravação descartada {recording.path}")
+            metrics.inc(
+                "ipcam_backpressure_dropped_segments_total",
+                camera_id=recording.camera_id,
+            )
+            metrics.inc(
+                "ipcam_backpressure_dropped_bytes_total",
+                dropped,
+                camera_id=recording.camera_id,
+            )
+
+
+def check() -> Dict[str, bool]:
+    measures = measure()
+    for name, value in measures.items():
+        metrics.set_gauge(f"ipcam_backpressure_{name}", value)
+
+    decision = evaluate(measures)
+    if decision[POLICY_SPILL]:
+        spill()
+    return decision
+
+
+def run(stop_event: threading.Event, interval: int = CHECK_INTERVAL):
+    """Check the backlog every ``interval`` seconds until ``stop_event`` is set."""
+    while not stop_event.is_set():
+        try:
+            check()
+        except Exception as err:
+            logging.error(f"Erro no monitor de backpressure: {err}")
+        stop_event.wait(interval)
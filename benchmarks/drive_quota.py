@@ -0,0 +1,111 @@
+"""Several processes sharing the Drive quota, with and without the drive_quota limiter.
+
+Each process lists a folder in a loop against a fake Drive that refuses requests
+beyond ``--quota`` per second with 403 ``userRateLimitExceeded``. Half of them
+run as uploads and half as dashboard lookups. The report shows the accepted
+request rate per priority class and how many 403s the fake had to send.
+"Sem limitador" turns the limiter off (``DRIVE_QUOTA_ENABLED=False``), leaving
+only each process's own retries with backoff.
+
+Usage (from the project root):
+
+    python -m benchmarks.drive_quota --processes 6 --quota 20 --duration 20
+"""
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+from collections import Counter
+
+from benchmarks.fake_drive import start_server
+
+
+def worker(env: dict, priority: str, duration: float, results):
+    os.environ.update(env)
+    import drive_client
+    import drive_quota
+    import metrics
+
+    drive_quota.set_priority(priority)
+    folder_id = drive_client.create_camera_path("quota")
+    done = Counter()
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        try:
+            drive_client.list_folder_files(folder_id, limit=1)
+            done["ok"] += 1
+        except Exception as err:
+            done[type(err).__name__] += 1
+    metrics.flush()
+    results.put((priority, dict(done)))
+
+
+def run(processes: int, quota: int, duration: float, rate: float = 0) -> dict:
+    server, endpoint = start_server(quota=quota)
+    drive = server.RequestHandlerClass.drive
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = {
+            "DRIVE_API_ENDPOINT": endpoint,
+            "GDRIVE_BASE_FOLDER_ID": "root",
+            "DB_PATH": os.path.join(tmp, "db.sqlite3"),
+            "DRIVE_QUOTA_ENABLED": str(bool(rate)),
+            "DRIVE_QUOTA_RATE": str(rate),
+            "LOG_LEVEL": "ERROR",
+        }
+        workers = [
+            context.Process(
+                target=worker,
+                args=(
+                    env,
+                    "upload" if index % 2 == 0 else "interactive",
+                    duration,
+                    results,
+                ),
+            )
+            for index in range(processes)
+        ]
+        for process in workers:
+            process.start()
+        totals = {"upload": Counter(), "interactive": Counter()}
+        for _ in workers:
+            priority, done = results.get()
+            totals[priority].update(done)
+        for process in workers:
+            process.join()
+
+    server.shutdown()
+    return {"totals": totals, "rate_limited": drive.rate_limited}
+
+
+def report(name: str, result: dict, duration: float):
+    print(f"{name}: {result['rate_limited']} respostas 403 do Drive")
+    for priority, done in result["totals"].items():
+        errors = ", ".join(f"{k}={v}" for k, v in done.items() if k != "ok")
+        print(
+            f"  {priority:12} {done['ok'] / duration:7.1f} req/s aceitas"
+            + (f" (falhas: {errors})" if errors else "")
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="Drive quota benchmark")
+    parser.add_argument("--processes", type=int, default=6)
+    parser.add_argument("--quota", type=int, default=20, help="requests/s")
+    parser.add_argument("--duration", type=float, default=20)
+    parser.add_argument(
+        "--rate", type=float, help="limiter rate (default: the quota itself)"
+    )
+    args = parser.parse_args()
+
+    print(f"{args.processes} processos, cota de {args.quota} req/s")
+    for name, rate in (
+        ("sem limitador", 0),
+        ("com limitador", args.rate or args.quota),
+    ):
+        report(
+            name, run(args.processes, args.quota, args.duration, rate), args.duration
+        )
@@ -0,0 +1,63 @@
+"""Compare sequential uploads with drive_client.upload_many against the fake Drive.
+
+Usage (from the project root):
+
+    python -m benchmarks.drive_uploads --files 16 --size-mb 4 --bandwidth 2000000
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from benchmarks.fake_drive import start_server
+
+
+def run(files: int, size_mb: int, bandwidth: int, latency: float, connections: int):
+    server, endpoint = start_server(latency=latency, bandwidth=bandwidth)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["DRIVE_API_ENDPOINT"] = endpoint
+        os.environ["DRIVE_UPLOAD_CONNECTIONS"] = str(connections)
+        os.environ.setdefault("GDRIVE_BASE_FOLDER_ID", "root")
+        os.environ["DRIVE_INDEX_PATH"] = os.path.join(tmp, "drive_index.sqlite3")
+        import drive_client
+
+        paths = []
+        for index in range(files):
+            path = os.path.join(tmp, f"segment_{index:04d}.mp4")
+            with open(path, "wb") as video:
+                video.write(os.urandom(size_mb * 1024 * 1024))
+            paths.append(path)
+
+        total_bytes = files * size_mb * 1024 * 1024
+        folder_id = drive_client.create_camera_path("benchmark_sequential")
+        started = time.perf_counter()
+        for path in paths:
+            drive_client.upload_file(path, folder_id)
+        sequential = time.perf_counter() - started
+
+        folder_id = drive_client.create_camera_path("benchmark_concurrent")
+        started = time.perf_counter()
+        for future in drive_client.upload_many((path, folder_id) for path in paths):
+            future.result()
+        concurrent = time.perf_counter() - started
+
+    server.shutdown()
+    print(f"files={files} size={size_mb}MiB bandwidth/conn={bandwidth}B/s")
+    print(f"sequential:  {total_bytes / sequential / 1024 / 1024:8.2f} MiB/s")
+    print(
+        f"upload_many: {total_bytes / concurrent / 1024 / 1024:8.2f} MiB/s "
+        f"({connections} connections)"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="Drive upload benchmark")
+    parser.add_argument("--files", type=int, default=16)
+    parser.add_argument("--size-mb", type=int, default=4)
+    parser.add_argument("--bandwidth", type=int, default=2_000_000)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--connections", type=int, default=4)
+    args = parser.parse_args()
+
+    run(args.files, args.size_mb, args.bandwidth, args.latency, args.connections)
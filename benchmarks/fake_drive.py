@@ -0,0 +1,400 @@
+"""Local fake of the Google Drive v3 endpoints used by drive_client.
+
+Supports folder/file listing, folder creation, metadata updates (also inside
+batch requests), resumable uploads and media downloads, which is enough to run
+the real upload paths without a Google account. With ``quota`` set, requests
+beyond that many per second are refused with 403 ``userRateLimitExceeded``.
+Point the app at it with ``DRIVE_API_ENDPOINT=http://127.0.0.1:<port>/``.
+
+Usage (from the project root):
+
+    python -m benchmarks.fake_drive --port 8000 --latency 0.05 --bandwidth 2000000
+"""
+import argparse
+import hashlib
+import itertools
+import json
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from email.parser import BytesParser
+from email.policy import HTTP
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+FOLDER_MIME = "application/vnd.google-apps.folder"
+
+
+class FakeDrive:
+    def __init__(
+        self,
+        latency: float = 0,
+        bandwidth: Optional[int] = None,
+        quota: Optional[int] = None,
+    ):
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.quota = quota
+        # Requisições aceitas na janela de um segundo atual
+        self.window = (0, 0)
+        self.rate_limited = 0
+        self.lock = threading.Lock()
+        self.files: Dict[str, dict] = {}
+        self.sessions: Dict[str, dict] = {}
+        self.contents: Dict[str, bytes] = {}
+        # Horário (time.time) em que cada upload foi concluído
+        self.completed: Dict[str, float] = {}
+        self.ids = itertools.count(1)
+        self.requests = 0
+        self.bytes_received = 0
+
+    def over_quota(self) -> bool:
+        if not self.quota:
+            return False
+        with self.lock:
+            second = int(time.time())
+            start, count = self.window
+            if start != second:
+                start, count = second, 0
+            if count >= self.quota:
+                self.rate_limited += 1
+                return True
+            self.window = (start, count + 1)
+            return False
+
+    def new_id(self, prefix: str = "file") -> str:
+        return f"{prefix}-{next(self.ids)}"
+
+    def list(self, query: str) -> list:
+        parent = re.search(r"'([^']+)' in parents", query or "")
+        name = re.search(r"name = '([^']+)'", query or "")
+        folders_only = f"mimeType = '{FOLDER_MIME}'" in (query or "")
+        files_only = f"mimeType != '{FOLDER_MIME}'" in (query or "")
+        with self.lock:
+            return [
+                meta
+                for meta in self.files.values()
+                if (not parent or parent.group(1) in meta["parents"])
+                and (not name or meta["name"] == name.group(1))
+                and (not folders_only or meta["mimeType"] == FOLDER_MIME)
+                and (not files_only or meta["mimeType"] != FOLDER_MIME)
+            ]
+
+    def update(self, file_id: str, params: dict, metadata: dict) -> Optional[dict]:
+        with self.lock:
+            meta = self.files.get(file_id)
+            if meta is None:
+                return None
+            meta.update({k: v for k, v in metadata.items() if k != "id"})
+            parents = [
+                parent
+                for parent in meta["parents"]
+                if parent not in params.get("removeParents", "").split(",")
+            ]
+            if params.get("addParents"):
+                parents.extend(params["addParents"].split(","))
+            meta["parents"] = parents
+            return meta
+
+
+def now_rfc3339() -> str:
+    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.000Z")
+
+
+class FakeDriveHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    drive: FakeDrive = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, body: dict, headers: Optional[dict] = None):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _send_empty(self, status: int, headers: Optional[dict] = None):
+        self.send_response(status)
+        self.send_header("Content-Length", "0")
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+
+    def _read_body(self) -> bytes:
+        length = int(self.headers.get("Content-Length") or 0)
+        if not length:
+            return b""
+
+        body = b""
+        started = time.monotonic()
+        while len(body) < length:
+            body += self.rfile.read(min(65536, length - len(body)))
+            if self.drive.bandwidth:
+                # Simula o uplink limitando a taxa por conexão
+                expected = len(body) / self.drive.bandwidth
+                delay = expected - (time.monotonic() - started)
+                if delay > 0:
+                    time.sleep(delay)
+        return body
+
+    def _route(self) -> Tuple[str, dict]:
+        parsed = urlparse(self.path)
+        self.drive.requests += 1
+        if self.drive.latency:
+            time.sleep(self.drive.latency)
+        return parsed.path, {k: v[-1] for k, v in parse_qs(parsed.query).items()}
+
+    def _rate_limited(self) -> bool:
+        """Answer 403 userRateLimitExceeded, as Drive does, when over the quota."""
+        if not self.drive.over_quota():
+            return False
+        self._read_body()
+        error = {"domain": "usageLimits", "reason": "userRateLimitExceeded"}
+        self._send_json(403, {"error": {"code": 403, "errors": [error]}})
+        return True
+
+    def do_GET(self):
+        path, params = self._route()
+        if self._rate_limited():
+            return
+        if path.endswith("/files"):
+            files = sorted(self.drive.list(params.get("q")), key=lambda f: f["id"])
+            offset = int(params.get("pageToken") or 0)
+            page_size = int(params.get("pageSize") or 100)
+            body = {"files": files[offset : offset + page_size]}
+            if offset + page_size < len(files):
+                body["nextPageToken"] = str(offset + page_size)
+            return self._send_json(200, body)
+
+        file_id = path.rsplit("/", 1)[-1]
+        meta = self.drive.files.get(file_id)
+        if meta is None:
+            return self._send_json(404, {"error": {"code": 404}})
+        if params.get("alt") == "media":
+            return self._send_media(self.drive.contents.get(file_id, b""))
+        return self._send_json(200, meta)
+
+    def _send_media(self, content: bytes):
+        start, end = 0, len(content) - 1
+        match = re.match(r"bytes=(\d+)-(\d*)", self.headers.get("Range", ""))
+        if match:
+            start = int(match.group(1))
+            end = min(int(match.group(2) or end), end)
+        payload = content[start : end + 1]
+
+        self.send_response(206 if match else 200)
+        self.send_header("Content-Type", "video/mp4")
+        self.send_header("Content-Length", str(len(payload)))
+        if match:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{len(content)}")
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_POST(self):
+        path, params = self._route()
+        if self._rate_limited():
+            return
+        if path.startswith("/batch/"):
+            return self._batch(self._read_body())
+        metadata = json.loads(self._read_body() or b"{}")
+
+        if path.startswith("/upload/"):
+            return self._start_session(None, metadata)
+
+        file_id = self.drive.new_id(
+            "folder" if metadata.get("mimeType") == FOLDER_MIME else "file"
+        )
+        meta = {
+            "id": file_id,
+            "name": metadata.get("name"),
+            "mimeType": metadata.get("mimeType", "application/octet-stream"),
+            "parents": metadata.get("parents", []),
+            "createdTime": now_rfc3339(),
+        }
+        with self.drive.lock:
+            self.drive.files[file_id] = meta
+        return self._send_json(200, meta)
+
+    def do_PATCH(self):
+        path, params = self._route()
+        if self._rate_limited():
+            return
+        file_id = path.rsplit("/", 1)[-1]
+        metadata = json.loads(self._read_body() or b"{}")
+        if file_id not in self.drive.files:
+            return self._send_json(404, {"error": {"code": 404}})
+
+        if path.startswith("/upload/"):
+            return self._start_session(file_id, metadata)
+
+        return self._send_json(200, self.drive.update(file_id, params, metadata))
+
+    def _batch(self, body: bytes):
+        """Answer a multipart/mixed batch; only metadata PATCHes are supported."""
+        content_type = self.headers.get("Content-Type", "")
+        message = BytesParser(policy=HTTP).parsebytes(
+            f"Content-Type: {content_type}\r\n\r\n".encode() + body
+        )
+        boundary = "batch_fake_drive"
+        parts = []
+        for part in message.iter_parts():
+            request = part.get_payload(decode=True) or part.get_payload().encode()
+            head, _, part_body = request.partition(b"\r\n\r\n")
+            if not part_body and b"\n\n" in request:
+                head, _, part_body = request.partition(b"\n\n")
+            method, target, _ = head.split(b"\r\n")[0].decode().split(" ", 2)
+            parsed = urlparse(target)
+            params = {k: v[-1] for k, v in parse_qs(parsed.query).items()}
+
+            status, response = 501, {"error": {"code": 501}}
+            if method == "PATCH":
+                meta = self.drive.update(
+                    parsed.path.rsplit("/", 1)[-1],
+                    params,
+                    json.loads(part_body.strip() or b"{}"),
+                )
+                if meta:
+                    status, response = 200, meta
+                else:
+                    status, response = 404, {"error": {"code": 404}}
+
+            content_id = (part["Content-ID"] or "").strip("<>")
+            payload = json.dumps(response)
+            parts.append(
+                f"--{boundary}\r\n"
+                "Content-Type: application/http\r\n"
+                f"Content-ID: <response-{content_id}>\r\n\r\n"
+                f"HTTP/1.1 {status} {HTTPStatus(status).phrase}\r\n"
+                "Content-Type: application/json\r\n"
+                f"Content-Length: {len(payload)}\r\n\r\n"
+                f"{payload}\r\n"
+            )
+
+        payload = ("".join(parts) + f"--{boundary}--\r\n").encode()
+        self.send_response(200)
+        self.send_header("Content-Type", f"multipart/mixed; boundary={boundary}")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_DELETE(self):
+        path, _ = self._route()
+        if self._rate_limited():
+            return
+        file_id = path.rsplit("/", 1)[-1]
+        with self.drive.lock:
+            removed = self.drive.files.pop(file_id, None)
+            self.drive.contents.pop(file_id, None)
+        if removed is None:
+            return self._send_json(404, {"error": {"code": 404}})
+        return self._send_empty(204)
+
+    def _start_session(self, file_id: Optional[str], metadata: dict):
+        session_id = self.drive.new_id("session")
+        with self.drive.lock:
+            self.drive.sessions[session_id] = {
+                "file_id": file_id,
+                "metadata": metadata,
+                "received": 0,
+                "md5": hashlib.md5(),
+                "data": bytearray(),
+            }
+        host = self.headers.get("Host")
+        return self._send_empty(
+            200, {"Location": f"http://{host}/upload/sessions/{session_id}"}
+        )
+
+    def do_PUT(self):
+        path, _ = self._route()
+        if self._rate_limited():
+            return
+        session = self.drive.sessions.get(path.rsplit("/", 1)[-1])
+        if session is None:
+            self._read_body()
+            return self._send_json(404, {"error": {"code": 404}})
+
+        content_range = self.headers.get("Content-Range", "")
+        match = re.match(r"bytes (\*|(\d+)-(\d+))/(\d+|\*)", content_range)
+        body = self._read_body()
+        self.drive.bytes_received += len(body)
+
+        if match and match.group(2) is not None:
+            start = int(match.group(2))
+            if start == session["received"]:
+                session["md5"].update(body)
+                session["data"] += body
+                session["received"] += len(body)
+            elif start + len(body) > session["received"]:
+                overlap = session["received"] - start
+                session["md5"].update(body[overlap:])
+                session["data"] += body[overlap:]
+                session["received"] = start + len(body)
+
+        total = match.group(4) if match else None
+        if total and total != "*" and session["received"] >= int(total):
+            return self._finish_session(path.rsplit("/", 1)[-1], session)
+
+        headers = {}
+        if session["received"]:
+            headers["Range"] = f"bytes=0-{session['received'] - 1}"
+        return self._send_empty(308, headers)
+
+    def _finish_session(self, session_id: str, session: dict):
+        with self.drive.lock:
+            file_id = session["file_id"] or self.drive.new_id()
+            meta = self.drive.files.get(file_id) or {
+                "id": file_id,
+                "name": session["metadata"].get("name"),
+                "mimeType": "video/mp4",
+                "parents": session["metadata"].get("parents", []),
+                "createdTime": now_rfc3339(),
+            }
+            meta["size"] = str(session["received"])
+            meta["md5Checksum"] = session["md5"].hexdigest()
+            self.drive.files[file_id] = meta
+            self.drive.contents[file_id] = bytes(session["data"])
+            self.drive.completed[file_id] = time.time()
+            self.drive.sessions.pop(session_id, None)
+        return self._send_json(200, meta)
+
+
+def start_server(
+    port: int = 0,
+    latency: float = 0,
+    bandwidth: Optional[int] = None,
+    quota: Optional[int] = None,
+) -> Tuple[ThreadingHTTPServer, str]:
+    """Start the fake in a background thread and return it with its API endpoint."""
+    handler = type(
+        "BoundFakeDriveHandler",
+        (FakeDriveHandler,),
+        {"drive": FakeDrive(latency=latency, bandwidth=bandwidth, quota=quota)},
+    )
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="Fake Google Drive")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", type=float, default=0, help="seconds per request")
+    parser.add_argument("--bandwidth", type=int, help="bytes/s per connection")
+    parser.add_argument("--quota", type=int, help="requests/s before 403s")
+    args = parser.parse_args()
+
+    server, endpoint = start_server(args.port, args.latency, args.bandwidth, args.quota)
+    print(f"DRIVE_API_ENDPOINT={endpoint}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
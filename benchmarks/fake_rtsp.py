@@ -0,0 +1,273 @@
+"""Local RTSP cameras backed by ffmpeg test sources, for benchmarks and load tests.
+
+Each stream runs one ffmpeg encoding ``testsrc2`` in real time to RTP over UDP;
+a small RTSP server relays those packets to every client that issued PLAY,
+interleaved on the RTSP connection (``-rtsp_transport tcp``, as record.py uses).
+Clients that fall behind lose packets instead of slowing the source down.
+
+Usage (from the project root):
+
+    python -m benchmarks.fake_rtsp --streams 4 --fps 15 --size 1280x720
+"""
+import argparse
+import itertools
+import os
+import queue
+import socket
+import socketserver
+import struct
+import subprocess
+import tempfile
+import threading
+import time
+from typing import List, Optional, Tuple
+
+# Pacotes RTP aguardando envio por cliente antes de começar a descartar
+CLIENT_BACKLOG = 2048
+
+
+class TestSource:
+    """One ffmpeg test pattern encoded to RTP on a local UDP port."""
+
+    def __init__(
+        self,
+        fps: int = 15,
+        size: str = "1280x720",
+        bitrate: str = "2M",
+        gop: Optional[int] = None,
+    ):
+        self.fps = fps
+        self.rtp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.rtp.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+        self.rtp.bind(("127.0.0.1", 0))
+        self.clients: List["queue.Queue[bytes]"] = []
+        self.lock = threading.Lock()
+        self.packets = 0
+        self.dropped = 0
+
+        sdp_fd, self.sdp_path = tempfile.mkstemp(suffix=".sdp")
+        os.close(sdp_fd)
+        self.process = subprocess.Popen(
+            [
+                "ffmpeg",
+                "-loglevel",
+                "error",
+                "-re",
+                "-f",
+                "lavfi",
+                "-i",
+                f"testsrc2=size={size}:rate={fps}",
+                "-c:v",
+                "libx264",
+                "-preset",
+                "ultrafast",
+                "-tune",
+                "zerolatency",
+                "-g",
+                str(gop or fps),
+                "-b:v",
+                bitrate,
+                "-f",
+                "rtp",
+                "-sdp_file",
+                self.sdp_path,
+                f"rtp://127.0.0.1:{self.rtp.getsockname()[1]}?pkt_size=1316",
+            ],
+            stdin=subprocess.DEVNULL,
+        )
+        threading.Thread(target=self.__relay, daemon=True).start()
+
+    def __relay(self):
+        while True:
+            try:
+                packet = self.rtp.recv(65536)
+            except OSError:
+                return
+            # Canal 0 do RTSP interleaved
+            frame = b"$\x00" + struct.pack(">H", len(packet)) + packet
+            with self.lock:
+                self.packets += 1
+                for client in self.clients:
+                    try:
+                        client.put_nowait(frame)
+                    except queue.Full:
+                        self.dropped += 1
+
+    def sdp(self) -> str:
+        """SDP of the stream, rewritten for RTSP (port 0 and a track control)."""
+        deadline = time.monotonic() + 10
+        while not os.path.getsize(self.sdp_path):
+            if time.monotonic() > deadline or self.process.poll() is not None:
+                raise RuntimeError("ffmpeg test source did not start")
+            time.sleep(0.05)
+        with open(self.sdp_path) as sdp_file:
+            lines = sdp_file.read().strip().splitlines()
+
+        sdp = []
+        for line in lines:
+            if line.startswith("m=video"):
+                parts = line.split()
+                parts[1] = "0"
+                line = " ".join(parts)
+            sdp.append(line)
+        sdp.append("a=control:streamid=0")
+        return "\r\n".join(sdp) + "\r\n"
+
+    def subscribe(self) -> "queue.Queue[bytes]":
+        client = queue.Queue(maxsize=CLIENT_BACKLOG)
+        with self.lock:
+            self.clients.append(client)
+        return client
+
+    def unsubscribe(self, client: "queue.Queue[bytes]"):
+        with self.lock:
+            if client in self.clients:
+                self.clients.remove(client)
+
+    def stop(self):
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+        self.rtp.close()
+        os.remove(self.sdp_path)
+
+
+class RtspHandler(socketserver.StreamRequestHandler):
+    source: TestSource = None
+    sessions = itertools.count(1)
+
+    def handle(self):
+        self.write_lock = threading.Lock()
+        self.client: Optional["queue.Queue[bytes]"] = None
+        try:
+            while self.__handle_request():
+                pass
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            if self.client is not None:
+                self.source.unsubscribe(self.client)
+                self.client.put(b"")
+
+    def __handle_request(self) -> bool:
+        first = self.rfile.read(1)
+        if not first:
+            return False
+        if first == b"$":
+            # RTCP do cliente, ignorado
+            _, length = struct.unpack(">BH", self.rfile.read(3))
+            self.rfile.read(length)
+            return True
+
+        request_line = (first + self.rfile.readline()).decode().strip()
+        headers = {}
+        while True:
+            line = self.rfile.readline().decode().strip()
+            if not line:
+                break
+            key, _, value = line.partition(":")
+            headers[key.strip().lower()] = value.strip()
+        if headers.get("content-length"):
+            self.rfile.read(int(headers["content-length"]))
+
+        method, url, _ = request_line.split(" ", 2)
+        reply = {"CSeq": headers.get("cseq", "0")}
+        body = ""
+        status = "200 OK"
+        if method == "OPTIONS":
+            reply["Public"] = "OPTIONS, DESCRIBE, SETUP, PLAY, TEARDOWN, GET_PARAMETER"
+        elif method == "DESCRIBE":
+            body = self.source.sdp()
+            reply["Content-Base"] = url.rstrip("/") + "/"
+            reply["Content-Type"] = "application/sdp"
+        elif method == "SETUP":
+            if "TCP" not in headers.get("transport", ""):
+                status = "461 Unsupported Transport"
+            else:
+                self.session = str(next(self.sessions))
+                reply["Transport"] = "RTP/AVP/TCP;unicast;interleaved=0-1"
+                reply["Session"] = self.session
+        elif method == "PLAY":
+            reply["Session"] = headers.get("session", "")
+        elif method == "TEARDOWN":
+            self.__send(status, reply, body)
+            return False
+
+        self.__send(status, reply, body)
+        if method == "PLAY" and self.client is None:
+            self.client = self.source.subscribe()
+            threading.Thread(target=self.__stream, daemon=True).start()
+        return True
+
+    def __send(self, status: str, headers: dict, body: str = ""):
+        if body:
+            headers["Content-Length"] = str(len(body.encode()))
+        response = f"RTSP/1.0 {status}\r\n"
+        response += "".join(f"{key}: {value}\r\n" for key, value in headers.items())
+        with self.write_lock:
+            self.wfile.write((response + "\r\n" + body).encode())
+
+    def __stream(self):
+        client = self.client
+        while True:
+            frame = client.get()
+            if not frame:
+                return
+            try:
+                with self.write_lock:
+                    self.wfile.write(frame)
+            except OSError:
+                self.source.unsubscribe(client)
+                return
+
+
+class RtspServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def start_streams(
+    streams: int,
+    fps: int = 15,
+    size: str = "1280x720",
+    bitrate: str = "2M",
+    gop: Optional[int] = None,
+) -> List[Tuple[RtspServer, TestSource, str]]:
+    """Start ``streams`` cameras and return each server, its source and host:port.
+
+    Keyframes come every ``gop`` frames (one per second by default).
+    """
+    started = []
+    for _ in range(streams):
+        source = TestSource(fps=fps, size=size, bitrate=bitrate, gop=gop)
+        handler = type("BoundRtspHandler", (RtspHandler,), {"source": source})
+        server = RtspServer(("127.0.0.1", 0), handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        started.append((server, source, f"127.0.0.1:{server.server_address[1]}"))
+    return started
+
+
+def stop_streams(started: List[Tuple[RtspServer, TestSource, str]]):
+    for server, source, _ in started:
+        server.shutdown()
+        server.server_close()
+        source.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="Fake RTSP cameras")
+    parser.add_argument("--streams", type=int, default=1)
+    parser.add_argument("--fps", type=int, default=15)
+    parser.add_argument("--size", default="1280x720")
+    parser.add_argument("--bitrate", default="2M")
+    args = parser.parse_args()
+
+    started = start_streams(args.streams, args.fps, args.size, args.bitrate)
+    for _, _, address in started:
+        print(f"rtsp://user:pass@{address}/stream")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        stop_streams(started)
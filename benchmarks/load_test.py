@@ -0,0 +1,381 @@
+"""End-to-end load test: fake RTSP cameras recorded, uploaded and cleaned up.
+
+Starts N fake cameras (benchmarks.fake_rtsp) and the fake Drive
+(benchmarks.fake_drive), registers the cameras in a scratch database and runs
+the real recorder (recorder_supervisor.py, or one record.py --continuous per
+camera), queue_uploader.py and cleanup.py as child processes, as deployed.
+
+Reports segments/s, upload throughput, latency from segment close to Drive,
+CPU and RSS per process (read from /proc, so Linux only) and dropped frames.
+With --results every run is appended as one JSON line tagged with the commit,
+and compared with the last run recorded with the same parameters.
+
+Usage (from the project root):
+
+    python -m benchmarks.load_test --cameras 4 --duration 120 --segment 00:00:10 \\
+        --results benchmarks/load_test.jsonl
+"""
+import argparse
+import json
+import os
+import shutil
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from benchmarks.fake_drive import start_server
+from benchmarks.fake_rtsp import start_streams, stop_streams
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+
+
+def _proc_stat(pid: int) -> Optional[Tuple[int, float, int]]:
+    """``(ppid, cpu seconds including waited children, rss bytes)`` of a process."""
+    try:
+        with open(f"/proc/{pid}/stat") as stat_file:
+            # O nome do processo pode conter espaços, então corta após o ")"
+            fields = stat_file.read().rsplit(")", 1)[1].split()
+        with open(f"/proc/{pid}/statm") as statm_file:
+            rss_pages = int(statm_file.read().split()[1])
+    except (FileNotFoundError, ProcessLookupError, IndexError):
+        return None
+    ppid = int(fields[1])
+    cpu_ticks = sum(int(value) for value in fields[11:15])
+    return ppid, cpu_ticks / CLOCK_TICKS, rss_pages * PAGE_SIZE
+
+
+class ProcessSampler(threading.Thread):
+    """Sample CPU time and RSS of each role's process trees every ``interval``."""
+
+    def __init__(self, interval: float = 1):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.roles: Dict[str, List[int]] = {}
+        self.cpu: Dict[str, float] = {}
+        self.peak_rss: Dict[str, int] = {}
+        self.rss_samples: Dict[str, List[int]] = {}
+        self.stopped = threading.Event()
+
+    def watch(self, role: str, pid: int):
+        self.roles.setdefault(role, []).append(pid)
+
+    def sample(self):
+        stats = {}
+        children: Dict[int, List[int]] = {}
+        for entry in os.listdir("/proc"):
+            if entry.isdigit() and (stat := _proc_stat(int(entry))):
+                stats[int(entry)] = stat
+                children.setdefault(stat[0], []).append(int(entry))
+
+        for role, roots in self.roles.items():
+            pending, cpu, rss = list(roots), 0.0, 0
+            while pending:
+                pid = pending.pop()
+                if pid not in stats:
+                    continue
+                cpu += stats[pid][1]
+                rss += stats[pid][2]
+                pending.extend(children.get(pid, []))
+            if rss:
+                # Processos encerrados deixam de contar; mantém a última leitura
+                self.cpu[role] = max(cpu, self.cpu.get(role, 0))
+                self.peak_rss[role] = max(rss, self.peak_rss.get(role, 0))
+                self.rss_samples.setdefault(role, []).append(rss)
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.sample()
+
+
+def count_frames(path: str, fps: int) -> Tuple[int, int]:
+    """Video packets in ``path`` and the count its timestamp span should hold."""
+    result = subprocess.run(
+        ["ffmpeg", "-loglevel", "error", "-i", path]
+        + ["-map", "0:v:0", "-c", "copy", "-f", "framecrc", "-"],
+        capture_output=True,
+        text=True,
+    )
+    timebase, packets, first, last = 1.0, 0, None, None
+    for line in result.stdout.splitlines():
+        if line.startswith("#tb 0:"):
+            numerator, denominator = line.split(":", 1)[1].split("/")
+            timebase = int(numerator) / int(denominator)
+        elif line and not line.startswith("#"):
+            _, _, pts, duration, *_ = [field.strip() for field in line.split(",")]
+            packets += 1
+            first = int(pts) if first is None else min(first, int(pts))
+            last = max(last or 0, int(pts) + int(duration))
+    if not packets:
+        return 0, 0
+    return packets, round((last - first) * timebase * fps)
+
+
+def _percentile(values: List[float], percent: float) -> float:
+    if not values:
+        return 0
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * percent / 100), len(ordered) - 1)]
+
+
+def _commit() -> str:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+        dirty = subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+    return commit + ("-dirty" if dirty else "")
+
+
+def _spawn(role: str, args: List[str], work: str, env: dict) -> subprocess.Popen:
+    """Run a project script with ``work`` as its cwd, like /app in the container."""
+    script, *script_args = args
+    log = open(os.path.join(work, "logs", f"{role}.log"), "ab")
+    return subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, script), *script_args],
+        cwd=work,
+        env=env,
+        stdout=log,
+        stderr=log,
+    )
+
+
+def _terminate(processes: List[subprocess.Popen], timeout: float = 30):
+    for process in processes:
+        if process.poll() is None:
+            process.send_signal(signal.SIGTERM)
+    deadline = time.monotonic() + timeout
+    for process in processes:
+        try:
+            process.wait(timeout=max(deadline - time.monotonic(), 0.1))
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+
+def run(
+    cameras: int,
+    duration: float,
+    segment: str,
+    fps: int,
+    size: str,
+    bitrate: str,
+    recorder: str,
+    upload_workers: int,
+    drive_latency: float,
+    drive_bandwidth: Optional[int],
+    drain: float,
+    keep: bool,
+) -> dict:
+    work = tempfile.mkdtemp(prefix="ipcam-load-")
+    os.makedirs(os.path.join(work, "shared"))
+    os.makedirs(os.path.join(work, "logs"))
+
+    server, endpoint = start_server(latency=drive_latency, bandwidth=drive_bandwidth)
+    drive = server.RequestHandlerClass.drive
+    streams = start_streams(cameras, fps=fps, size=size, bitrate=bitrate)
+
+    env = dict(
+        os.environ,
+        DB_PATH=os.path.join(work, "shared", "db.sqlite3"),
+        DRIVE_API_ENDPOINT=endpoint,
+        GDRIVE_BASE_FOLDER_ID="root",
+        UPLOAD_WORKERS=str(upload_workers),
+        UPLOAD_IDLE_INTERVAL="0.5",
+        METRICS_FLUSH_INTERVAL="1",
+        RETENTION_INTERVAL="30",
+        PYTHONUNBUFFERED="1",
+    )
+    os.environ.update(
+        DB_PATH=env["DB_PATH"],
+        DRIVE_API_ENDPOINT=endpoint,
+        GDRIVE_BASE_FOLDER_ID="root",
+    )
+    import camera_model
+
+    for index, (_, _, address) in enumerate(streams):
+        camera_model.Camera(
+            name=f"bench{index:02d}",
+            ip=address,
+            user="bench",
+            passw="bench",
+            segment_duration=segment,
+            date_range=1,
+        ).save()
+    camera_ids = [camera.wid for camera in camera_model.list_cameras()]
+
+    sampler = ProcessSampler()
+    sampler.start()
+    for _, source, _ in streams:
+        sampler.watch("sources", source.process.pid)
+
+    started = time.monotonic()
+    started_at = time.time()
+    if recorder == "supervisor":
+        recorders = [_spawn("recorder", ["recorder_supervisor.py"], work, env)]
+    else:
+        recorders = [
+            _spawn(
+                f"recorder-{camera_id}",
+                ["record.py", "--camera", str(camera_id), "--continuous"],
+                work,
+                env,
+            )
+            for camera_id in camera_ids
+        ]
+    for process in recorders:
+        sampler.watch("recorder", process.pid)
+    uploader = _spawn("uploader", ["queue_uploader.py"], work, env)
+    sampler.watch("uploader", uploader.pid)
+    cleaner = _spawn("cleanup", ["cleanup.py"], work, env)
+    sampler.watch("cleanup", cleaner.pid)
+    time.sleep(duration)
+    sampler.sample()
+    _terminate(recorders)
+    recording_seconds = time.monotonic() - started
+
+    deadline = time.monotonic() + drain
+    while camera_model.queue_depth() and time.monotonic() < deadline:
+        time.sleep(1)
+    sampler.sample()
+    _terminate([uploader, cleaner])
+    elapsed = time.monotonic() - started
+    sampler.stopped.set()
+
+    recordings = camera_model.list_recordings()
+    latencies = []
+    frames = expected_frames = 0
+    for recording in recordings:
+        closed_at = recording.start_time.timestamp() + recording.duration
+        if recording.drive_id in drive.completed:
+            latencies.append(drive.completed[recording.drive_id] - closed_at)
+
+        path = recording.path
+        if not os.path.isabs(path):
+            path = os.path.join(work, path)
+        if not os.path.exists(path) and recording.drive_id in drive.contents:
+            path = os.path.join(work, "drive_copy.mp4")
+            with open(path, "wb") as copy:
+                copy.write(drive.contents[recording.drive_id])
+        if os.path.exists(path):
+            counted, expected = count_frames(path, fps)
+            frames += counted
+            expected_frames += expected
+
+    uploaded_bytes = sum(len(content) for content in drive.contents.values())
+    upload_window = max(drive.completed.values(), default=started_at) - started_at
+
+    stop_streams(streams)
+    server.shutdown()
+    if keep:
+        print(f"Arquivos e logs mantidos em {work}")
+    else:
+        shutil.rmtree(work, ignore_errors=True)
+
+    results = {
+        "segments": len(recordings),
+        "segments_per_s": len(recordings) / recording_seconds,
+        "uploaded": len(latencies),
+        "queue_left": len(recordings) - len(latencies),
+        "upload_mib_per_s": (
+            uploaded_bytes / upload_window / 1024**2 if upload_window else 0
+        ),
+        "latency_p50_s": _percentile(latencies, 50),
+        "latency_p95_s": _percentile(latencies, 95),
+        "latency_max_s": max(latencies, default=0),
+        "frames": frames,
+        "dropped_frames": max(expected_frames - frames, 0),
+        "dropped_frames_pct": (
+            max(expected_frames - frames, 0) / expected_frames * 100
+            if expected_frames
+            else 0
+        ),
+        "source_packets_dropped": sum(source.dropped for _, source, _ in streams),
+        "elapsed_s": elapsed,
+    }
+    for role in sampler.cpu:
+        results[f"{role}_cpu_pct"] = sampler.cpu[role] / elapsed * 100
+        results[f"{role}_rss_mib"] = (
+            statistics.mean(sampler.rss_samples[role]) / 1024**2
+        )
+        results[f"{role}_peak_rss_mib"] = sampler.peak_rss[role] / 1024**2
+    return results
+
+
+def compare(previous: dict, results: dict):
+    print(f"\nComparado com {previous['commit']} ({previous['timestamp']}):")
+    for key, value in results.items():
+        before = previous["results"].get(key)
+        if before is None:
+            continue
+        change = f"{(value - before) / before * 100:+.1f}%" if before else "n/a"
+        print(f"  {key:28} {before:12.2f} -> {value:12.2f}  {change}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="End-to-end load test")
+    parser.add_argument("--cameras", type=int, default=4)
+    parser.add_argument("--duration", type=float, default=120, help="seconds")
+    parser.add_argument("--segment", default="00:00:10", help="segment duration")
+    parser.add_argument("--fps", type=int, default=15)
+    parser.add_argument("--size", default="1280x720")
+    parser.add_argument("--bitrate", default="2M", help="camera video bitrate")
+    parser.add_argument(
+        "--recorder", choices=("supervisor", "record"), default="supervisor"
+    )
+    parser.add_argument("--upload-workers", type=int, default=4)
+    parser.add_argument("--drive-latency", type=float, default=0.02)
+    parser.add_argument("--drive-bandwidth", type=int, help="bytes/s per connection")
+    parser.add_argument(
+        "--drain", type=float, default=60, help="seconds to wait for the queue"
+    )
+    parser.add_argument("--results", help="append the run to this JSON lines file")
+    parser.add_argument("--keep", help="keep recordings and logs", action="store_true")
+    args = parser.parse_args()
+
+    params = {
+        key: value
+        for key, value in vars(args).items()
+        if key not in ("results", "keep")
+    }
+    results = run(**params, keep=args.keep)
+
+    print(" ".join(f"{key}={value}" for key, value in params.items()))
+    for key, value in results.items():
+        print(f"  {key:28} {value:12.2f}")
+
+    if args.results:
+        previous = None
+        if os.path.exists(args.results):
+            with open(args.results) as results_file:
+                for line in results_file:
+                    entry = json.loads(line)
+                    if entry["params"] == params:
+                        previous = entry
+        entry = {
+            "commit": _commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "params": params,
+            "results": results,
+        }
+        with open(args.results, "a") as results_file:
+            results_file.write(json.dumps(entry) + "\n")
+        if previous:
+            compare(previous, results)
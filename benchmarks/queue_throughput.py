@@ -0,0 +1,91 @@
+"""Microbenchmark for upload_queue put/claim throughput under concurrent writers.
+
+Usage (from the project root):
+
+    python -m benchmarks.queue_throughput --writers 16 --rows 500 --claimers 4
+"""
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+
+
+def _writer(db_path: str, camera_id: int, rows: int, batch: int):
+    os.environ["DB_PATH"] = db_path
+    import camera_model
+
+    items = [
+        camera_model.UploadQueue(
+            filename=f"cam{camera_id}_{index}.mp4", camera_id=camera_id
+        )
+        for index in range(rows)
+    ]
+    if batch > 1:
+        for start in range(0, rows, batch):
+            camera_model.put_many(items[start : start + batch])
+    else:
+        for item in items:
+            item.put()
+
+
+def _claimer(db_path: str, total: int, counter, batch: int):
+    os.environ["DB_PATH"] = db_path
+    import camera_model
+
+    while counter.value < total:
+        claimed = camera_model.claim(batch)
+        if not claimed:
+            time.sleep(0.001)
+            continue
+        for item in claimed:
+            item.ack()
+        with counter.get_lock():
+            counter.value += len(claimed)
+
+
+def run(writers: int, rows: int, claimers: int, batch: int):
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.sqlite3")
+        os.environ["DB_PATH"] = db_path
+        import camera_model
+
+        camera_model.DB_PATH = db_path
+        camera_model.init_db()
+
+        total = writers * rows
+        counter = multiprocessing.Value("i", 0)
+
+        started = time.perf_counter()
+        producers = [
+            multiprocessing.Process(target=_writer, args=(db_path, cam, rows, batch))
+            for cam in range(writers)
+        ]
+        consumers = [
+            multiprocessing.Process(target=_claimer, args=(db_path, total, counter, 1))
+            for _ in range(claimers)
+        ]
+        for process in producers + consumers:
+            process.start()
+        for process in producers:
+            process.join()
+        put_elapsed = time.perf_counter() - started
+
+        for process in consumers:
+            process.join()
+        total_elapsed = time.perf_counter() - started
+
+        print(f"writers={writers} rows/writer={rows} claimers={claimers} batch={batch}")
+        print(f"put:   {total / put_elapsed:10.0f} rows/s ({put_elapsed:.2f}s)")
+        print(f"claim: {total / total_elapsed:10.0f} rows/s ({total_elapsed:.2f}s)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="Queue throughput benchmark")
+    parser.add_argument("--writers", type=int, default=8)
+    parser.add_argument("--rows", type=int, default=500)
+    parser.add_argument("--claimers", type=int, default=4)
+    parser.add_argument("--batch", type=int, default=1, help="rows per put_many call")
+    args = parser.parse_args()
+
+    run(args.writers, args.rows, args.claimers, args.batch)
@@ -0,0 +1,158 @@
+"""Recorder cold start: import cost of record.py and time to the first frame.
+
+Profiles ``import record`` with ``python -X importtime`` and lists the heaviest
+imports it pulls in, then launches ``record.py --continuous`` against a fake RTSP
+camera (benchmarks.fake_rtsp) and measures the time from spawning the process
+to ffmpeg creating the segment file, which happens once the first frame
+arrives. The same ffmpeg command launched directly is measured as the floor,
+so the difference is what the Python side adds to every recorder start.
+
+Usage (from the project root):
+
+    python -m benchmarks.recorder_startup --runs 5
+"""
+import argparse
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Tuple
+
+from benchmarks.fake_drive import start_server
+from benchmarks.fake_rtsp import start_streams, stop_streams
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def import_profile(env: dict, module: str = "record") -> Tuple[float, List[tuple]]:
+    """Seconds to import ``module`` and its heaviest direct dependencies."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+
+    total = 0.0
+    dependencies = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        level = (len(name) - len(name.lstrip()) - 1) // 2
+        seconds = int(cumulative) / 1e6
+        if level == 0 and name.strip() == module:
+            total = seconds
+        elif level == 1:
+            dependencies.append((seconds, name.strip()))
+    return total, sorted(dependencies, reverse=True)
+
+
+def wait_first_frame(process: subprocess.Popen, output_dir: str) -> float:
+    """Seconds until a segment file appears in ``output_dir``."""
+    started = time.perf_counter()
+    while not os.listdir(output_dir):
+        if process.poll() is not None:
+            raise RuntimeError(f"processo encerrado com código {process.returncode}")
+        time.sleep(0.002)
+    return time.perf_counter() - started
+
+
+def measure(runs: int, fps: int) -> Dict[str, List[float]]:
+    work = tempfile.mkdtemp(prefix="ipcam-startup-")
+    server, endpoint = start_server()
+    # Keyframe a cada frame: o ffmpeg não espera o próximo GOP para começar
+    streams = start_streams(1, fps=fps, size="640x360", gop=1)
+    env = dict(
+        os.environ,
+        DB_PATH=os.path.join(work, "shared", "db.sqlite3"),
+        DRIVE_API_ENDPOINT=endpoint,
+        GDRIVE_BASE_FOLDER_ID="root",
+    )
+    os.makedirs(os.path.join(work, "shared"))
+    os.environ.update(
+        DB_PATH=env["DB_PATH"],
+        DRIVE_API_ENDPOINT=endpoint,
+        GDRIVE_BASE_FOLDER_ID="root",
+    )
+    import camera_model
+    import record
+
+    # Os caminhos do record.py são relativos ao diretório de trabalho
+    os.chdir(work)
+    camera = camera_model.Camera(
+        name="startup",
+        ip=streams[0][2],
+        user="bench",
+        passw="bench",
+        segment_duration="00:00:01",
+        date_range=1,
+    )
+    camera.save()
+    ffmpeg_cmd, output_dir = record.continuous_recording_cmd(
+        record.get_rtsp_url(camera), camera
+    )
+    # Espera a fonte começar a gerar pacotes antes da primeira medição
+    time.sleep(1)
+
+    timings: Dict[str, List[float]] = {"ffmpeg": [], "record.py": [], "import": []}
+    try:
+        for _ in range(runs):
+            for name, cmd in (
+                ("ffmpeg", ffmpeg_cmd),
+                (
+                    "record.py",
+                    [sys.executable, os.path.join(ROOT, "record.py")]
+                    + ["--camera", str(camera.wid), "--continuous"],
+                ),
+            ):
+                for file in os.listdir(output_dir):
+                    os.remove(os.path.join(output_dir, file))
+                process = subprocess.Popen(
+                    cmd,
+                    cwd=work,
+                    env=env,
+                    stdout=subprocess.DEVNULL,
+                    stderr=subprocess.DEVNULL,
+                )
+                try:
+                    timings[name].append(wait_first_frame(process, output_dir))
+                finally:
+                    process.terminate()
+                    process.wait()
+            timings["import"].append(import_profile(env)[0])
+    finally:
+        stop_streams(streams)
+        server.shutdown()
+        os.chdir(ROOT)
+        shutil.rmtree(work, ignore_errors=True)
+
+    return timings
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="Recorder startup benchmark")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--fps", type=int, default=15)
+    parser.add_argument("--top", type=int, default=10, help="imports to list")
+    args = parser.parse_args()
+
+    total, dependencies = import_profile(dict(os.environ))
+    print(f"import record: {total * 1000:.1f} ms")
+    for seconds, name in dependencies[: args.top]:
+        print(f"  {seconds * 1000:8.1f} ms  {name}")
+
+    timings = measure(args.runs, args.fps)
+    print(f"\nprimeiro frame (mediana de {args.runs} execuções):")
+    for name, values in timings.items():
+        print(f"  {name:10} {statistics.median(values) * 1000:8.1f} ms")
+    overhead = statistics.median(timings["record.py"]) - statistics.median(
+        timings["ffmpeg"]
+    )
+    print(f"  {'overhead':10} {overhead * 1000:8.1f} ms")
@@ -1,9 +1,25 @@
+import os
 import sqlite3
-from typing import List, Optional
-import drive_client
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Set
+import metrics
+import sqlite_store
 from pydantic import BaseModel
 
-DB_PATH = "shared/db.sqlite3"
+DB_PATH = os.environ.get("DB_PATH", "shared/db.sqlite3")
+# Incrementar sempre que init_db ganhar uma nova migração
+SCHEMA_VERSION = 10
+
+QUEUE_PENDING = "pending"
+QUEUE_LEASED = "leased"
+QUEUE_DEAD = "dead"
+
+VISIBILITY_TIMEOUT = int(os.environ.get("UPLOAD_VISIBILITY_TIMEOUT", 600))
+MAX_ATTEMPTS = int(os.environ.get("UPLOAD_MAX_ATTEMPTS", 8))
+BACKOFF_BASE = int(os.environ.get("UPLOAD_BACKOFF_BASE", 30))
+BACKOFF_MAX = int(os.environ.get("UPLOAD_BACKOFF_MAX", 3600))
 
 
 class UploadQueue(BaseModel):
@@ -12,39 +28,620 @@ class UploadQueue(BaseModel):
     camera_id: int
     to_compress: bool = False
     to_exclude: bool = True
+    status: str = QUEUE_PENDING
+    available_at: float = 0
+    attempts: int = 0
+    last_error: Optional[str] = None
+    upload_session_uri: Optional[str] = None
+    upload_offset: int = 0
+    enqueued_at: Optional[float] = None
 
     def put(self):
-        with get_connection() as conn:
+        with write_transaction("put") as conn:
             conn.execute(
                 """
-                INSERT INTO upload_queue (filename, camera_id, to_compress, to_exclude)
-                VALUES (?, ?, ?, ?)
+                INSERT INTO upload_queue (
+                    filename, camera_id, to_compress, to_exclude, enqueued_at
+                )
+                VALUES (?, ?, ?, ?, ?)
             """,
                 (
                     self.filename,
                     self.camera_id,
                     self.to_compress,
                     self.to_exclude,
+                    time.time(),
                 ),
             )
-            
-    def acknowledge(self):
+
+    def ack(self):
         if not self.wid:
             raise sqlite3.IntegrityError("Set Object ID Before.")
 
-        with get_connection() as conn:
+        with write_transaction("ack") as conn:
             conn.execute("DELETE FROM upload_queue where id=?", (self.wid,))
 
+    def nack(self, error: Optional[str] = None, reset_session: bool = False):
+        """Return the row to the queue with exponential backoff.
+
+        Rows that already used ``MAX_ATTEMPTS`` deliveries go to the dead-letter
+        state instead. ``reset_session`` drops the resumable session, so the
+        retry uploads the file again from the start.
+        """
+        if not self.wid:
+            raise sqlite3.IntegrityError("Set Object ID Before.")
+
+        if self.attempts >= MAX_ATTEMPTS:
+            self.status = QUEUE_DEAD
+            self.available_at = time.time()
+        else:
+            delay = min(BACKOFF_BASE * 2 ** max(self.attempts - 1, 0), BACKOFF_MAX)
+            self.status = QUEUE_PENDING
+            self.available_at = time.time() + delay
+
+        self.last_error = error
+        if reset_session:
+            self.upload_session_uri = None
+            self.upload_offset = 0
+        with write_transaction("nack") as conn:
+            conn.execute(
+                """
+                UPDATE upload_queue
+                SET status=?, available_at=?, last_error=?, upload_session_uri=?,
+                    upload_offset=?
+                WHERE id=?
+            """,
+                (
+                    self.status,
+                    self.available_at,
+                    self.last_error,
+                    self.upload_session_uri,
+                    self.upload_offset,
+                    self.wid,
+                ),
+            )
+
+    def save_compress(self, to_compress: bool):
+        """Persist which variant of the file the row uploads.
 
+        A retry resumes the stored session, so it must send the same variant.
+        """
+        if not self.wid:
+            raise sqlite3.IntegrityError("Set Object ID Before.")
+
+        self.to_compress = to_compress
+        with write_transaction("save_compress") as conn:
+            conn.execute(
+                "UPDATE upload_queue SET to_compress=? WHERE id=?",
+                (to_compress, self.wid),
+            )
+
+    def save_upload_progress(
+        self,
+        session_uri: str,
+        offset: int,
+        visibility_timeout: int = VISIBILITY_TIMEOUT,
+    ):
+        """Persist the resumable session and renew the lease while a file uploads."""
+        if not self.wid:
+            raise sqlite3.IntegrityError("Set Object ID Before.")
+
+        self.upload_session_uri = session_uri
+        self.upload_offset = offset
+        self.available_at = time.time() + visibility_timeout
+        with write_transaction("save_upload_progress") as conn:
+            conn.execute(
+                """
+                UPDATE upload_queue
+                SET upload_session_uri=?, upload_offset=?, available_at=?
+                WHERE id=? AND status=?
+            """,
+                (session_uri, offset, self.available_at, self.wid, QUEUE_LEASED),
+            )
+
+
+def __reap_expired_leases(conn: sqlite3.Connection, now: float):
+    conn.execute(
+        """
+        UPDATE upload_queue
+        SET status=CASE WHEN attempts >= ? THEN ? ELSE ? END,
+            last_error=COALESCE(last_error, 'lease expired')
+        WHERE status=? AND available_at<=?
+    """,
+        (MAX_ATTEMPTS, QUEUE_DEAD, QUEUE_PENDING, QUEUE_LEASED, now),
+    )
+
+
+def claim(
+    n: int = 1,
+    visibility_timeout: int = VISIBILITY_TIMEOUT,
+    max_per_camera: Optional[int] = None,
+) -> List[UploadQueue]:
+    """Lease up to ``n`` ready rows, hiding them for ``visibility_timeout`` seconds.
+
+    Leases that expire (e.g. the uploader was killed) are returned to the queue
+    on the next claim. ``max_per_camera`` caps the rows leased per camera,
+    counting both the leases already held and the rows taken by this call.
+    """
+    now = time.time()
+    params = [QUEUE_LEASED, now + visibility_timeout, QUEUE_PENDING, now]
+    if max_per_camera is None:
+        ready = """
+                SELECT id FROM upload_queue
+                WHERE status=? AND available_at<=?
+                ORDER BY available_at, id
+                LIMIT ?"""
+    else:
+        # Posição de cada linha pronta na fila da sua câmera, somada aos leases
+        ready = """
+                SELECT id FROM (
+                    SELECT id, camera_id, available_at, ROW_NUMBER() OVER (
+                        PARTITION BY camera_id ORDER BY available_at, id
+                    ) AS position
+                    FROM upload_queue
+                    WHERE status=? AND available_at<=?
+                ) AS ready
+                WHERE position + (
+                    SELECT COUNT(*) FROM upload_queue AS leased
+                    WHERE leased.camera_id=ready.camera_id AND leased.status=?
+                ) <= ?
+                ORDER BY available_at, id
+                LIMIT ?"""
+        params.extend([QUEUE_LEASED, max_per_camera])
+    params.append(n)
+
+    with write_transaction("claim") as conn:
+        __reap_expired_leases(conn, now)
+        rows = conn.execute(
+            f"""
+            UPDATE upload_queue SET status=?, available_at=?, attempts=attempts + 1
+            WHERE id IN ({ready}
+            )
+            RETURNING *
+        """,
+            params,
+        ).fetchall()
 
-def get_upload_queue(ack: bool = True) -> List[UploadQueue]:
+    for row in rows:
+        metrics.observe("ipcam_queue_wait_seconds", now - (row["enqueued_at"] or now))
+    return [UploadQueue(wid=row["id"], **row) for row in rows]
+
+
+def put_many(items: Iterable[UploadQueue]):
+    """Enqueue several rows in a single transaction."""
+    now = time.time()
+    with write_transaction("put_many") as conn:
+        conn.executemany(
+            """
+            INSERT INTO upload_queue (
+                filename, camera_id, to_compress, to_exclude, enqueued_at
+            )
+            VALUES (?, ?, ?, ?, ?)
+        """,
+            [
+                (
+                    item.filename,
+                    item.camera_id,
+                    item.to_compress,
+                    item.to_exclude,
+                    now,
+                )
+                for item in items
+            ],
+        )
+
+
+def get_dead_letters() -> List[UploadQueue]:
+    with get_connection() as conn:
+        cursor = conn.execute(
+            "SELECT * FROM upload_queue WHERE status=? ORDER BY id", (QUEUE_DEAD,)
+        )
+        return [UploadQueue(wid=row["id"], **row) for row in cursor.fetchall()]
+
+
+def requeue_dead_letters() -> int:
+    """Give every dead-lettered row a new set of attempts; returns how many.
+
+    Their recordings go back from failed to recorded.
+    """
+    with write_transaction("requeue") as conn:
+        rows = conn.execute(
+            """
+            UPDATE upload_queue
+            SET status=?, available_at=?, attempts=0, last_error=NULL
+            WHERE status=?
+            RETURNING filename
+        """,
+            (QUEUE_PENDING, time.time(), QUEUE_DEAD),
+        ).fetchall()
+        conn.executemany(
+            "UPDATE recordings SET state=? WHERE path=? AND state=?",
+            [(RECORDING_RECORDED, row["filename"], RECORDING_FAILED) for row in rows],
+        )
+    return len(rows)
+
+
+def queue_stats() -> Dict[str, float]:
+    """Rows per status and age in seconds of the oldest row still to upload."""
+    now = time.time()
     with get_connection() as conn:
-        cursor = conn.execute("SELECT * FROM upload_queue")
-        rows = [UploadQueue(wid=row["id"], **row) for row in cursor.fetchall()]
-        if ack:
-            cursor.execute("DELETE FROM upload_queue")
+        stats = {status: 0 for status in (QUEUE_PENDING, QUEUE_LEASED, QUEUE_DEAD)}
+        for row in conn.execute(
+            "SELECT status, COUNT(*) AS total FROM upload_queue GROUP BY status"
+        ):
+            stats[row["status"]] = row["total"]
+        oldest = conn.execute(
+            "SELECT MIN(enqueued_at) FROM upload_queue WHERE status IN (?, ?)",
+            (QUEUE_PENDING, QUEUE_LEASED),
+        ).fetchone()[0]
+        stats["oldest_age"] = now - oldest if oldest else 0
+        return stats
+
+
+def queue_depth() -> int:
+    """Rows still to be uploaded (pending or leased)."""
+    with get_connection() as conn:
+        return conn.execute(
+            "SELECT COUNT(*) FROM upload_queue WHERE status IN (?, ?)",
+            (QUEUE_PENDING, QUEUE_LEASED),
+        ).fetchone()[0]
+
+
+def queued_filenames(camera_id: int) -> Set[str]:
+    """Files of the camera that have a row in the upload queue, in any status."""
+    with get_connection() as conn:
+        cursor = conn.execute(
+            "SELECT filename FROM upload_queue WHERE camera_id=?", (camera_id,)
+        )
+        return {row["filename"] for row in cursor}
+
+
+RECORDING_RECORDED = "recorded"
+RECORDING_UPLOADED = "uploaded"
+RECORDING_FAILED = "failed"
+# Descartada localmente pela política de backpressure antes do upload
+RECORDING_DROPPED = "dropped"
+# Sem movimento: só a miniatura foi mantida, o vídeo não foi enviado
+RECORDING_SKIPPED = "skipped"
+
+# O que fazer com segmentos abaixo do limiar de movimento da câmera
+MOTION_ORIGINAL = "original"
+MOTION_COMPRESS = "compress"
+MOTION_THUMBNAIL = "thumbnail"
+# Percentual de pixels alterados abaixo do qual o segmento é considerado parado
+MOTION_THRESHOLD = float(os.environ.get("MOTION_THRESHOLD", 0.5))
+
+
+class Recording(BaseModel):
+    wid: Optional[int] = None
+    camera_id: int
+    path: str
+    start_time: datetime
+    duration: float = 0
+    size: int = 0
+    thumbnail_path: Optional[str] = None
+    # Miniatura pequena até entrar no sprite da hora, que guarda sua posição
+    thumbnail_small_path: Optional[str] = None
+    sprite_path: Optional[str] = None
+    sprite_index: Optional[int] = None
+    compressed_path: Optional[str] = None
+    preview_path: Optional[str] = None
+    drive_id: Optional[str] = None
+    state: str = RECORDING_RECORDED
+    local: bool = True
+    motion_score: Optional[float] = None
+    # Manifesto do arquivo enviado (original ou cópia comprimida)
+    md5: Optional[str] = None
+    uploaded_size: Optional[int] = None
+    # Quando o md5Checksum do Drive confirmou o conteúdo enviado
+    verified_at: Optional[float] = None
+
+    def save(self):
+        with get_connection() as conn:
+            cursor = conn.execute(
+                """
+                INSERT INTO recordings (
+                    camera_id, path, start_time, duration, size, state, local,
+                    updated_at
+                )
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (path) DO UPDATE SET
+                    start_time=excluded.start_time,
+                    duration=excluded.duration,
+                    size=excluded.size,
+                    state=excluded.state,
+                    local=excluded.local,
+                    drive_id=NULL,
+                    motion_score=NULL,
+                    md5=NULL,
+                    uploaded_size=NULL,
+                    verified_at=NULL,
+                    thumbnail_small_path=NULL,
+                    sprite_path=NULL,
+                    sprite_index=NULL,
+                    updated_at=excluded.updated_at
+                RETURNING id
+            """,
+                (
+                    self.camera_id,
+                    self.path,
+                    self.start_time.isoformat(sep=" "),
+                    self.duration,
+                    self.size,
+                    self.state,
+                    self.local,
+                    time.time(),
+                ),
+            )
+            self.wid = cursor.fetchall()[0]["id"]
+
 
-        return rows
+RECORDING_UPDATABLE = {
+    "size",
+    "thumbnail_path",
+    "thumbnail_small_path",
+    "sprite_path",
+    "sprite_index",
+    "compressed_path",
+    "preview_path",
+    "drive_id",
+    "state",
+    "local",
+    "motion_score",
+    "md5",
+    "uploaded_size",
+    "verified_at",
+}
+
+
+def update_recording(path: str, **fields):
+    """Update catalog columns of the recording stored at ``path``."""
+    unknown = set(fields) - RECORDING_UPDATABLE
+    if unknown:
+        raise ValueError(f"Campos inválidos para recordings: {unknown}")
+    if not fields:
+        return
+
+    assignments = ", ".join(f"{column}=?" for column in fields)
+    with get_connection() as conn:
+        conn.execute(
+            f"UPDATE recordings SET {assignments}, updated_at=? WHERE path=?",
+            (*fields.values(), time.time(), path),
+        )
+
+
+def get_recording(path: str) -> Optional[Recording]:
+    with get_connection() as conn:
+        row = conn.execute("SELECT * FROM recordings WHERE path=?", (path,)).fetchone()
+        return Recording(wid=row["id"], **row) if row else None
+
+
+def delete_recording(path: str):
+    """Drop a recording from the catalog along with its queue entries not in flight."""
+    with get_connection() as conn:
+        conn.execute("DELETE FROM recordings WHERE path=?", (path,))
+    delete_queued_uploads(path)
+
+
+def delete_queued_uploads(path: str):
+    """Remove the queue rows of ``path`` that are not being uploaded right now."""
+    with get_connection() as conn:
+        conn.execute(
+            "DELETE FROM upload_queue WHERE filename=? AND status!=?",
+            (path, QUEUE_LEASED),
+        )
+
+
+def __recording_filters(
+    camera_id: Optional[int],
+    start: Optional[datetime],
+    end: Optional[datetime],
+    state: Optional[str],
+    local: Optional[bool],
+    with_thumbnail: bool,
+    with_variants: bool = False,
+    min_motion: Optional[float] = None,
+    max_motion: Optional[float] = None,
+    verified: Optional[bool] = None,
+    exclude_in_flight: bool = False,
+):
+    clauses, params = [], []
+    if camera_id is not None:
+        clauses.append("camera_id=?")
+        params.append(camera_id)
+    if start is not None:
+        clauses.append("start_time>=?")
+        params.append(start.isoformat(sep=" "))
+    if end is not None:
+        clauses.append("start_time<?")
+        params.append(end.isoformat(sep=" "))
+    if state is not None:
+        clauses.append("state=?")
+        params.append(state)
+    if local is not None:
+        clauses.append("local=?")
+        params.append(local)
+    if with_thumbnail:
+        clauses.append("(thumbnail_path IS NOT NULL OR sprite_path IS NOT NULL)")
+    if with_variants:
+        clauses.append(
+            "(thumbnail_path IS NOT NULL OR thumbnail_small_path IS NOT NULL"
+            " OR compressed_path IS NOT NULL OR preview_path IS NOT NULL)"
+        )
+    if min_motion is not None:
+        clauses.append("motion_score>=?")
+        params.append(min_motion)
+    if max_motion is not None:
+        clauses.append("motion_score<?")
+        params.append(max_motion)
+    if verified is not None:
+        clauses.append(f"verified_at IS {'NOT ' if verified else ''}NULL")
+    if exclude_in_flight:
+        clauses.append(
+            "NOT EXISTS (SELECT 1 FROM upload_queue"
+            " WHERE upload_queue.filename = recordings.path AND upload_queue.status=?)"
+        )
+        params.append(QUEUE_LEASED)
+
+    return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+
+def list_recordings(
+    camera_id: Optional[int] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    state: Optional[str] = None,
+    local: Optional[bool] = None,
+    with_thumbnail: bool = False,
+    with_variants: bool = False,
+    min_motion: Optional[float] = None,
+    max_motion: Optional[float] = None,
+    verified: Optional[bool] = None,
+    exclude_in_flight: bool = False,
+    limit: Optional[int] = None,
+    offset: int = 0,
+    descending: bool = False,
+) -> List[Recording]:
+    """Indexed lookup of catalog rows, ordered by start time.
+
+    ``exclude_in_flight`` leaves out recordings with an upload lease held.
+    """
+    where, params = __recording_filters(
+        camera_id,
+        start,
+        end,
+        state,
+        local,
+        with_thumbnail,
+        with_variants,
+        min_motion,
+        max_motion,
+        verified,
+        exclude_in_flight,
+    )
+    query = f"SELECT * FROM recordings{where} ORDER BY start_time"
+    if descending:
+        query += " DESC"
+    if limit is not None:
+        query += " LIMIT ? OFFSET ?"
+        params += [limit, offset]
+
+    with get_connection() as conn:
+        cursor = conn.execute(query, params)
+        return [Recording(wid=row["id"], **row) for row in cursor.fetchall()]
+
+
+def count_recordings(
+    camera_id: Optional[int] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    state: Optional[str] = None,
+    local: Optional[bool] = None,
+    with_thumbnail: bool = False,
+    with_variants: bool = False,
+    min_motion: Optional[float] = None,
+    max_motion: Optional[float] = None,
+    verified: Optional[bool] = None,
+    exclude_in_flight: bool = False,
+) -> int:
+    where, params = __recording_filters(
+        camera_id,
+        start,
+        end,
+        state,
+        local,
+        with_thumbnail,
+        with_variants,
+        min_motion,
+        max_motion,
+        verified,
+        exclude_in_flight,
+    )
+    with get_connection() as conn:
+        cursor = conn.execute(f"SELECT COUNT(*) FROM recordings{where}", params)
+        return cursor.fetchone()[0]
+
+
+def backlog_bytes() -> int:
+    """Bytes of local originals that have not reached Drive yet."""
+    with get_connection() as conn:
+        return conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM recordings WHERE local=1 AND state=?",
+            (RECORDING_RECORDED,),
+        ).fetchone()[0]
+
+
+def list_spill_candidates(max_priority: int, limit: int) -> List[Recording]:
+    """Oldest local recordings not uploaded yet of cameras up to ``max_priority``.
+
+    Recordings with an upload in flight are left out.
+    """
+    with get_connection() as conn:
+        cursor = conn.execute(
+            """
+            SELECT recordings.* FROM recordings
+            JOIN cameras ON cameras.id = recordings.camera_id
+            WHERE recordings.local=1 AND recordings.state=? AND cameras.priority<=?
+                AND NOT EXISTS (
+                    SELECT 1 FROM upload_queue
+                    WHERE upload_queue.filename = recordings.path
+                        AND upload_queue.status=?
+                )
+            ORDER BY recordings.start_time
+            LIMIT ?
+        """,
+            (RECORDING_RECORDED, max_priority, QUEUE_LEASED, limit),
+        )
+        return [Recording(wid=row["id"], **row) for row in cursor.fetchall()]
+
+
+def list_sprite_candidates(
+    camera_id: int, end: datetime, limit: int
+) -> List[Recording]:
+    """Recordings started before ``end`` whose small thumbnail is not in a sprite."""
+    with get_connection() as conn:
+        cursor = conn.execute(
+            """
+            SELECT * FROM recordings
+            WHERE camera_id=? AND start_time<?
+                AND thumbnail_small_path IS NOT NULL AND sprite_path IS NULL
+            ORDER BY start_time
+            LIMIT ?
+        """,
+            (camera_id, end.isoformat(sep=" "), limit),
+        )
+        return [Recording(wid=row["id"], **row) for row in cursor.fetchall()]
+
+
+def assign_sprite(sprite_path: str, paths: List[str]):
+    """Point ``paths``, in tile order, at their tiles in ``sprite_path``."""
+    now = time.time()
+    with get_connection() as conn:
+        conn.executemany(
+            """
+            UPDATE recordings
+            SET sprite_path=?, sprite_index=?, thumbnail_small_path=NULL, updated_at=?
+            WHERE path=?
+        """,
+            [(sprite_path, index, now, path) for index, path in enumerate(paths)],
+        )
+
+
+def get_backpressure_policies() -> Dict[str, bool]:
+    with get_connection() as conn:
+        cursor = conn.execute("SELECT policy, active FROM backpressure")
+        return {row["policy"]: bool(row["active"]) for row in cursor.fetchall()}
+
+
+def set_backpressure_policy(policy: str, active: bool, reason: Optional[str] = None):
+    with get_connection() as conn:
+        conn.execute(
+            """
+            INSERT OR REPLACE INTO backpressure (policy, active, reason, updated_at)
+            VALUES (?, ?, ?, ?)
+        """,
+            (policy, active, reason, time.time()),
+        )
 
 
 class Camera(BaseModel):
@@ -55,6 +652,11 @@ class Camera(BaseModel):
     passw: str
     segment_duration: str = "00:00:30"
     date_range: int
+    # Câmeras com prioridade baixa podem ter gravações descartadas sob pressão
+    priority: int = 1
+    # Segmentos parados (abaixo de motion_threshold) seguem motion_policy
+    motion_policy: str = MOTION_ORIGINAL
+    motion_threshold: float = MOTION_THRESHOLD
     uri: Optional[str] = None
     recording: bool = False
 
@@ -66,8 +668,11 @@ class Camera(BaseModel):
             cursor = conn.cursor()
             cursor.execute(
                 """
-                INSERT INTO cameras (name, ip, user, passw, segment_duration, date_range)
-                VALUES (?, ?, ?, ?, ?, ?)
+                INSERT INTO cameras (
+                    name, ip, user, passw, segment_duration, date_range, priority,
+                    motion_policy, motion_threshold
+                )
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
             """,
                 (
                     self.name,
@@ -76,18 +681,27 @@ class Camera(BaseModel):
                     self.passw,
                     self.segment_duration,
                     self.date_range,
+                    self.priority,
+                    self.motion_policy,
+                    self.motion_threshold,
                 ),
             )
             self.wid = cursor.lastrowid
-            camera_uri = drive_client.create_camera_path(self.name)
-            self.set_uri(camera_uri, cursor=cursor)
+
+        # Importado aqui para que os gravadores não carreguem o cliente do Drive
+        import drive_client
+
+        # Fora da transação para não segurar o lock do banco durante a chamada ao Drive
+        camera_uri = drive_client.create_camera_path(self.name)
+        self.set_uri(camera_uri)
 
     def edit(self):
         with get_connection() as conn:
             conn.execute(
                 """
                 UPDATE cameras
-                SET name=?, ip=?, user=?, passw=?, segment_duration=?, date_range=?
+                SET name=?, ip=?, user=?, passw=?, segment_duration=?, date_range=?,
+                    priority=?, motion_policy=?, motion_threshold=?
                 WHERE id=?
             """,
                 (
@@ -97,6 +711,9 @@ class Camera(BaseModel):
                     self.passw,
                     self.segment_duration,
                     self.date_range,
+                    self.priority,
+                    self.motion_policy,
+                    self.motion_threshold,
                     self.wid,
                 ),
             )
@@ -128,10 +745,35 @@ class Camera(BaseModel):
             )
 
 
-def get_connection():
-    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
-    conn.row_factory = sqlite3.Row
-    return conn
+@contextmanager
+def write_transaction(operation: str):
+    """Transaction that takes the write lock up front and measures the wait for it.
+
+    Also records the whole operation time as ``ipcam_queue_operation_seconds``.
+    """
+    conn = get_connection()
+    started = time.monotonic()
+    conn.execute("BEGIN IMMEDIATE")
+    locked = time.monotonic()
+    metrics.observe(
+        "ipcam_sqlite_lock_wait_seconds", locked - started, operation=operation
+    )
+    with conn:
+        yield conn
+    metrics.observe(
+        "ipcam_queue_operation_seconds",
+        time.monotonic() - started,
+        operation=operation,
+    )
+
+
+def get_connection() -> sqlite3.Connection:
+    """Return this thread's connection to the catalog, migrated on first use."""
+    return sqlite_store.connect(DB_PATH, SCHEMA_VERSION, __create_schema)
+
+
+def close_connection():
+    sqlite_store.close(DB_PATH)
 
 
 def get_camera_data(camera_id: int) -> Camera:
@@ -147,39 +789,146 @@ def list_cameras() -> List[Camera]:
         return [Camera(wid=row["id"], **row) for row in cursor.fetchall()]
 
 
-def init_db():
-    with get_connection() as conn:
-        cursor = conn.cursor()
+def __create_schema(cursor: sqlite3.Cursor):
+    cursor.execute(
+        """
+    CREATE TABLE IF NOT EXISTS cameras (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT,
+        ip TEXT,
+        user TEXT,
+        passw TEXT,
+        segment_duration TEXT,
+        date_range INTEGER,
+        uri TEXT,
+        recording BOOLEAN DEFAULT 0
+    )
+    """
+    )
 
-        cursor.execute(
-            """
-        CREATE TABLE IF NOT EXISTS cameras (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT,
-            ip TEXT,
-            user TEXT,
-            passw TEXT,
-            segment_duration TEXT,
-            date_range INTEGER,
-            uri TEXT,
-            recording BOOLEAN DEFAULT 0
-        )
+    camera_columns = [
+        row["name"] for row in cursor.execute("PRAGMA table_info(cameras)")
+    ]
+    for column, definition in (
+        ("priority", "INTEGER DEFAULT 1"),
+        ("motion_policy", f"TEXT DEFAULT '{MOTION_ORIGINAL}'"),
+        ("motion_threshold", f"REAL DEFAULT {MOTION_THRESHOLD}"),
+    ):
+        if column not in camera_columns:
+            cursor.execute(f"ALTER TABLE cameras ADD COLUMN {column} {definition}")
+
+    cursor.execute(
         """
-        )
+    CREATE TABLE IF NOT EXISTS upload_queue (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        filename TEXT,
+        camera_id INTEGER,
+        to_compress BOOLEAN DEFAULT 0,
+        to_exclude BOOLEAN DEFAULT 1
+    )
+    """
+    )
 
-        cursor.execute(
-            """
-        CREATE TABLE IF NOT EXISTS upload_queue (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            filename TEXT,
-            camera_id INTEGER,
-            to_compress BOOLEAN DEFAULT 0,
-            to_exclude BOOLEAN DEFAULT 1
-        )
+    queue_columns = [
+        row["name"] for row in cursor.execute("PRAGMA table_info(upload_queue)")
+    ]
+    for column, definition in (
+        ("status", f"TEXT DEFAULT '{QUEUE_PENDING}'"),
+        ("available_at", "REAL DEFAULT 0"),
+        ("attempts", "INTEGER DEFAULT 0"),
+        ("last_error", "TEXT"),
+        ("upload_session_uri", "TEXT"),
+        ("upload_offset", "INTEGER DEFAULT 0"),
+        ("enqueued_at", "REAL"),
+    ):
+        if column not in queue_columns:
+            cursor.execute(f"ALTER TABLE upload_queue ADD COLUMN {column} {definition}")
+
+    cursor.execute(
         """
-        )
+    CREATE INDEX IF NOT EXISTS idx_upload_queue_status_available
+    ON upload_queue (status, available_at)
+    """
+    )
+
+    cursor.execute(
+        """
+    CREATE TABLE IF NOT EXISTS recordings (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        camera_id INTEGER,
+        path TEXT UNIQUE,
+        start_time TIMESTAMP,
+        duration REAL DEFAULT 0,
+        size INTEGER DEFAULT 0,
+        thumbnail_path TEXT,
+        compressed_path TEXT,
+        preview_path TEXT,
+        drive_id TEXT,
+        state TEXT DEFAULT 'recorded',
+        local BOOLEAN DEFAULT 1,
+        updated_at REAL
+    )
+    """
+    )
 
-        conn.commit()
+    recording_columns = [
+        row["name"] for row in cursor.execute("PRAGMA table_info(recordings)")
+    ]
+    for column, definition in (
+        ("motion_score", "REAL"),
+        ("md5", "TEXT"),
+        ("uploaded_size", "INTEGER"),
+        ("verified_at", "REAL"),
+        ("thumbnail_small_path", "TEXT"),
+        ("sprite_path", "TEXT"),
+        ("sprite_index", "INTEGER"),
+    ):
+        if column not in recording_columns:
+            cursor.execute(f"ALTER TABLE recordings ADD COLUMN {column} {definition}")
+
+    cursor.execute(
+        """
+    CREATE INDEX IF NOT EXISTS idx_recordings_camera_start
+    ON recordings (camera_id, start_time)
+    """
+    )
+
+    # Busca por movimento no painel filtra a câmera e o intervalo de score
+    cursor.execute(
+        """
+    CREATE INDEX IF NOT EXISTS idx_recordings_camera_motion
+    ON recordings (camera_id, motion_score)
+    """
+    )
+
+    # Retenção percorre as cópias locais mais antigas de todas as câmeras
+    cursor.execute(
+        """
+    CREATE INDEX IF NOT EXISTS idx_recordings_local_start
+    ON recordings (local, start_time)
+    """
+    )
+
+    # Só as miniaturas pequenas que ainda aguardam o sprite da hora
+    cursor.execute(
+        """
+    CREATE INDEX IF NOT EXISTS idx_recordings_pending_sprite
+    ON recordings (camera_id, start_time)
+    WHERE thumbnail_small_path IS NOT NULL AND sprite_path IS NULL
+    """
+    )
+
+    cursor.execute(
+        """
+    CREATE TABLE IF NOT EXISTS backpressure (
+        policy TEXT PRIMARY KEY,
+        active BOOLEAN DEFAULT 0,
+        reason TEXT,
+        updated_at REAL
+    )
+    """
+    )
 
 
-init_db()
+def init_db(conn: Optional[sqlite3.Connection] = None):
+    sqlite_store.init_db(conn or get_connection(), SCHEMA_VERSION, __create_schema)
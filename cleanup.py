@@ -1,45 +1,362 @@
+import argparse
 import datetime
+import logging
 import os
-from time import sleep
+import shutil
+import time
+from typing import Iterable, Optional, Set
+import camera_model
+import drive_index
+import drive_quota
+import sprites
 from camera_model import list_cameras
-from record import base_dir, upload_video
+from drive_client import delete_file, get_file_checksum
+from playback import PLAYBACK_CACHE_DIR
+from record import base_dir, catalog_segment
+from utils import file_md5
 
+# Intervalo entre execuções da retenção
+RETENTION_INTERVAL = int(os.environ.get("RETENTION_INTERVAL", 300))
+# Ao passar da marca alta (% do disco em uso) libera espaço até a marca baixa
+DISK_HIGH_WATERMARK = float(os.environ.get("DISK_HIGH_WATERMARK", 90))
+DISK_LOW_WATERMARK = float(os.environ.get("DISK_LOW_WATERMARK", 80))
+# Gravações lidas do catálogo por consulta
+RETENTION_BATCH = int(os.environ.get("RETENTION_BATCH", 200))
+# Tamanho máximo dos segmentos baixados do Drive para reprodução
+PLAYBACK_CACHE_MAX_BYTES = int(os.environ.get("PLAYBACK_CACHE_MAX_BYTES", 2 * 1024**3))
+# Arquivos usados há menos tempo que isso podem estar em reprodução
+PLAYBACK_CACHE_MIN_AGE = int(os.environ.get("PLAYBACK_CACHE_MIN_AGE", 600))
 
-def main():
-    today = datetime.date.today()
 
+def backfill_catalog():
+    """Register in the catalog the local recordings made before it existed.
+
+    Files without an upload queue row are enqueued, since nothing else would
+    send them to the Drive.
+    """
     for camera in list_cameras():
-        oldest_sources = os.path.join(base_dir, camera.normalized_name())
-        print(oldest_sources)
-        oldest_sources = [
-            os.path.join(oldest_sources, day)
-            for day in os.listdir(oldest_sources)
-            if not day == today.isoformat()
-        ]
+        camera_dir = os.path.join(base_dir, camera.normalized_name())
+        if not os.path.exists(camera_dir):
+            continue
+
+        known = {
+            recording.path for recording in camera_model.list_recordings(camera.wid)
+        }
+        queued = camera_model.queued_filenames(camera.wid)
+        to_upload = []
+        for file in os.listdir(camera_dir):
+            file_full_path = os.path.join(camera_dir, file)
+            if not file.endswith(".mp4") or file.endswith("_.mp4"):
+                continue
+            if file_full_path in known:
+                continue
+
+            logging.info(f"Catalogando {file_full_path}")
+            catalog_segment(camera, file_full_path)
+            thumb_path = file_full_path.replace(".mp4", ".jpg")
+            if os.path.exists(thumb_path):
+                camera_model.update_recording(file_full_path, thumbnail_path=thumb_path)
+            if file_full_path not in queued:
+                to_upload.append(
+                    camera_model.UploadQueue(
+                        filename=file_full_path, camera_id=camera.wid
+                    )
+                )
+
+        if to_upload:
+            camera_model.put_many(to_upload)
+            logging.info(f"{len(to_upload)} gravações de {camera.name} enfileiradas")
+
+
+def disk_usage_percent(path: str = base_dir) -> float:
+    os.makedirs(path, exist_ok=True)
+    usage = shutil.disk_usage(path)
+    return usage.used / usage.total * 100
+
+
+def __remove_files(paths: Iterable[Optional[str]]) -> int:
+    freed = 0
+    for path in paths:
+        if not path or not os.path.exists(path):
+            continue
+        freed += os.path.getsize(path)
+        os.remove(path)
+    return freed
+
 
-        for day_path in oldest_sources:
-            if not os.path.exists(day_path):
-                print(f"Nenhuma gravação para limpar no dia {today.isoformat()}")
+def enforce_playback_cache(max_bytes: int = PLAYBACK_CACHE_MAX_BYTES) -> int:
+    """Evict the least recently used playback downloads above ``max_bytes``.
+
+    Files used in the last ``PLAYBACK_CACHE_MIN_AGE`` seconds are kept, as are
+    downloads still in progress. Returns bytes freed.
+    """
+    if not os.path.exists(PLAYBACK_CACHE_DIR):
+        return 0
+
+    now = time.time()
+    cached = []
+    for root, _, files in os.walk(PLAYBACK_CACHE_DIR):
+        for file in files:
+            path = os.path.join(root, file)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                # Download concluído e renomeado durante a varredura
                 continue
+            cached.append((stat.st_mtime, stat.st_size, path))
+
+    total = sum(size for _, size, _ in cached)
+    freed = 0
+    for used_at, size, path in sorted(cached):
+        if total - freed <= max_bytes:
+            break
+        if now - used_at < PLAYBACK_CACHE_MIN_AGE:
+            continue
+        os.remove(path)
+        freed += size
+
+    if freed:
+        logging.info(f"{freed / 1024**2:.0f} MiB removidos do cache de reprodução")
+    return freed
+
+
+def remove_variants(recording: camera_model.Recording) -> int:
+    """Delete the thumbnails, compressed and preview copies; returns bytes freed.
+
+    The hour's sprite is shared with other recordings and stays until it expires.
+    """
+    freed = __remove_files(
+        [
+            recording.thumbnail_path,
+            recording.thumbnail_small_path,
+            recording.compressed_path,
+            recording.preview_path,
+        ]
+    )
+    camera_model.update_recording(
+        recording.path,
+        thumbnail_path=None,
+        thumbnail_small_path=None,
+        compressed_path=None,
+        preview_path=None,
+    )
+    return freed
+
+
+def remove_local(recording: camera_model.Recording) -> int:
+    """Delete the original and its copies from disk; returns bytes freed."""
+    freed = remove_variants(recording) + __remove_files([recording.path])
+    camera_model.update_recording(recording.path, local=False)
+    return freed
+
+
+def expire_date_folders(
+    camera: camera_model.Camera, cutoff: datetime.datetime
+) -> Set[datetime.date]:
+    """Delete the camera's Drive date folders (YYYY-MM-DD) older than ``cutoff``.
+
+    Only folders known to the local Drive index are visited; deleted ones leave
+    the index, so each run only sees the days that expired since the last one.
+    Returns the dates whose folder was deleted.
+    """
+    deleted = set()
+    if not camera.uri:
+        return deleted
+
+    for name, folder_id in drive_index.get_many(camera.uri).items():
+        try:
+            folder_date = datetime.date.fromisoformat(name)
+        except ValueError:
+            continue
+        if folder_date < cutoff.date():
+            delete_file(folder_id)
+            deleted.add(folder_date)
+            logging.info(f"Pasta {name} da câmera {camera.name} removida do Drive")
+    return deleted
 
-            for file in os.listdir(day_path):
-                file_full_path = os.path.join(day_path, file)
-                print(f"Verificando arquivo {file_full_path}")
-                if file.endswith("_.mp4") or file.endswith(".jpg"):
-                    if os.path.exists(file_full_path):
-                        os.remove(file_full_path)
+
+def enforce_date_range(camera: camera_model.Camera, today: datetime.datetime):
+    """Remove recordings older than ``camera.date_range`` days, locally and on Drive.
+
+    Expired rows leave the catalog once removed, so each run only sees what
+    expired since the previous one. A row whose Drive copy could not be deleted
+    stays and is retried on the next run. Recordings inside a date folder deleted
+    in this run need no call of their own, and the ones being uploaded right now
+    wait for the next run.
+    """
+    cutoff = today - datetime.timedelta(days=camera.date_range)
+    deleted_dates = expire_date_folders(camera, cutoff)
+    sprites.expire_sprites(camera, cutoff)
+
+    removed = 0
+    while True:
+        expired = camera_model.list_recordings(
+            camera.wid, end=cutoff, exclude_in_flight=True, limit=RETENTION_BATCH
+        )
+        failed = False
+        for recording in expired:
+            remove_local(recording)
+            if recording.drive_id and recording.start_time.date() not in deleted_dates:
+                try:
+                    delete_file(recording.drive_id)
+                except Exception as err:
+                    logging.error(f"Erro ao remover {recording.path} do Drive: {err}")
+                    failed = True
                     continue
+            camera_model.delete_recording(recording.path)
+            removed += 1
 
-                upload_video(
-                    file_full_path,
-                    camera.wid,
-                    camera.name,
-                    to_exclude=True,
-                    suffix_to_exclude=["_processed_.mp4", "_compressed_.mp4", ".jpg"],
-                )
-            os.rmdir(day_path)
+        if failed or len(expired) < RETENTION_BATCH:
+            break
+
+    if removed:
+        logging.info(
+            f"{removed} gravações da câmera {camera.name} anteriores a "
+            f"{cutoff:%Y-%m-%d} removidas"
+        )
+
+
+def confirm_upload(recording: camera_model.Recording) -> bool:
+    """Compare the manifest MD5 with Drive's ``md5Checksum`` and record a match.
+
+    Recordings uploaded before the manifest existed are hashed from the local
+    original, which only matches when the original itself was uploaded.
+    """
+    if not recording.drive_id:
+        return False
+    md5 = recording.md5
+    if md5 is None:
+        if not os.path.exists(recording.path):
+            return False
+        md5 = file_md5(recording.path)
+
+    remote = get_file_checksum(recording.drive_id)
+    if not remote or remote.get("md5Checksum") != md5:
+        logging.warning(
+            f"Upload de {recording.path} não confirmado pelo MD5, original mantido"
+        )
+        return False
+
+    camera_model.update_recording(recording.path, md5=md5, verified_at=time.time())
+    return True
+
+
+def confirm_uploads():
+    """Run ``confirm_upload`` on every uploaded local original not yet verified."""
+    offset = 0
+    while True:
+        pending = camera_model.list_recordings(
+            state=camera_model.RECORDING_UPLOADED,
+            local=True,
+            verified=False,
+            limit=RETENTION_BATCH,
+            offset=offset,
+        )
+        for recording in pending:
+            try:
+                if not confirm_upload(recording):
+                    offset += 1
+            except Exception as err:
+                logging.error(f"Erro ao conferir {recording.path} no Drive: {err}")
+                offset += 1
+        if len(pending) < RETENTION_BATCH:
+            break
+
+
+def enforce_disk_watermarks():
+    """Free local space down to the low watermark once the high one is crossed.
+
+    The playback cache goes first, then copies of uploaded recordings (thumbnail,
+    compressed, preview), then uploaded originals, oldest first. Originals are
+    only removed once Drive's checksum confirmed the upload; the ones not yet on
+    Drive are never removed.
+    """
+    usage = disk_usage_percent()
+    if usage < DISK_HIGH_WATERMARK:
+        return
+
+    total = shutil.disk_usage(base_dir).total
+    to_free = (usage - DISK_LOW_WATERMARK) / 100 * total
+    logging.warning(
+        f"Disco em {usage:.1f}% de uso, liberando {to_free / 1024**2:.0f} MiB"
+    )
+
+    # Cópias baixadas do Drive saem antes de qualquer gravação
+    freed = enforce_playback_cache(0)
+    confirm_uploads()
+
+    for remove, filters in (
+        (remove_variants, {"with_variants": True}),
+        (remove_local, {"verified": True}),
+    ):
+        while freed < to_free:
+            candidates = camera_model.list_recordings(
+                state=camera_model.RECORDING_UPLOADED,
+                local=True,
+                limit=RETENTION_BATCH,
+                **filters,
+            )
+            if not candidates:
+                break
+            for recording in candidates:
+                freed += remove(recording)
+                if freed >= to_free:
+                    break
+
+    logging.info(
+        f"{freed / 1024**2:.0f} MiB liberados, disco em {disk_usage_percent():.1f}%"
+    )
+    if freed < to_free:
+        logging.warning(
+            "Marca baixa não atingida: o restante do disco é ocupado por gravações "
+            "ainda não enviadas ou não confirmadas no Drive"
+        )
+
+
+def main():
+    today = datetime.datetime.combine(datetime.date.today(), datetime.time())
+
+    for camera in list_cameras():
+        try:
+            enforce_date_range(camera, today)
+        except Exception as err:
+            logging.error(f"Erro na retenção da câmera {camera.name}: {err}")
+        try:
+            sprites.build_camera_sprites(camera, datetime.datetime.now())
+        except Exception as err:
+            logging.error(f"Erro ao criar os sprites da câmera {camera.name}: {err}")
+
+    try:
+        enforce_playback_cache()
+    except Exception as err:
+        logging.error(f"Erro na retenção do cache de reprodução: {err}")
+
+    try:
+        enforce_disk_watermarks()
+    except Exception as err:
+        logging.error(f"Erro na retenção por espaço em disco: {err}")
 
 
 if __name__ == "__main__":
-    main()
-    sleep(3600)
+    parser = argparse.ArgumentParser(prog="Cleanup", add_help=False)
+    parser.add_argument(
+        "--backfill",
+        help="catalog recordings found on disk before cleaning",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--once",
+        help="run a single retention pass and exit",
+        action="store_true",
+    )
+    args = parser.parse_args()
+    # A retenção cede a cota do Drive aos uploads
+    drive_quota.set_priority(drive_quota.PRIORITY_BACKGROUND)
+    if args.backfill:
+        backfill_catalog()
+
+    while True:
+        main()
+        if args.once:
+            break
+        time.sleep(RETENTION_INTERVAL)
@@ -1,15 +1,35 @@
+import json
 import logging
 import os
+import tempfile
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import date
 from functools import lru_cache
+from google_auth_httplib2 import AuthorizedHttp
+from httplib2 import HttpLib2Error
 from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaFileUpload
+from googleapiclient.discovery import build, build_from_document
+from googleapiclient.discovery_cache import get_static_doc
+from googleapiclient.errors import HttpError
+from googleapiclient.http import (
+    BatchHttpRequest,
+    HttpRequest,
+    MediaFileUpload,
+    MediaIoBaseDownload,
+    build_http,
+)
 from google.auth.transport.requests import Request
+from google.auth.credentials import AnonymousCredentials
 from google.auth.exceptions import RefreshError
 from google.oauth2.credentials import Credentials
-from typing import Union
+from typing import Callable, Dict, Iterable, List, Optional, Tuple, Union
 
+import drive_index
+import drive_quota
+import metrics
 from utils import retry
 
 logging.basicConfig(
@@ -28,9 +48,55 @@ SCOPES = ["https://www.googleapis.com/auth/drive.file"]
 # ID da pasta no Google Drive onde os arquivos serão enviados
 FOLDER_ID = os.environ["GDRIVE_BASE_FOLDER_ID"]
 
+# Tempo em segundos que uma listagem completa de pasta é considerada atual
+INDEX_MAX_AGE = int(os.environ.get("DRIVE_INDEX_MAX_AGE", 3600))
+LIST_PAGE_SIZE = 1000
+
+# Tamanho de cada chunk do upload resumable (múltiplo de 256 KiB)
+UPLOAD_CHUNK_SIZE = int(os.environ.get("DRIVE_UPLOAD_CHUNK_MB", 8)) * 1024 * 1024
+UPLOAD_NUM_RETRIES = int(os.environ.get("DRIVE_UPLOAD_NUM_RETRIES", 3))
+# Uploads simultâneos do upload_many, cada um com sua própria conexão
+UPLOAD_CONNECTIONS = int(os.environ.get("DRIVE_UPLOAD_CONNECTIONS", 4))
+HTTP_TIMEOUT = int(os.environ.get("DRIVE_HTTP_TIMEOUT", 120))
+
+# Campos pedidos na resposta do upload para conferir o conteúdo recebido
+UPLOAD_FIELDS = "id, md5Checksum, size"
+
+# Novas tentativas de chamadas ao Drive: backoff exponencial com jitter
+RETRY_ATTEMPTS = int(os.environ.get("DRIVE_RETRY_ATTEMPTS", 5))
+RETRY_BASE = float(os.environ.get("DRIVE_RETRY_BASE", 1))
+RETRY_MAX = float(os.environ.get("DRIVE_RETRY_MAX", 32))
+# Motivos do 403 que indicam cota excedida, e não falta de permissão
+RATE_LIMIT_REASONS = {"userRateLimitExceeded", "rateLimitExceeded"}
+
+# Limite de requisições por batch da API do Drive
+BATCH_SIZE = 100
+
+# Raiz alternativa da API, ex.: um servidor fake local (benchmarks/fake_drive.py)
+API_ENDPOINT = os.environ.get("DRIVE_API_ENDPOINT")
+
+
+# httplib2 não é thread-safe: cada thread mantém seu próprio serviço
+_thread_local = threading.local()
+_lock = threading.Lock()
+_credentials = None
+_upload_executor: Optional[ThreadPoolExecutor] = None
+
+
+def get_credentials():
+    global _credentials
+
+    with _lock:
+        if _credentials is None:
+            _credentials = __load_credentials()
+        return _credentials
+
+
+def __load_credentials():
+    if API_ENDPOINT:
+        # Servidor fake local (testes/benchmarks) não exige OAuth
+        return AnonymousCredentials()
 
-@lru_cache()
-def authenticate():
     creds = None
     if os.path.exists(TOKEN_PATH):
         creds = Credentials.from_authorized_user_file(TOKEN_PATH, SCOPES)
@@ -39,7 +105,7 @@ def authenticate():
         if creds and creds.expired and creds.refresh_token:
             try:
                 creds.refresh(Request())
-                return build("drive", "v3", credentials=creds)
+                return creds
             except RefreshError:
                 pass
         flow = InstalledAppFlow.from_client_secrets_file(CREDENTIALS_FILE, SCOPES)
@@ -47,18 +113,184 @@ def authenticate():
         with open(TOKEN_PATH, "w") as token_file:
             token_file.write(creds.to_json())
 
-    return build("drive", "v3", credentials=creds)
+    return creds
+
+
+def authenticate():
+    service = getattr(_thread_local, "service", None)
+    if service is None:
+        # Uma sessão HTTP autorizada e keep-alive por thread
+        # build_http desativa o redirect do status 308 usado no upload resumable
+        base_http = build_http()
+        base_http.timeout = HTTP_TIMEOUT
+        http = AuthorizedHttp(get_credentials(), http=base_http)
+        if API_ENDPOINT:
+            service = build_from_document(__discovery_document(), http=http)
+        else:
+            service = build("drive", "v3", http=http, cache_discovery=False)
+        _thread_local.service = service
+    return service
+
+
+def __is_rate_limited(err: HttpError) -> bool:
+    if err.resp.status == 429:
+        return True
+    if err.resp.status != 403:
+        return False
+    try:
+        errors = json.loads(err.content)["error"]["errors"]
+    except (ValueError, KeyError, TypeError):
+        return False
+    return any(error.get("reason") in RATE_LIMIT_REASONS for error in errors)
+
+
+def __retry_after(err: HttpError) -> Optional[float]:
+    try:
+        return float(err.resp.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def __should_retry(err: Exception) -> bool:
+    if isinstance(err, HttpError):
+        return (
+            err.resp.status in (408, 429)
+            or err.resp.status >= 500
+            or __is_rate_limited(err)
+        )
+    # Erros de rede; o circuito aberto e a falta de cota não se resolvem sozinhos
+    return isinstance(err, (OSError, HttpLib2Error))
+
+
+def __retry_delay(err: Exception) -> Optional[float]:
+    if isinstance(err, HttpError) and __is_rate_limited(err):
+        # A pausa (com Retry-After) já foi imposta a todos os processos pelo
+        # drive_quota, que segura a próxima tentativa até ela acabar
+        return 0
+    return None
+
+
+def __drive_retry(max_attempts: int = RETRY_ATTEMPTS):
+    return retry(
+        sleep_time=RETRY_BASE,
+        max_attempts=max_attempts,
+        max_sleep=RETRY_MAX,
+        retry_if=__should_retry,
+        delay_for=__retry_delay,
+    )
+
+
+@contextmanager
+def __track(operation: str, tokens: int = 1):
+    """Take quota for a Drive API call made in the block and record its outcome.
+
+    Latency and status go to the metrics; rate limits, server and network errors
+    feed the shared limiter and its circuit breaker.
+    """
+    failures = drive_quota.acquire(tokens)
+    status = "ok"
+    try:
+        with metrics.timer("ipcam_drive_request_seconds", operation=operation):
+            yield
+    except HttpError as err:
+        status = str(err.resp.status)
+        if __is_rate_limited(err):
+            drive_quota.record_failure(True, __retry_after(err))
+        elif err.resp.status >= 500:
+            drive_quota.record_failure(False)
+        elif failures:
+            # Erro do cliente (ex.: 404): o Drive respondeu normalmente
+            drive_quota.record_success()
+        raise
+    except Exception:
+        status = "error"
+        drive_quota.record_failure(False)
+        raise
+    else:
+        if failures:
+            drive_quota.record_success()
+    finally:
+        metrics.inc("ipcam_drive_requests_total", operation=operation, status=status)
+
+
+@__drive_retry()
+def __execute(request: HttpRequest, operation: str):
+    with __track(operation):
+        return request.execute()
+
+
+@__drive_retry()
+def __execute_batch(batch: BatchHttpRequest, requests: int):
+    # Cada requisição do lote conta na cota do Drive
+    with __track("batch", tokens=requests):
+        batch.execute()
+
+
+@__drive_retry(UPLOAD_NUM_RETRIES + 1)
+def __next_upload_chunk(request: HttpRequest):
+    with __track("upload_chunk"):
+        return request.next_chunk(num_retries=0)
+
+
+@__drive_retry(UPLOAD_NUM_RETRIES + 1)
+def __query_upload_status(request: HttpRequest) -> Optional[dict]:
+    """Move ``request`` to the offset the server confirmed for its session.
+
+    Sends the empty ``PUT`` with ``Content-Range: bytes */<size>`` of the
+    resumable protocol. Returns the uploaded file when the session is already
+    complete, None when chunks are still missing.
+    """
+    headers = {
+        "Content-Length": "0",
+        "Content-Range": f"bytes */{request.resumable.size()}",
+    }
+    with __track("upload_status"):
+        resp, content = request.http.request(
+            request.resumable_uri, method="PUT", body="", headers=headers
+        )
+        if resp.status in (200, 201):
+            return json.loads(content)
+        if resp.status != 308:
+            raise HttpError(resp, content, uri=request.resumable_uri)
+
+    # Sem o cabeçalho Range o servidor ainda não recebeu nenhum byte
+    confirmed = resp.get("range")
+    request.resumable_progress = int(confirmed.split("-")[1]) + 1 if confirmed else 0
+    return None
+
+
+@__drive_retry(UPLOAD_NUM_RETRIES + 1)
+def __next_download_chunk(downloader: MediaIoBaseDownload):
+    with __track("download"):
+        return downloader.next_chunk(num_retries=0)
+
+
+@lru_cache()
+def __discovery_document() -> dict:
+    # client_options.api_endpoint não altera o esquema das URLs de upload,
+    # então o rootUrl do documento estático é trocado diretamente
+    document = json.loads(get_static_doc("drive", "v3"))
+    document["rootUrl"] = API_ENDPOINT
+    document["baseUrl"] = API_ENDPOINT + document["servicePath"]
+    return document
 
 
 def __get_or_create_subfolder(parent_folder_id: str, subfolder_name: str) -> str:
+    subfolder_name = subfolder_name.strip()
+    folder_id = drive_index.get(parent_folder_id, subfolder_name)
+    if folder_id:
+        return folder_id
+
     service = authenticate()
 
-    query = f"name = '{subfolder_name.strip()}' and mimeType = 'application/vnd.google-apps.folder' and '{parent_folder_id}' in parents and trashed = false"
-    response = service.files().list(q=query, fields="files(id, name)").execute()
+    query = f"name = '{subfolder_name}' and mimeType = 'application/vnd.google-apps.folder' and '{parent_folder_id}' in parents and trashed = false"
+    response = __execute(
+        service.files().list(q=query, fields="files(id, name)"), "list"
+    )
     folders = response.get("files", [])
 
     if folders:
-        return folders[0]["id"]
+        folder_id = folders[0]["id"]
     else:
         # Criar nova pasta
         metadata = {
@@ -66,9 +298,51 @@ def __get_or_create_subfolder(parent_folder_id: str, subfolder_name: str) -> str
             "mimeType": "application/vnd.google-apps.folder",
             "parents": [parent_folder_id],
         }
-        folder = service.files().create(body=metadata, fields="id").execute()
+        folder = __execute(
+            service.files().create(body=metadata, fields="id"), "create_folder"
+        )
         logging.debug(f"Criada pasta: {subfolder_name}")
-        return folder["id"]
+        folder_id = folder["id"]
+
+    drive_index.put(parent_folder_id, subfolder_name, folder_id)
+    return folder_id
+
+
+def refresh_folder_index(folder_id: str) -> Dict[str, str]:
+    """List every child of ``folder_id`` page by page and replace its cached index."""
+    service = authenticate()
+
+    query = f"'{folder_id}' in parents and trashed = false"
+    entries = {}
+    page_token = None
+    while True:
+        response = __execute(
+            service.files().list(
+                q=query,
+                fields="nextPageToken, files(id, name)",
+                pageSize=LIST_PAGE_SIZE,
+                pageToken=page_token,
+            ),
+            "list",
+        )
+        for item in response.get("files", []):
+            entries.setdefault(item["name"], item["id"])
+
+        page_token = response.get("nextPageToken")
+        if not page_token:
+            break
+
+    drive_index.replace_folder(folder_id, entries.items())
+    return entries
+
+
+def __find_file_id(filename: str, folder_id: str) -> Union[str, None]:
+    file_id = drive_index.get(folder_id, filename)
+    if file_id or drive_index.is_fresh(folder_id, INDEX_MAX_AGE):
+        return file_id
+
+    refresh_folder_index(folder_id)
+    return drive_index.get(folder_id, filename)
 
 
 @lru_cache(128)
@@ -84,48 +358,331 @@ def create_date_path(camera_uri: str, record_date: Union[str, date]) -> str:
     return __get_or_create_subfolder(camera_uri, record_date)
 
 
-def upload_file(filepath, folder_id):
+def find_date_path(camera_uri: str, record_date: Union[str, date]) -> Optional[str]:
+    """Like ``create_date_path`` but never creates the folder."""
+    if isinstance(record_date, date):
+        record_date = record_date.isoformat()
+    return __find_file_id(record_date, camera_uri)
+
+
+def list_folder_files(folder_id: str, limit: int = LIST_PAGE_SIZE) -> List[dict]:
+    """First ``limit`` files (not folders) directly inside ``folder_id``."""
+    return list_folder_page(folder_id, limit)[0]
+
+
+def list_folder_page(
+    folder_id: str, limit: int = LIST_PAGE_SIZE, page_token: Optional[str] = None
+) -> Tuple[List[dict], Optional[str]]:
+    """One page of the files directly inside ``folder_id`` and the next page token."""
     service = authenticate()
+    query = (
+        f"'{folder_id}' in parents and trashed = false "
+        "and mimeType != 'application/vnd.google-apps.folder'"
+    )
+    response = __execute(
+        service.files().list(
+            q=query,
+            fields="nextPageToken, files(id, name, createdTime)",
+            pageSize=limit,
+            pageToken=page_token,
+        ),
+        "list",
+    )
+    return response.get("files", []), response.get("nextPageToken")
 
-    filename = os.path.split(filepath)[-1]
-    media = MediaFileUpload(filepath, resumable=True)
-
-    # Verifica se já existe arquivo com mesmo nome na pasta
-    query = f"'{folder_id}' in parents and name = '{filename}' and trashed = false"
-    results = service.files().list(q=query, fields="files(id, name)").execute()
-    items = results.get("files", [])
-
-    if items:
-        # Se já existe, pega o primeiro e faz update (overwrite)
-        file_id = items[0]["id"]
-        updated_file = (
-            service.files()
-            .update(fileId=file_id, media_body=media)
-            .execute()
+
+def move_files(moves: Iterable[Tuple[str, str, str, str]]) -> Dict[str, Exception]:
+    """Move ``(file_id, name, from_folder, to_folder)`` entries with batch requests.
+
+    Sends up to ``BATCH_SIZE`` moves per HTTP request and keeps the local index
+    in sync. Returns the errors of the moves that failed, keyed by file id.
+    """
+    service = authenticate()
+    moves = list(moves)
+    errors: Dict[str, Exception] = {}
+
+    for start in range(0, len(moves), BATCH_SIZE):
+        chunk = {move[0]: move for move in moves[start : start + BATCH_SIZE]}
+
+        def on_response(request_id, response, exception):
+            file_id, name, from_folder, to_folder = chunk[request_id]
+            metrics.inc(
+                "ipcam_drive_requests_total",
+                operation="move",
+                status="ok" if exception is None else "error",
+            )
+            if exception is not None:
+                errors[file_id] = exception
+                return
+            drive_index.delete(from_folder, name)
+            drive_index.put(to_folder, name, file_id)
+
+        batch = service.new_batch_http_request(callback=on_response)
+        for file_id, _, from_folder, to_folder in chunk.values():
+            batch.add(
+                service.files().update(
+                    fileId=file_id,
+                    addParents=to_folder,
+                    removeParents=from_folder,
+                    fields="id",
+                ),
+                request_id=file_id,
+            )
+        __execute_batch(batch, len(chunk))
+
+    return errors
+
+
+def __run_resumable(
+    request: HttpRequest,
+    filename: str,
+    on_chunk: Optional[Callable[[str, int], None]] = None,
+    resumed: bool = False,
+) -> dict:
+    """Send ``request`` chunk by chunk and return the uploaded file.
+
+    A ``resumed`` session first asks the server for the confirmed offset instead
+    of trusting the one saved locally.
+    """
+    response = __query_upload_status(request) if resumed else None
+    if response is not None:
+        return response
+
+    started = time.monotonic()
+    chunk_size = request.resumable.chunksize()
+    sent = 0
+    progress = 0
+    while response is None:
+        status, response = __next_upload_chunk(request)
+        current = status.resumable_progress if status else request.resumable.size()
+        # Numa sessão retomada o offset inicial só é conhecido pelo servidor,
+        # então cada chamada conta no máximo um chunk enviado
+        chunk_sent = min(chunk_size, current - progress)
+        sent += chunk_sent
+        progress = current
+        metrics.inc("ipcam_drive_upload_bytes_total", chunk_sent)
+        if status is None:
+            continue
+        logging.debug(f"{filename}: {progress}/{status.total_size} bytes")
+        if on_chunk:
+            on_chunk(request.resumable_uri, progress)
+
+    elapsed = max(time.monotonic() - started, 1e-6)
+    metrics.observe("ipcam_drive_upload_seconds", elapsed)
+    metrics.inc("ipcam_drive_uploaded_files_total")
+    logging.info(
+        f"Upload concluído: {filename} ({sent} bytes em {elapsed:.1f}s, "
+        f"{sent / elapsed / 1024:.0f} KiB/s)"
+    )
+    return response
+
+
+def get_file_checksum(file_id: str) -> Optional[dict]:
+    """``md5Checksum`` and ``size`` of a Drive file, or None when it is gone."""
+    service = authenticate()
+    try:
+        return __execute(
+            service.files().get(fileId=file_id, fields="id, md5Checksum, size"),
+            "get",
         )
-        logging.debug(f"Arquivo atualizado: {filename} (ID: {updated_file.get('id')})")
-        return updated_file.get("id")
-    else:
-        # Se não existe, cria novo
-        file_metadata = {"name": filename, "parents": [folder_id]}
-        new_file = (
-            service.files()
-            .create(body=file_metadata, media_body=media, fields="id")
-            .execute()
+    except HttpError as err:
+        if err.resp.status != 404:
+            raise
+        return None
+
+
+class ChecksumMismatch(ValueError):
+    """Drive stored different bytes than the ones uploaded."""
+
+
+def __confirm_checksum(uploaded_file: dict, filename: str, md5: Optional[str]):
+    """Fail unless Drive stored exactly the bytes whose MD5 is ``md5``."""
+    if not md5:
+        return
+    remote_md5 = uploaded_file.get("md5Checksum")
+    if remote_md5 is None:
+        # Sessões abertas antes do manifesto não pediam o md5Checksum na resposta
+        remote_md5 = (get_file_checksum(uploaded_file["id"]) or {}).get("md5Checksum")
+    if remote_md5 != md5:
+        metrics.inc("ipcam_drive_checksum_mismatches_total")
+        raise ChecksumMismatch(
+            f"MD5 de {filename} no Drive ({remote_md5}) difere do local ({md5})"
         )
-        logging.debug(f"Upload concluído: {filename} (ID: {new_file.get('id')})")
-        return new_file.get("id")
 
 
-def get_video_url(filename, camera_uri) -> Union[str, None]:
+def upload_file(
+    filepath,
+    folder_id,
+    resume_uri: Optional[str] = None,
+    on_chunk: Optional[Callable[[str, int], None]] = None,
+    md5: Optional[str] = None,
+):
+    """Upload ``filepath`` in ``UPLOAD_CHUNK_SIZE`` chunks.
+
+    Args:
+        resume_uri (str): Resumable session URI saved from a previous attempt.
+        on_chunk (Callable): Called with the session URI and the confirmed
+            offset after every chunk, so the caller can persist them.
+        md5 (str): MD5 of the file. A file of the same name whose
+            ``md5Checksum`` matches is not sent again, and the upload only
+            returns once Drive reports this checksum.
+    """
     service = authenticate()
 
-    query = f"name = '{filename}' and '{camera_uri}' in parents and trashed = false"
+    filename = os.path.split(filepath)[-1]
+    media = MediaFileUpload(filepath, chunksize=UPLOAD_CHUNK_SIZE, resumable=True)
+    file_metadata = {"name": filename, "parents": [folder_id]}
 
-    response = service.files().list(q=query, fields="files(id, name)").execute()
-    folders = response.get("files", [])
+    if resume_uri:
+        request = service.files().create(
+            body=file_metadata, media_body=media, fields=UPLOAD_FIELDS
+        )
+        request.resumable_uri = resume_uri
+        try:
+            # O offset confirmado vem do servidor, não do que foi salvo localmente
+            uploaded_file = __run_resumable(request, filename, on_chunk, resumed=True)
+            drive_index.put(folder_id, filename, uploaded_file.get("id"))
+            __confirm_checksum(uploaded_file, filename, md5)
+            return uploaded_file.get("id")
+        except HttpError as err:
+            if err.resp.status not in (404, 410):
+                raise
+            logging.warning(f"Sessão de upload expirada para {filename}, reiniciando")
+            media = MediaFileUpload(
+                filepath, chunksize=UPLOAD_CHUNK_SIZE, resumable=True
+            )
 
-    if folders:
-        return f"https://drive.google.com/file/d/{folders[0]['id']}/view?usp=drive_link"
+    # Verifica no índice local se já existe arquivo com mesmo nome na pasta
+    file_id = __find_file_id(filename, folder_id)
+
+    if file_id and md5:
+        remote = get_file_checksum(file_id)
+        if remote is None:
+            # Índice desatualizado: o arquivo foi removido do Drive
+            drive_index.delete(folder_id, filename)
+            file_id = None
+        elif remote.get("md5Checksum") == md5:
+            metrics.inc("ipcam_drive_upload_skipped_total")
+            logging.info(f"{filename} já está no Drive com o mesmo MD5, sem reenvio")
+            return file_id
+
+    if file_id:
+        # Se já existe, faz update (overwrite)
+        try:
+            request = service.files().update(
+                fileId=file_id, media_body=media, fields=UPLOAD_FIELDS
+            )
+            updated_file = __run_resumable(request, filename, on_chunk)
+            logging.debug(f"Arquivo atualizado: {filename} (ID: {updated_file.get('id')})")
+            __confirm_checksum(updated_file, filename, md5)
+            return updated_file.get("id")
+        except HttpError as err:
+            if err.resp.status != 404:
+                raise
+            # Índice desatualizado: o arquivo foi removido do Drive
+            drive_index.delete(folder_id, filename)
+
+    # Se não existe, cria novo
+    request = service.files().create(
+        body=file_metadata, media_body=media, fields=UPLOAD_FIELDS
+    )
+    new_file = __run_resumable(request, filename, on_chunk)
+    logging.debug(f"Upload concluído: {filename} (ID: {new_file.get('id')})")
+    drive_index.put(folder_id, filename, new_file.get("id"))
+    __confirm_checksum(new_file, filename, md5)
+    return new_file.get("id")
+
+
+def get_upload_executor() -> ThreadPoolExecutor:
+    global _upload_executor
+
+    with _lock:
+        if _upload_executor is None:
+            _upload_executor = ThreadPoolExecutor(
+                max_workers=UPLOAD_CONNECTIONS, thread_name_prefix="drive-upload"
+            )
+        return _upload_executor
+
+
+def upload_many(uploads: Iterable[Tuple[str, str]]) -> List[Future]:
+    """Upload several ``(filepath, folder_id)`` pairs concurrently.
+
+    Each worker of the shared pool keeps its own keep-alive session. The returned
+    futures resolve to the Drive file IDs; use ``asyncio.wrap_future`` to await
+    them from asyncio code.
+    """
+    executor = get_upload_executor()
+    return [
+        executor.submit(upload_file, filepath, folder_id)
+        for filepath, folder_id in uploads
+    ]
+
+
+def download_file(file_id: str, destination: str) -> str:
+    """Download a Drive file in ``UPLOAD_CHUNK_SIZE`` chunks to ``destination``.
+
+    The content is written to a unique temporary name first, so a partial
+    download is never mistaken for a complete file and concurrent downloads of
+    the same file do not write over each other.
+    """
+    service = authenticate()
+    directory, name = os.path.split(destination)
+    os.makedirs(directory or ".", exist_ok=True)
+    fd, partial_path = tempfile.mkstemp(
+        dir=directory or ".", prefix=f"{name}.", suffix=".part"
+    )
+
+    request = service.files().get_media(fileId=file_id)
+    try:
+        with os.fdopen(fd, "wb") as partial_file:
+            downloader = MediaIoBaseDownload(
+                partial_file, request, chunksize=UPLOAD_CHUNK_SIZE
+            )
+            done = False
+            while not done:
+                _, done = __next_download_chunk(downloader)
+        os.replace(partial_path, destination)
+    except BaseException:
+        os.remove(partial_path)
+        raise
+    logging.debug(f"Download concluído: {file_id} -> {destination}")
+    return destination
+
+
+def delete_file(file_id: str):
+    """Delete a file (or folder) from Drive; one that is already gone is ignored."""
+    service = authenticate()
+    try:
+        __execute(service.files().delete(fileId=file_id), "delete")
+    except HttpError as err:
+        if err.resp.status != 404:
+            raise
+        logging.debug(f"Arquivo {file_id} já removido do Drive")
+    drive_index.forget(file_id)
+
+
+def get_file_url(file_id: str) -> str:
+    return f"https://drive.google.com/file/d/{file_id}/view?usp=drive_link"
+
+
+def get_video_url(filename, camera_uri) -> Union[str, None]:
+    file_id = __find_file_id(filename, camera_uri)
+
+    if file_id:
+        return get_file_url(file_id)
 
     return None
+
+
+def get_video_urls(
+    filenames: List[str], camera_uri: str
+) -> Dict[str, Union[str, None]]:
+    """Resolve many filenames of a camera folder with at most one paginated listing."""
+    if not drive_index.is_fresh(camera_uri, INDEX_MAX_AGE):
+        refresh_folder_index(camera_uri)
+
+    file_ids = drive_index.get_many(camera_uri)
+    return {
+        filename: get_file_url(file_ids[filename]) if filename in file_ids else None
+        for filename in filenames
+    }
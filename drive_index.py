@@ -0,0 +1,128 @@
+import os
+import sqlite3
+import time
+from typing import Dict, Iterable, Optional, Tuple
+
+import sqlite_store
+
+# Índice local (parent, name) -> file id do Drive, ao lado do db.sqlite3
+INDEX_PATH = os.environ.get(
+    "DRIVE_INDEX_PATH",
+    os.path.join(
+        os.path.dirname(os.environ.get("DB_PATH", "shared/db.sqlite3")),
+        "drive_index.sqlite3",
+    ),
+)
+SCHEMA_VERSION = 2
+
+
+def get_connection() -> sqlite3.Connection:
+    return sqlite_store.connect(INDEX_PATH, SCHEMA_VERSION, __create_schema)
+
+
+def get(parent_id: str, name: str) -> Optional[str]:
+    with get_connection() as conn:
+        row = conn.execute(
+            "SELECT file_id FROM drive_index WHERE parent_id=? AND name=?",
+            (parent_id, name),
+        ).fetchone()
+        return row["file_id"] if row else None
+
+
+def get_many(parent_id: str) -> Dict[str, str]:
+    with get_connection() as conn:
+        cursor = conn.execute(
+            "SELECT name, file_id FROM drive_index WHERE parent_id=?", (parent_id,)
+        )
+        return {row["name"]: row["file_id"] for row in cursor.fetchall()}
+
+
+def put(parent_id: str, name: str, file_id: str):
+    with get_connection() as conn:
+        conn.execute(
+            """
+            INSERT OR REPLACE INTO drive_index (parent_id, name, file_id, updated_at)
+            VALUES (?, ?, ?, ?)
+        """,
+            (parent_id, name, file_id, time.time()),
+        )
+
+
+def delete(parent_id: str, name: str):
+    with get_connection() as conn:
+        conn.execute(
+            "DELETE FROM drive_index WHERE parent_id=? AND name=?", (parent_id, name)
+        )
+
+
+def forget(file_id: str):
+    """Remove every entry pointing at or cached under ``file_id`` after a delete."""
+    with get_connection() as conn:
+        conn.execute(
+            "DELETE FROM drive_index WHERE file_id=? OR parent_id=?", (file_id, file_id)
+        )
+        conn.execute("DELETE FROM drive_folders WHERE parent_id=?", (file_id,))
+
+
+def replace_folder(parent_id: str, entries: Iterable[Tuple[str, str]]):
+    """Replace every cached child of ``parent_id`` with a fresh (name, id) listing."""
+    now = time.time()
+    with get_connection() as conn:
+        conn.execute("DELETE FROM drive_index WHERE parent_id=?", (parent_id,))
+        conn.executemany(
+            """
+            INSERT OR REPLACE INTO drive_index (parent_id, name, file_id, updated_at)
+            VALUES (?, ?, ?, ?)
+        """,
+            [(parent_id, name, file_id, now) for name, file_id in entries],
+        )
+        conn.execute(
+            """
+            INSERT OR REPLACE INTO drive_folders (parent_id, refreshed_at)
+            VALUES (?, ?)
+        """,
+            (parent_id, now),
+        )
+
+
+def is_fresh(parent_id: str, max_age: float) -> bool:
+    """Whether the folder had a full listing cached in the last ``max_age`` seconds."""
+    with get_connection() as conn:
+        row = conn.execute(
+            "SELECT refreshed_at FROM drive_folders WHERE parent_id=?", (parent_id,)
+        ).fetchone()
+        return bool(row) and time.time() - row["refreshed_at"] <= max_age
+
+
+def __create_schema(cursor: sqlite3.Cursor):
+    cursor.execute(
+        """
+    CREATE TABLE IF NOT EXISTS drive_index (
+        parent_id TEXT,
+        name TEXT,
+        file_id TEXT,
+        updated_at REAL,
+        PRIMARY KEY (parent_id, name)
+    )
+    """
+    )
+
+    cursor.execute(
+        """
+    CREATE INDEX IF NOT EXISTS idx_drive_index_file_id
+    ON drive_index (file_id)
+    """
+    )
+
+    cursor.execute(
+        """
+    CREATE TABLE IF NOT EXISTS drive_folders (
+        parent_id TEXT PRIMARY KEY,
+        refreshed_at REAL
+    )
+    """
+    )
+
+
+def init_db(conn: Optional[sqlite3.Connection] = None):
+    sqlite_store.init_db(conn or get_connection(), SCHEMA_VERSION, __create_schema)
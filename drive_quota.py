@@ -0,0 +1,252 @@
+import logging
+import os
+import random
+import sqlite3
+import time
+from typing import Optional
+
+import metrics
+import sqlite_store
+
+# Estado do limitador compartilhado por todos os processos, ao lado do db.sqlite3
+QUOTA_PATH = os.environ.get(
+    "DRIVE_QUOTA_PATH",
+    os.path.join(
+        os.path.dirname(os.environ.get("DB_PATH", "shared/db.sqlite3")),
+        "drive_quota.sqlite3",
+    ),
+)
+SCHEMA_VERSION = 1
+# Com False as chamadas ao Drive não passam pelo limitador compartilhado
+QUOTA_ENABLED = os.environ.get("DRIVE_QUOTA_ENABLED", "True") == "True"
+
+# Requisições por segundo: a taxa cai pela metade a cada limite atingido e volta
+# a subir RECOVERY req/s a cada segundo sem erro, até MAX_RATE
+MAX_RATE = float(os.environ.get("DRIVE_QUOTA_RATE", 10))
+MIN_RATE = float(os.environ.get("DRIVE_QUOTA_MIN_RATE", 0.5))
+RECOVERY = float(os.environ.get("DRIVE_QUOTA_RECOVERY", 0.5))
+BURST = float(os.environ.get("DRIVE_QUOTA_BURST", MAX_RATE))
+# Pausa global após um 403/429 de limite: exponencial com jitter, até BACKOFF_MAX
+BACKOFF_BASE = float(os.environ.get("DRIVE_BACKOFF_BASE", 1))
+BACKOFF_MAX = float(os.environ.get("DRIVE_BACKOFF_MAX", 64))
+# Falhas seguidas que abrem o circuito e por quanto tempo ele fica aberto
+BREAKER_THRESHOLD = int(os.environ.get("DRIVE_BREAKER_THRESHOLD", 5))
+BREAKER_COOLDOWN = float(os.environ.get("DRIVE_BREAKER_COOLDOWN", 60))
+
+PRIORITY_UPLOAD = "upload"
+PRIORITY_BACKGROUND = "background"
+PRIORITY_INTERACTIVE = "interactive"
+# Fração do burst que precisa sobrar no balde para cada classe: os uploads usam
+# a cota primeiro e as consultas do painel só o que eles deixam livre
+PRIORITY_RESERVE = {
+    PRIORITY_UPLOAD: 0,
+    PRIORITY_BACKGROUND: 0.25,
+    PRIORITY_INTERACTIVE: 0.5,
+}
+# Espera máxima por cota antes de desistir da chamada
+PRIORITY_MAX_WAIT = {
+    PRIORITY_UPLOAD: 300,
+    PRIORITY_BACKGROUND: 120,
+    PRIORITY_INTERACTIVE: 10,
+}
+
+# Classe das chamadas deste processo, definida pelo ponto de entrada
+_priority = os.environ.get("DRIVE_PRIORITY", PRIORITY_UPLOAD)
+
+
+class QuotaUnavailable(Exception):
+    """The circuit is open or no quota was freed within the class's wait limit."""
+
+
+def set_priority(priority: str):
+    global _priority
+
+    if priority not in PRIORITY_RESERVE:
+        raise ValueError(f"Prioridade inválida: {priority}")
+    _priority = priority
+
+
+def get_connection() -> sqlite3.Connection:
+    return sqlite_store.connect(QUOTA_PATH, SCHEMA_VERSION, __create_schema)
+
+
+def __refill(state: sqlite3.Row, now: float) -> dict:
+    """Bucket and rate as of ``now``, without writing them."""
+    elapsed = max(now - state["updated_at"], 0)
+    rate = min(MAX_RATE, state["rate"] + RECOVERY * elapsed)
+    return {
+        "tokens": min(BURST, state["tokens"] + elapsed * state["rate"]),
+        "rate": rate,
+        "updated_at": now,
+    }
+
+
+def __try_acquire(tokens: float, priority: str) -> tuple:
+    """Take ``tokens`` if the class may; returns (failures, seconds to wait)."""
+    conn = get_connection()
+    now = time.time()
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        state = conn.execute("SELECT * FROM drive_quota WHERE id=1").fetchone()
+        bucket = __refill(state, now)
+        failures = state["failures"]
+
+        if failures >= BREAKER_THRESHOLD and now < state["open_until"]:
+            raise QuotaUnavailable(
+                f"Circuito do Drive aberto por mais "
+                f"{state['open_until'] - now:.0f}s após {failures} falhas"
+            )
+        if now < state["blocked_until"]:
+            return failures, state["blocked_until"] - now
+
+        # Lotes maiores que o burst deixam o balde negativo em vez de nunca passar
+        needed = min(tokens, BURST) + PRIORITY_RESERVE[priority] * BURST
+        if bucket["tokens"] < needed:
+            return failures, (needed - bucket["tokens"]) / bucket["rate"]
+
+        open_until = state["open_until"]
+        if failures >= BREAKER_THRESHOLD:
+            # Meio-aberto: só esta chamada testa o Drive até o resultado chegar
+            open_until = now + BREAKER_COOLDOWN
+        conn.execute(
+            "UPDATE drive_quota SET tokens=?, rate=?, updated_at=?, open_until=?"
+            " WHERE id=1",
+            (bucket["tokens"] - tokens, bucket["rate"], now, open_until),
+        )
+        return failures, 0
+
+
+def acquire(tokens: float = 1, priority: Optional[str] = None) -> int:
+    """Block until ``tokens`` requests fit in the shared quota.
+
+    Returns the consecutive failure count seen, which ``record_success`` uses to
+    skip the write when there is nothing to reset.
+    """
+    if not QUOTA_ENABLED:
+        return 0
+
+    priority = priority or _priority
+    started = time.monotonic()
+    deadline = started + PRIORITY_MAX_WAIT[priority]
+    while True:
+        failures, wait = __try_acquire(tokens, priority)
+        if not wait:
+            break
+        if time.monotonic() + wait > deadline:
+            raise QuotaUnavailable(
+                f"Sem cota do Drive para {priority} em {PRIORITY_MAX_WAIT[priority]}s"
+            )
+        # Jitter evita que os processos acordem juntos
+        time.sleep(min(wait, 1) * random.uniform(1, 1.25))
+
+    waited = time.monotonic() - started
+    if waited > 0.001:
+        metrics.observe("ipcam_drive_quota_wait_seconds", waited, priority=priority)
+    return failures
+
+
+def record_success():
+    """Close the circuit after a request went through."""
+    if not QUOTA_ENABLED:
+        return
+    with get_connection() as conn:
+        conn.execute("UPDATE drive_quota SET failures=0, open_until=0 WHERE id=1")
+
+
+def record_failure(rate_limited: bool, retry_after: Optional[float] = None):
+    """Count a failed request; a rate limit also pauses every process.
+
+    The pause honours ``retry_after`` and otherwise grows exponentially with
+    full jitter, and the sustained rate is halved once per pause.
+    """
+    if not QUOTA_ENABLED:
+        return
+    conn = get_connection()
+    now = time.time()
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        state = conn.execute("SELECT * FROM drive_quota WHERE id=1").fetchone()
+        bucket = __refill(state, now)
+        failures = state["failures"] + 1
+        blocked_until = state["blocked_until"]
+        rate = bucket["rate"]
+        tokens = bucket["tokens"]
+        if rate_limited:
+            # Respostas de requisições feitas antes da pausa não reduzem a taxa de novo
+            if now >= blocked_until:
+                rate = max(MIN_RATE, rate / 2)
+            backoff = random.uniform(
+                0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (failures - 1))
+            )
+            blocked_until = max(blocked_until, now + max(backoff, retry_after or 0))
+            tokens = min(tokens, 0)
+
+        open_until = state["open_until"]
+        if failures >= BREAKER_THRESHOLD:
+            open_until = now + BREAKER_COOLDOWN
+            logging.warning(
+                f"Circuito do Drive aberto por {open_until - now:.0f}s "
+                f"após {failures} falhas seguidas"
+            )
+            metrics.inc("ipcam_drive_circuit_open_total")
+
+        conn.execute(
+            """
+            UPDATE drive_quota
+            SET tokens=?, rate=?, updated_at=?, failures=?, blocked_until=?,
+                open_until=?
+            WHERE id=1
+        """,
+            (tokens, rate, now, failures, blocked_until, open_until),
+        )
+
+    if rate_limited:
+        metrics.inc("ipcam_drive_rate_limited_total")
+        metrics.set_gauge("ipcam_drive_quota_rate", rate)
+        logging.warning(
+            f"Limite do Drive atingido: pausa de {blocked_until - now:.1f}s, "
+            f"taxa reduzida para {rate:.2f} req/s"
+        )
+
+
+def status() -> dict:
+    """Current rate, tokens and breaker state, as of now."""
+    with get_connection() as conn:
+        state = conn.execute("SELECT * FROM drive_quota WHERE id=1").fetchone()
+    now = time.time()
+    return {
+        **__refill(state, now),
+        "failures": state["failures"],
+        "blocked_for": max(state["blocked_until"] - now, 0),
+        "open_for": (
+            max(state["open_until"] - now, 0)
+            if state["failures"] >= BREAKER_THRESHOLD
+            else 0
+        ),
+    }
+
+
+def __create_schema(cursor: sqlite3.Cursor):
+    cursor.execute(
+        """
+    CREATE TABLE IF NOT EXISTS drive_quota (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        tokens REAL,
+        rate REAL,
+        updated_at REAL,
+        failures INTEGER DEFAULT 0,
+        blocked_until REAL DEFAULT 0,
+        open_until REAL DEFAULT 0
+    )
+    """
+    )
+
+    cursor.execute(
+        "INSERT OR IGNORE INTO drive_quota (id, tokens, rate, updated_at)"
+        " VALUES (1, ?, ?, ?)",
+        (BURST, MAX_RATE, time.time()),
+    )
+
+
+def init_db(conn: Optional[sqlite3.Connection] = None):
+    sqlite_store.init_db(conn or get_connection(), SCHEMA_VERSION, __create_schema)
@@ -0,0 +1,240 @@
+import atexit
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import sqlite_store
+
+# Contadores e gauges compartilhados entre processos, ao lado do db.sqlite3
+METRICS_PATH = os.environ.get(
+    "METRICS_PATH",
+    os.path.join(
+        os.path.dirname(os.environ.get("DB_PATH", "shared/db.sqlite3")),
+        "metrics.sqlite3",
+    ),
+)
+# Intervalo em que cada processo grava no banco o que acumulou em memória
+FLUSH_INTERVAL = float(os.environ.get("METRICS_FLUSH_INTERVAL", 5))
+SCHEMA_VERSION = 1
+
+COUNTER = "counter"
+GAUGE = "gauge"
+HISTOGRAM = "histogram"
+
+# Limites (em segundos) dos buckets padrão dos histogramas
+DEFAULT_BUCKETS = (0.005, 0.025, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+# Valores acumulados desde o último flush: (name, labels) -> (kind, value)
+_pending: Dict[Tuple[str, str], Tuple[str, float]] = {}
+_pending_lock = threading.Lock()
+_flusher: Optional[threading.Thread] = None
+
+
+def get_connection() -> sqlite3.Connection:
+    return sqlite_store.connect(METRICS_PATH, SCHEMA_VERSION, __create_schema)
+
+
+def __format_labels(labels: Dict[str, object]) -> str:
+    escaped = {
+        key: str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        for key, value in labels.items()
+    }
+    return ",".join(f'{key}="{value}"' for key, value in sorted(escaped.items()))
+
+
+def parse_labels(labels: str) -> Dict[str, str]:
+    return {
+        key: value.replace('\\"', '"').replace("\\n", "\n").replace("\\\\", "\\")
+        for key, value in re.findall(r'(\w+)="((?:[^"\\]|\\.)*)"', labels)
+    }
+
+
+def __ensure_flusher():
+    global _flusher
+
+    if _flusher is not None and _flusher.is_alive():
+        return
+    _flusher = threading.Thread(target=__flush_loop, name="metrics", daemon=True)
+    _flusher.start()
+
+
+def __flush_loop():
+    while True:
+        time.sleep(FLUSH_INTERVAL)
+        try:
+            flush()
+        except sqlite3.Error:
+            # Mantém o processo rodando; o próximo flush tenta de novo
+            pass
+
+
+def __add(name: str, labels: str, kind: str, value: float):
+    key = (name, labels)
+    with _pending_lock:
+        _, current = _pending.get(key, (kind, 0))
+        _pending[key] = (kind, current + value)
+    __ensure_flusher()
+
+
+def inc(name: str, value: float = 1, **labels):
+    """Add ``value`` to the counter ``name`` with the given labels."""
+    __add(name, __format_labels(labels), COUNTER, value)
+
+
+def set_gauge(name: str, value: float, **labels):
+    with _pending_lock:
+        _pending[(name, __format_labels(labels))] = (GAUGE, float(value))
+    __ensure_flusher()
+
+
+def observe(
+    name: str, value: float, buckets: Iterable[float] = DEFAULT_BUCKETS, **labels
+):
+    """Record ``value`` in the histogram ``name`` (``_bucket``, ``_sum``, ``_count``)."""
+    for bound in (*buckets, float("inf")):
+        if value <= bound:
+            le = "+Inf" if bound == float("inf") else f"{bound:g}"
+            __add(f"{name}_bucket", __format_labels({**labels, "le": le}), HISTOGRAM, 1)
+    base_labels = __format_labels(labels)
+    __add(f"{name}_sum", base_labels, HISTOGRAM, value)
+    __add(f"{name}_count", base_labels, HISTOGRAM, 1)
+
+
+class timer:
+    """Context manager that observes the elapsed seconds into a histogram."""
+
+    def __init__(self, name: str, **labels):
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.monotonic()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.monotonic() - self.started
+        observe(self.name, self.elapsed, **self.labels)
+        return False
+
+
+def flush():
+    """Write what this process accumulated to the shared store."""
+    with _pending_lock:
+        pending = dict(_pending)
+        _pending.clear()
+    if not pending:
+        return
+
+    now = time.time()
+    try:
+        with get_connection() as conn:
+            conn.executemany(
+                """
+                INSERT INTO metrics (name, labels, kind, value, updated_at)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (name, labels) DO UPDATE SET
+                    value=CASE WHEN excluded.kind=?
+                        THEN excluded.value ELSE value + excluded.value END,
+                    updated_at=excluded.updated_at
+            """,
+                [
+                    (name, labels, kind, value, now, GAUGE)
+                    for (name, labels), (kind, value) in pending.items()
+                ],
+            )
+    except sqlite3.Error:
+        # Devolve os valores para não perder contagens
+        with _pending_lock:
+            for key, (kind, value) in pending.items():
+                _, current = _pending.get(key, (kind, 0))
+                _pending[key] = (kind, value if kind == GAUGE else current + value)
+        raise
+
+
+atexit.register(lambda: flush() if _pending else None)
+
+
+def collect(prefix: str = "") -> List[Tuple[str, str, str, float]]:
+    """Every stored ``(name, labels, kind, value)``, optionally filtered by prefix."""
+    with get_connection() as conn:
+        cursor = conn.execute(
+            "SELECT name, labels, kind, value FROM metrics WHERE name LIKE ? "
+            "ORDER BY name, labels",
+            (prefix + "%",),
+        )
+        return [tuple(row) for row in cursor.fetchall()]
+
+
+def query(
+    name: str, max_age: Optional[float] = None
+) -> List[Tuple[Dict[str, str], float]]:
+    """Stored samples of one series name with their parsed labels.
+
+    ``max_age`` skips samples not written in that many seconds, e.g. gauges left
+    behind by processes that already exited.
+    """
+    since = time.time() - max_age if max_age is not None else 0
+    with get_connection() as conn:
+        cursor = conn.execute(
+            "SELECT labels, value FROM metrics WHERE name=? AND updated_at>=?",
+            (name, since),
+        )
+        return [(parse_labels(row["labels"]), row["value"]) for row in cursor]
+
+
+def __family(name: str, kind: str) -> str:
+    if kind == HISTOGRAM:
+        return re.sub(r"_(bucket|sum|count)$", "", name)
+    return name
+
+
+def __sort_key(sample: Tuple[str, str, str, float]):
+    name, labels, kind, _ = sample
+    parsed = parse_labels(labels)
+    le = parsed.pop("le", None)
+    return (
+        __family(name, kind),
+        sorted(parsed.items()),
+        name,
+        float("inf") if le in (None, "+Inf") else float(le),
+    )
+
+
+def render(prefix: str = "", extra: Iterable[Tuple[str, str, str, float]] = ()) -> str:
+    """Prometheus text exposition of the stored metrics plus ``extra`` samples."""
+    lines = []
+    current = None
+    for name, labels, kind, value in sorted([*collect(prefix), *extra], key=__sort_key):
+        family = __family(name, kind)
+        if family != current:
+            lines.append(f"# TYPE {family} {kind}")
+            current = family
+        series = f"{name}{{{labels}}}" if labels else name
+        lines.append(f"{series} {value:.15g}")
+    return "\n".join(lines) + "\n"
+
+
+def __create_schema(cursor: sqlite3.Cursor):
+    cursor.execute(
+        """
+    CREATE TABLE IF NOT EXISTS metrics (
+        name TEXT,
+        labels TEXT,
+        kind TEXT,
+        value REAL,
+        updated_at REAL,
+        PRIMARY KEY (name, labels)
+    )
+    """
+    )
+
+
+def init_db(conn: Optional[sqlite3.Connection] = None):
+    sqlite_store.init_db(conn or get_connection(), SCHEMA_VERSION, __create_schema)
+
+
+if __name__ == "__main__":
+    print(render(), end="")
@@ -0,0 +1,139 @@
+import argparse
+import logging
+import os
+import time
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Tuple
+
+import camera_model
+import drive_quota
+import metrics
+from utils import duration_to_seconds
+
+logging.basicConfig(
+    level=os.environ.get("LOG_LEVEL", logging.INFO),
+    format="%(asctime)s - %(levelname)s - %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+
+METRICS_PORT = int(os.environ.get("METRICS_PORT", 9108))
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+# Gauges da fila de transcodificação mais antigos que isso são de pools encerrados
+TRANSCODE_GAUGE_MAX_AGE = int(os.environ.get("TRANSCODE_GAUGE_MAX_AGE", 600))
+
+
+def queue_samples() -> List[Tuple[str, str, str, float]]:
+    """Queue depth per status and oldest age, read live from the database."""
+    stats = camera_model.queue_stats()
+    oldest_age = stats.pop("oldest_age")
+    samples = [
+        ("ipcam_queue_items", f'status="{status}"', metrics.GAUGE, total)
+        for status, total in stats.items()
+    ]
+    samples.append(("ipcam_queue_oldest_age_seconds", "", metrics.GAUGE, oldest_age))
+    return samples
+
+
+def __averages(name: str, label: str) -> Dict[str, float]:
+    """Mean of the histogram ``name`` grouped by ``label``."""
+    sums: Dict[str, float] = defaultdict(float)
+    counts: Dict[str, float] = defaultdict(float)
+    for labels, value in metrics.query(f"{name}_sum"):
+        sums[labels.get(label, "")] += value
+    for labels, value in metrics.query(f"{name}_count"):
+        counts[labels.get(label, "")] += value
+    return {key: sums[key] / counts[key] for key in counts if counts[key]}
+
+
+def lagging_cameras() -> List[Tuple[camera_model.Camera, float]]:
+    """Recording cameras whose last segment is older than two segment durations."""
+    last_segments = {
+        labels.get("camera_id"): value
+        for labels, value in metrics.query("ipcam_last_segment_timestamp")
+    }
+    now = time.time()
+    lagging = []
+    for camera in camera_model.list_cameras():
+        last_segment = last_segments.get(str(camera.wid))
+        if not camera.recording or last_segment is None:
+            continue
+        age = now - last_segment
+        if age > 2 * duration_to_seconds(camera.segment_duration):
+            lagging.append((camera, age))
+    return lagging
+
+
+def summary() -> dict:
+    """Totals and averages shown in the dashboard, since the metrics began."""
+    requests = metrics.query("ipcam_drive_requests_total")
+    total_requests = sum(value for _, value in requests)
+    failed_requests = sum(
+        value for labels, value in requests if labels.get("status") != "ok"
+    )
+    upload_seconds = sum(
+        value for _, value in metrics.query("ipcam_drive_upload_seconds_sum")
+    )
+    upload_bytes = sum(
+        value for _, value in metrics.query("ipcam_drive_upload_bytes_total")
+    )
+
+    transcode = {
+        state: sum(
+            value
+            for _, value in metrics.query(
+                f"ipcam_transcode_{state}", max_age=TRANSCODE_GAUGE_MAX_AGE
+            )
+        )
+        for state in ("queued", "running")
+    }
+
+    return {
+        "queue": camera_model.queue_stats(),
+        "transcode": transcode,
+        "lagging_cameras": lagging_cameras(),
+        "upload_bytes": upload_bytes,
+        "upload_rate": upload_bytes / upload_seconds if upload_seconds else 0,
+        "drive_requests": total_requests,
+        "drive_error_rate": failed_requests / total_requests if total_requests else 0,
+        "drive_latency": __averages("ipcam_drive_request_seconds", "operation"),
+        "ffmpeg_runtime": __averages("ipcam_ffmpeg_seconds", "job"),
+        "lock_wait": __averages("ipcam_sqlite_lock_wait_seconds", "operation"),
+        "drive_quota": drive_quota.status(),
+    }
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        logging.debug(format % args)
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            return self.send_error(404)
+
+        try:
+            body = metrics.render("ipcam_", extra=queue_samples()).encode()
+        except Exception as err:
+            logging.error(f"Erro ao gerar métricas: {err}")
+            return self.send_error(500)
+
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def serve(port: int = METRICS_PORT):
+    server = ThreadingHTTPServer(("0.0.0.0", port), MetricsHandler)
+    server.daemon_threads = True
+    logging.info(f"Métricas em http://0.0.0.0:{port}/metrics")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="Metrics")
+    parser.add_argument("--port", type=int, default=METRICS_PORT)
+    args = parser.parse_args()
+
+    serve(args.port)
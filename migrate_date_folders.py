@@ -0,0 +1,104 @@
+import argparse
+import logging
+import os
+from datetime import date, datetime
+from typing import Dict, Optional
+
+import camera_model
+import drive_client
+import drive_quota
+
+logging.basicConfig(
+    level=os.environ.get("LOG_LEVEL", logging.INFO),
+    format="%(asctime)s - %(levelname)s - %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+
+# Arquivos listados e movidos por rodada
+MIGRATION_BATCH = int(os.environ.get("DRIVE_MIGRATION_BATCH", drive_client.BATCH_SIZE))
+
+
+def __file_date(file: dict, recorded_dates: Dict[str, date]) -> date:
+    if file["id"] in recorded_dates:
+        return recorded_dates[file["id"]]
+    # Fora do catálogo, a data de criação no Drive é a do upload
+    created = datetime.fromisoformat(file["createdTime"].replace("Z", "+00:00"))
+    return created.astimezone().date()
+
+
+def migrate_camera(camera: camera_model.Camera) -> int:
+    """Move the files left directly in the camera folder into its date folders.
+
+    Moved files leave the listing, so every round reads the first page again and
+    an interrupted migration simply continues where it stopped. Pages holding
+    only files that failed to move are skipped with the page token.
+    """
+    if not camera.uri:
+        return 0
+
+    recorded_dates = {
+        recording.drive_id: recording.start_time.date()
+        for recording in camera_model.list_recordings(camera.wid)
+        if recording.drive_id
+    }
+
+    moved = 0
+    failed = set()
+    page_token = None
+    while True:
+        page, next_token = drive_client.list_folder_page(
+            camera.uri, MIGRATION_BATCH, page_token
+        )
+        files = [file for file in page if file["id"] not in failed]
+        if not files:
+            if not next_token:
+                break
+            page_token = next_token
+            continue
+        page_token = None
+
+        moves = [
+            (
+                file["id"],
+                file["name"],
+                camera.uri,
+                drive_client.create_date_path(
+                    camera.uri, __file_date(file, recorded_dates)
+                ),
+            )
+            for file in files
+        ]
+        errors = drive_client.move_files(moves)
+        for file_id, err in errors.items():
+            logging.error(f"Erro ao mover {file_id}: {err}")
+        failed.update(errors)
+        moved += len(moves) - len(errors)
+        logging.info(f"Câmera {camera.name}: {moved} arquivos movidos")
+
+    if failed:
+        logging.warning(
+            f"Câmera {camera.name}: {len(failed)} arquivos continuam na pasta da "
+            "câmera, execute a migração novamente"
+        )
+    return moved
+
+
+def main(camera_id: Optional[int] = None):
+    cameras = (
+        [camera_model.get_camera_data(camera_id)]
+        if camera_id
+        else camera_model.list_cameras()
+    )
+    for camera in cameras:
+        moved = migrate_camera(camera)
+        logging.info(f"Migração da câmera {camera.name} concluída ({moved} arquivos)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="Migrate Drive date folders")
+    parser.add_argument("--camera", help="only this camera ID", type=int)
+    args = parser.parse_args()
+
+    # A migração cede a cota do Drive aos uploads
+    drive_quota.set_priority(drive_quota.PRIORITY_BACKGROUND)
+    main(args.camera)
@@ -0,0 +1,84 @@
+import logging
+import os
+
+import numpy as np
+
+import camera_model
+import metrics
+from record import PRIORITY_THUMBNAIL, submit_transcode
+
+# Resolução dos quadros comparados; a diferença só precisa da forma da cena
+MOTION_WIDTH = int(os.environ.get("MOTION_WIDTH", 64))
+MOTION_HEIGHT = int(os.environ.get("MOTION_HEIGHT", 36))
+# Variação de luminância (0-255) abaixo da qual um pixel é tratado como ruído
+MOTION_PIXEL_DELTA = int(os.environ.get("MOTION_PIXEL_DELTA", 25))
+# Quadros por segundo amostrados quando o segmento tem menos de dois keyframes
+MOTION_SAMPLE_FPS = float(os.environ.get("MOTION_SAMPLE_FPS", 1))
+# Histograma dos scores, em percentual de pixels alterados
+SCORE_BUCKETS = (0.1, 0.5, 1, 2, 5, 10, 25, 50, 100)
+
+
+def sample_frames(video_path: str, keyframes_only: bool = True) -> np.ndarray:
+    """Grayscale ``MOTION_WIDTH`` x ``MOTION_HEIGHT`` frames of a segment.
+
+    With ``keyframes_only`` only the keyframes are decoded, so sampling a segment
+    costs a fraction of decoding it.
+    """
+    video_filter = f"scale={MOTION_WIDTH}:{MOTION_HEIGHT},format=gray"
+    if keyframes_only:
+        input_options = ["-skip_frame", "nokey"]
+    else:
+        input_options = []
+        video_filter = f"fps={MOTION_SAMPLE_FPS}," + video_filter
+
+    cmd = [
+        "ffmpeg",
+        "-loglevel",
+        "error",
+        *input_options,
+        "-i",
+        video_path,
+        "-an",
+        "-vf",
+        video_filter,
+        "-fps_mode",
+        "passthrough",
+        "-threads",
+        "1",
+        "-f",
+        "rawvideo",
+        "pipe:1",
+    ]
+    result = submit_transcode(cmd, PRIORITY_THUMBNAIL, job="motion").result()
+    frames = np.frombuffer(result.stdout, dtype=np.uint8)
+    frame_size = MOTION_WIDTH * MOTION_HEIGHT
+    return frames[: len(frames) // frame_size * frame_size].reshape(
+        -1, MOTION_HEIGHT, MOTION_WIDTH
+    )
+
+
+def motion_score(frames: np.ndarray) -> float:
+    """Largest percentage of pixels changed between consecutive frames."""
+    if len(frames) < 2:
+        return 0.0
+    diffs = np.abs(np.diff(frames.astype(np.int16), axis=0))
+    changed = (diffs > MOTION_PIXEL_DELTA).mean(axis=(1, 2))
+    return float(changed.max() * 100)
+
+
+def score_segment(video_path: str) -> float:
+    frames = sample_frames(video_path)
+    if len(frames) < 2:
+        # GOP maior que o segmento: amostra pelo tempo decodificando tudo
+        frames = sample_frames(video_path, keyframes_only=False)
+    score = motion_score(frames)
+    metrics.observe("ipcam_motion_score", score, buckets=SCORE_BUCKETS)
+    logging.debug(f"Movimento em {video_path}: {score:.2f}% ({len(frames)} quadros)")
+    return score
+
+
+def triage(camera: camera_model.Camera, score: float) -> str:
+    """Policy applied to a segment: the camera's own, or original when it moves."""
+    if score >= camera.motion_threshold:
+        return camera_model.MOTION_ORIGINAL
+    return camera.motion_policy
@@ -1,8 +1,13 @@
-from datetime import datetime, timedelta
+from collections import deque
+from datetime import datetime, timedelta, timezone
+import hashlib
+import json
+import re
 import signal
 import sys
 from time import sleep
-from typing import List
+from typing import Dict, Iterable, List, Optional, Tuple
+import backpressure
 import camera_model
 import docker
 import os
@@ -18,16 +23,32 @@ logging.basicConfig(
     datefmt="%Y-%m-%d %H:%M:%S",
 )
 use_docker_env = os.environ.get("DOCKER_ENV", "False") == "True"
+continuous_recording = os.environ.get("CONTINUOUS_RECORDING", "True") == "True"
+# "supervisor": um único processo grava todas as câmeras
+# "container": um container por câmera
+RECORDER_MODE = os.environ.get("RECORDER_MODE", "supervisor")
+RECONCILE_INTERVAL = int(os.environ.get("ORCHESTRATOR_RECONCILE_INTERVAL", 30))
 BASE_CONTAINER_NAME = "ipcam-app"
+MANAGED_LABEL = "ipcam=managed"
+CONFIG_LABEL = "ipcam.config"
 main_container_name = BASE_CONTAINER_NAME + "-orchestrator"
 containers: List[Container] = []
 
+LOG_LEVELS = ("DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL")
+LOG_LEVEL_PATTERN = re.compile(r" - (DEBUG|INFO|WARNING|ERROR|CRITICAL) - ")
+
 
 def __get_last_minutes(minutes=1):
     return datetime.now() - timedelta(minutes=minutes)
 
 
-def __up_base_container(name: str, entrypoint: str) -> Container:
+def __config_hash(*values) -> str:
+    return hashlib.sha1(json.dumps(values, default=str).encode()).hexdigest()[:12]
+
+
+def __up_base_container(
+    name: str, entrypoint: str, config_hash: str = ""
+) -> Container:
     try:
         container = docker_client.containers.get(name)
         container.remove(force=True)
@@ -50,10 +71,14 @@ def __up_base_container(name: str, entrypoint: str) -> Container:
         environment={
             "GDRIVE_BASE_FOLDER_ID": os.environ["GDRIVE_BASE_FOLDER_ID"],
             "PYTHONUNBUFFERED": 1,
+            "RECORDER_MODE": RECORDER_MODE,
         },
         restart_policy={"Name": "always"},
         name=name,
-        labels={"ipcam": "managed"},
+        labels={
+            "ipcam": "managed",
+            CONFIG_LABEL: config_hash or __config_hash(entrypoint),
+        },
     )
     container.start()
 
@@ -63,33 +88,157 @@ def __up_base_container(name: str, entrypoint: str) -> Container:
     return container
 
 
-def get_container_logs(container_name: str, minutes_range: int = 1) -> str:
-    since = __get_last_minutes(minutes_range)
+def __parse_log_timestamp(timestamp: str) -> float:
+    # Docker usa RFC3339 com nanossegundos: 2025-07-24T14:30:00.123456789Z
+    seconds, _, fraction = timestamp.rstrip("Z").partition(".")
+    parsed = datetime.fromisoformat(seconds).replace(tzinfo=timezone.utc)
+    return parsed.timestamp() + float(f"0.{fraction or 0}")
+
+
+def tail_container_logs(
+    container_name: str,
+    cursor: Optional[float] = None,
+    minutes_range: int = 1,
+    max_lines: int = 500,
+    levels: Optional[Iterable[str]] = None,
+) -> Tuple[List[str], Optional[float]]:
+    """Stream the log lines written after ``cursor`` and return the last ``max_lines``.
+
+    Without a cursor the last ``minutes_range`` minutes are read. Lines are
+    filtered by ``levels`` as they stream in, so only the kept lines are held in
+    memory. Returns the lines and the cursor to pass on the next call.
+    """
+    levels = set(levels) if levels else None
     container = docker_client.containers.get(container_name)
-    logs = container.logs(stream=False, since=since).decode()
+    since = cursor if cursor else __get_last_minutes(minutes_range).timestamp()
+
+    options = {"stream": True, "follow": False, "timestamps": True, "since": since}
+    if levels is None:
+        # Sem filtro o próprio daemon já corta as linhas excedentes
+        options["tail"] = max_lines
+
+    lines = deque(maxlen=max_lines)
+    next_cursor = since
+
+    def handle(raw_line: bytes):
+        nonlocal next_cursor
+        timestamp, _, message = raw_line.decode(errors="replace").partition(" ")
+        try:
+            logged_at = __parse_log_timestamp(timestamp)
+        except ValueError:
+            return
+        # "since" tem granularidade de segundos: descarta o que já foi lido
+        if cursor and logged_at <= cursor:
+            return
+
+        next_cursor = max(next_cursor or 0, logged_at)
+        level = LOG_LEVEL_PATTERN.search(message)
+        if levels is not None and (not level or level.group(1) not in levels):
+            return
+        lines.append(message.rstrip())
+
+    pending = b""
+    for chunk in container.logs(**options):
+        pending += chunk
+        *complete, pending = pending.split(b"\n")
+        for raw_line in complete:
+            handle(raw_line)
+    if pending:
+        handle(pending)
 
-    return logs.split("\n")
+    return list(lines), next_cursor
 
 
-def start_monitoring(cam_id: int) -> Container:
-    name = f"{BASE_CONTAINER_NAME}-monitoring-{cam_id}"
+def monitoring_entrypoint(cam_id: int) -> str:
     entrypoint = f"python record.py --camera={cam_id}"
+    if continuous_recording:
+        entrypoint += " --continuous"
+    return entrypoint
 
-    return __up_base_container(name, entrypoint)
 
+def recorder_container_name(cam_id: int) -> str:
+    if RECORDER_MODE == "supervisor":
+        return f"{BASE_CONTAINER_NAME}-recorders"
+    return f"{BASE_CONTAINER_NAME}-monitoring-{cam_id}"
 
-def provisione_uploader() -> Container:
-    name = f"{BASE_CONTAINER_NAME}-queue-uploader"
-    entrypoint = f"python queue_uploader.py"
 
-    return __up_base_container(name, entrypoint)
+def desired_containers() -> Dict[str, Tuple[str, str]]:
+    """Map each container that should exist to its entrypoint and config hash."""
+    desired = {}
 
+    entrypoint = "python queue_uploader.py"
+    desired[f"{BASE_CONTAINER_NAME}-queue-uploader"] = (
+        entrypoint,
+        __config_hash(entrypoint),
+    )
+
+    # Retenção contínua por câmera (date_range) e por espaço em disco
+    entrypoint = "python cleanup.py"
+    desired[f"{BASE_CONTAINER_NAME}-cleanup"] = (
+        entrypoint,
+        __config_hash(entrypoint),
+    )
+
+    if RECORDER_MODE == "supervisor":
+        # O supervisor acompanha sozinho as mudanças na tabela de câmeras
+        entrypoint = "python recorder_supervisor.py"
+        desired[f"{BASE_CONTAINER_NAME}-recorders"] = (
+            entrypoint,
+            __config_hash(entrypoint),
+        )
+        return desired
 
-def provisione_cleanup() -> Container:
-    name = f"{BASE_CONTAINER_NAME}-cleanup"
-    entrypoint = f"python cleanup.py"
+    # Gravadores contínuos só leem a política de bitrate ao iniciar: ela entra
+    # no hash para que uma mudança recrie os containers
+    bitrate = backpressure.recording_bitrate() if continuous_recording else None
+    for cam in camera_model.list_cameras():
+        entrypoint = monitoring_entrypoint(cam.wid)
+        desired[f"{BASE_CONTAINER_NAME}-monitoring-{cam.wid}"] = (
+            entrypoint,
+            __config_hash(
+                entrypoint,
+                cam.name,
+                cam.ip,
+                cam.user,
+                cam.passw,
+                cam.segment_duration,
+                bitrate,
+            ),
+        )
 
-    return __up_base_container(name, entrypoint)
+    return desired
+
+
+def reconcile() -> List[Container]:
+    """Start, stop or recreate only the managed containers whose config changed."""
+    desired = desired_containers()
+    running = {
+        container.name: container
+        for container in docker_client.containers.list(
+            all=True, filters={"label": MANAGED_LABEL}
+        )
+    }
+
+    for name, container in running.items():
+        if name not in desired:
+            logging.info(f"🛑 Removendo container {name}")
+            container.remove(force=True)
+
+    current = []
+    for name, (entrypoint, config_hash) in desired.items():
+        container = running.get(name)
+        if container is None:
+            logging.info(f"🔁 Criando container {name}")
+            container = __up_base_container(name, entrypoint, config_hash)
+        elif container.labels.get(CONFIG_LABEL) != config_hash:
+            logging.info(f"🔁 Configuração alterada, recriando container {name}")
+            container = __up_base_container(name, entrypoint, config_hash)
+        elif container.status not in ("running", "restarting"):
+            logging.info(f"🔁 Iniciando container parado {name}")
+            container.start()
+        current.append(container)
+
+    return current
 
 
 def cleanup_and_exit(signum=None, frame=None):
@@ -107,13 +256,10 @@ if __name__ == "__main__":
     signal.signal(signal.SIGTERM, cleanup_and_exit)
     signal.signal(signal.SIGINT, cleanup_and_exit)
 
-    logging.info("Provisioning queue videos uploader")
-    containers.append(provisione_uploader())
-
-    logging.info("Starting cameras monitoring")
-    cameras_list = camera_model.list_cameras()
-    for cam in cameras_list:
-        containers.append(start_monitoring(cam.wid))
-        logging.info(f"🔁 Camera: {cam.normalized_name()} | IP: {cam.ip} | Started")
-
-    sleep(3600)
+    logging.info(f"Reconciling managed containers every {RECONCILE_INTERVAL}s")
+    while True:
+        try:
+            containers[:] = reconcile()
+        except Exception as err:
+            logging.error(f"Erro ao reconciliar containers: {err}")
+        sleep(RECONCILE_INTERVAL)
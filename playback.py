@@ -0,0 +1,342 @@
+import argparse
+import itertools
+import logging
+import os
+import subprocess
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Iterator, List, Optional
+from urllib.parse import parse_qs, urlencode, urlparse
+
+import camera_model
+import drive_quota
+from drive_client import download_file
+from record import base_dir
+from utils import duration_to_seconds
+
+logging.basicConfig(
+    level=os.environ.get("LOG_LEVEL", logging.INFO),
+    format="%(asctime)s - %(levelname)s - %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+
+# Segmentos baixados do Drive para reprodução
+PLAYBACK_CACHE_DIR = os.environ.get("PLAYBACK_CACHE_DIR", "shared/cache/playback")
+# Downloads do Drive em andamento à frente do segmento em reprodução
+PLAYBACK_PREFETCH = int(os.environ.get("PLAYBACK_PREFETCH", 4))
+PLAYBACK_PORT = int(os.environ.get("PLAYBACK_PORT", 8503))
+# Endereço do servidor de reprodução visto pelo navegador
+PLAYBACK_URL = os.environ.get("PLAYBACK_URL", f"http://localhost:{PLAYBACK_PORT}")
+STREAM_CHUNK_SIZE = 64 * 1024
+# Miniaturas e sprites não mudam depois de escritos: o navegador os guarda
+IMAGE_MAX_AGE = int(os.environ.get("PLAYBACK_IMAGE_MAX_AGE", 7 * 24 * 3600))
+
+# MP4 fragmentado pode ser reproduzido enquanto ainda está sendo gerado
+FRAGMENTED_MP4_OPTIONS = [
+    "-movflags",
+    "frag_keyframe+empty_moov+default_base_moof",
+    "-f",
+    "mp4",
+]
+
+
+def find_segments(
+    camera_id: int, start: datetime, end: datetime
+) -> List[camera_model.Recording]:
+    """Catalog segments of a camera overlapping ``[start, end)``, in order.
+
+    An unknown camera has no segments.
+    """
+    camera = camera_model.get_camera_data(camera_id)
+    if camera is None:
+        return []
+    # Um segmento iniciado antes de start ainda pode cobrir o começo do intervalo
+    lookback = timedelta(seconds=duration_to_seconds(camera.segment_duration))
+    recordings = camera_model.list_recordings(
+        camera_id, start=start - lookback, end=end
+    )
+    return [
+        recording
+        for recording in recordings
+        if recording.start_time + timedelta(seconds=recording.duration) > start
+    ]
+
+
+def resolve_segment(recording: camera_model.Recording) -> Optional[str]:
+    """Local path of a segment, downloading it from Drive when it was removed."""
+    if recording.local and os.path.exists(recording.path):
+        return recording.path
+
+    if not recording.drive_id:
+        logging.warning(
+            f"Segmento indisponível localmente e no Drive: {recording.path}"
+        )
+        return None
+
+    cached_path = os.path.join(
+        PLAYBACK_CACHE_DIR,
+        str(recording.camera_id),
+        os.path.basename(recording.path),
+    )
+    if os.path.exists(cached_path):
+        # A retenção do cache descarta primeiro os menos usados (mtime mais antigo)
+        os.utime(cached_path)
+    else:
+        download_file(recording.drive_id, cached_path)
+    return cached_path
+
+
+def __resolve_in_order(recordings: List[camera_model.Recording]):
+    """Yield ``(recording, path)`` in order while the next segments download.
+
+    Downloads run at most ``PLAYBACK_PREFETCH`` segments ahead of the one being
+    handed over, instead of the whole range at once.
+    """
+    executor = ThreadPoolExecutor(
+        max_workers=PLAYBACK_PREFETCH, thread_name_prefix="playback-fetch"
+    )
+    upcoming = iter(recordings)
+    window = deque(
+        (recording, executor.submit(resolve_segment, recording))
+        for recording in itertools.islice(upcoming, PLAYBACK_PREFETCH)
+    )
+    try:
+        while window:
+            recording, future = window.popleft()
+            for next_recording in itertools.islice(upcoming, 1):
+                window.append(
+                    (next_recording, executor.submit(resolve_segment, next_recording))
+                )
+            try:
+                yield recording, future.result()
+            except Exception as err:
+                logging.error(f"Falha ao obter {recording.path}: {err}")
+                yield recording, None
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def __feed_segments(recordings: List[camera_model.Recording], muxer: subprocess.Popen):
+    # Cada segmento é reempacotado em MPEG-TS, que pode ser concatenado byte a
+    # byte; o deslocamento mantém a linha do tempo contínua entre segmentos
+    offset = 0.0
+    try:
+        for recording, path in __resolve_in_order(recordings):
+            if muxer.poll() is not None:
+                break
+            if path:
+                subprocess.run(
+                    [
+                        "ffmpeg",
+                        "-loglevel",
+                        "error",
+                        "-i",
+                        path,
+                        "-c",
+                        "copy",
+                        "-output_ts_offset",
+                        f"{offset:.3f}",
+                        "-f",
+                        "mpegts",
+                        "pipe:1",
+                    ],
+                    stdout=muxer.stdin,
+                )
+            offset += recording.duration
+    finally:
+        try:
+            muxer.stdin.close()
+        except BrokenPipeError:
+            pass
+
+
+def stream_segments(recordings: List[camera_model.Recording]) -> Iterator[bytes]:
+    """Stream the segments as one fragmented MP4, without re-encoding.
+
+    Output starts as soon as the first segment is available; segments that only
+    exist on Drive are downloaded ``PLAYBACK_PREFETCH`` at a time ahead of it.
+    """
+    muxer = subprocess.Popen(
+        [
+            "ffmpeg",
+            "-loglevel",
+            "error",
+            "-f",
+            "mpegts",
+            "-i",
+            "pipe:0",
+            "-c",
+            "copy",
+            *FRAGMENTED_MP4_OPTIONS,
+            "pipe:1",
+        ],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+    )
+    feeder = threading.Thread(
+        target=__feed_segments, args=(recordings, muxer), daemon=True
+    )
+    feeder.start()
+
+    try:
+        while chunk := muxer.stdout.read1(STREAM_CHUNK_SIZE):
+            yield chunk
+    finally:
+        if muxer.poll() is None:
+            muxer.kill()
+        muxer.wait()
+        feeder.join(timeout=5)
+
+
+def stream_clip(camera_id: int, start: datetime, end: datetime) -> Iterator[bytes]:
+    return stream_segments(find_segments(camera_id, start, end))
+
+
+def export_clip(
+    camera_id: int, start: datetime, end: datetime, output_path: str
+) -> Optional[str]:
+    """Write the range to ``output_path`` using the concat demuxer (stream copy)."""
+    recordings = find_segments(camera_id, start, end)
+    paths = [path for _, path in __resolve_in_order(recordings) if path]
+    if not paths:
+        return None
+
+    list_path = output_path + ".txt"
+    with open(list_path, "w") as list_file:
+        for path in paths:
+            escaped = os.path.abspath(path).replace("'", "'\\''")
+            list_file.write(f"file '{escaped}'\n")
+
+    try:
+        subprocess.run(
+            [
+                "ffmpeg",
+                "-loglevel",
+                "error",
+                "-y",
+                "-f",
+                "concat",
+                "-safe",
+                "0",
+                "-i",
+                list_path,
+                "-c",
+                "copy",
+                "-movflags",
+                "+faststart",
+                output_path,
+            ],
+            check=True,
+        )
+    finally:
+        os.remove(list_path)
+    return output_path
+
+
+def clip_url(camera_id: int, start: datetime, end: datetime) -> str:
+    query = urlencode(
+        {"camera_id": camera_id, "start": start.isoformat(), "end": end.isoformat()}
+    )
+    return f"{PLAYBACK_URL}/clip.mp4?{query}"
+
+
+def image_url(path: str) -> str:
+    """URL of a thumbnail or sprite stored under the recordings directory."""
+    query = urlencode({"path": os.path.relpath(path, base_dir)})
+    return f"{PLAYBACK_URL}/image.jpg?{query}"
+
+
+def resolve_image(relative_path: str) -> Optional[str]:
+    """Local JPEG under the recordings directory, refusing paths that leave it."""
+    root = os.path.abspath(base_dir)
+    path = os.path.abspath(os.path.join(root, relative_path))
+    if not path.startswith(root + os.sep) or not path.endswith(".jpg"):
+        return None
+    return path if os.path.isfile(path) else None
+
+
+class PlaybackHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        logging.debug(format % args)
+
+    def do_GET(self):
+        parsed = urlparse(self.path)
+        params = {k: v[-1] for k, v in parse_qs(parsed.query).items()}
+        if parsed.path == "/image.jpg":
+            return self.__send_image(params.get("path", ""))
+        if parsed.path != "/clip.mp4":
+            return self.send_error(404)
+
+        try:
+            camera_id = int(params["camera_id"])
+            start = datetime.fromisoformat(params["start"])
+            end = datetime.fromisoformat(params["end"])
+        except (KeyError, ValueError):
+            return self.send_error(400, "camera_id, start e end são obrigatórios")
+
+        recordings = find_segments(camera_id, start, end)
+        if not recordings:
+            return self.send_error(404, "Nenhuma gravação no intervalo")
+
+        logging.info(
+            f"Reproduzindo câmera {camera_id} de {start} a {end} "
+            f"({len(recordings)} segmentos)"
+        )
+        # Sem Content-Length: o corpo termina quando a conexão é fechada
+        self.send_response(200)
+        self.send_header("Content-Type", "video/mp4")
+        self.send_header("Cache-Control", "no-store")
+        self.end_headers()
+
+        stream = stream_segments(recordings)
+        try:
+            for chunk in stream:
+                self.wfile.write(chunk)
+        except (BrokenPipeError, ConnectionResetError):
+            logging.debug("Cliente encerrou a reprodução")
+        finally:
+            stream.close()
+
+    def __send_image(self, relative_path: str):
+        path = resolve_image(relative_path)
+        if not path:
+            return self.send_error(404, "Imagem não encontrada")
+
+        with open(path, "rb") as image:
+            body = image.read()
+        self.send_response(200)
+        self.send_header("Content-Type", "image/jpeg")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Cache-Control", f"public, max-age={IMAGE_MAX_AGE}")
+        self.end_headers()
+        try:
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            logging.debug("Cliente encerrou o download da imagem")
+
+
+def serve(port: int = PLAYBACK_PORT):
+    server = ThreadingHTTPServer(("0.0.0.0", port), PlaybackHandler)
+    server.daemon_threads = True
+    logging.info(f"Servidor de reprodução em {PLAYBACK_URL} (porta {port})")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="Playback")
+    parser.add_argument("--port", type=int, default=PLAYBACK_PORT)
+    parser.add_argument("--camera", help="camera ID", type=int)
+    parser.add_argument("--start", type=datetime.fromisoformat)
+    parser.add_argument("--end", type=datetime.fromisoformat)
+    parser.add_argument("--output", help="export the range to this file and exit")
+    args = parser.parse_args()
+
+    drive_quota.set_priority(drive_quota.PRIORITY_INTERACTIVE)
+    if args.output:
+        if not export_clip(args.camera, args.start, args.end, args.output):
+            logging.error("Nenhuma gravação no intervalo")
+    else:
+        serve(args.port)
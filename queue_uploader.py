@@ -1,36 +1,201 @@
 import logging
 import os
+import signal
+import threading
+from typing import Optional
+import backpressure
 import camera_model
-from record import upload_video, generate_thumbnail
+import metrics
+import motion
+from drive_client import ChecksumMismatch
+from record import exclude_video_files, process_segment, upload_video
 
 logging.basicConfig(
     level=os.environ.get("LOG_LEVEL", logging.INFO),
-    format="%(asctime)s - %(levelname)s - %(message)s",
+    format="%(asctime)s - %(levelname)s - %(threadName)s - %(message)s",
     datefmt="%Y-%m-%d %H:%M:%S",
 )
 
-def main():
-    for file_to_upload in camera_model.get_upload_queue():
+UPLOAD_WORKERS = int(os.environ.get("UPLOAD_WORKERS", 4))
+UPLOADS_PER_CAMERA = int(os.environ.get("UPLOADS_PER_CAMERA", 2))
+IDLE_INTERVAL = float(os.environ.get("UPLOAD_IDLE_INTERVAL", 2))
+GENERATE_PREVIEW = os.environ.get("GENERATE_PREVIEW", "False") == "True"
+
+stop_event = threading.Event()
+
+
+def triage_segment(
+    file_to_upload: camera_model.UploadQueue,
+    camera_data: camera_model.Camera,
+    recording: Optional[camera_model.Recording],
+) -> str:
+    """Score the segment's motion (once) and return the camera policy to apply."""
+    score = recording.motion_score if recording else None
+    if score is None:
         try:
-            generate_thumbnail(file_to_upload.filename)
+            score = motion.score_segment(file_to_upload.filename)
         except Exception as err:
-            logging.error(err)
-            
-        camera_data = camera_model.get_camera_data(file_to_upload.camera_id)
+            logging.error(
+                f"Erro ao analisar movimento de {file_to_upload.filename}: {err}"
+            )
+            return camera_model.MOTION_ORIGINAL
+        camera_model.update_recording(file_to_upload.filename, motion_score=score)
+
+    policy = motion.triage(camera_data, score)
+    metrics.inc("ipcam_motion_triage_total", camera_id=camera_data.wid, policy=policy)
+    return policy
+
+
+def keep_thumbnail_only(file_to_upload: camera_model.UploadQueue):
+    """Skip the upload of a static segment, keeping just its thumbnail."""
+    outputs = {}
+    try:
+        outputs = process_segment(file_to_upload.filename)
+    except Exception as err:
+        logging.error(err)
+
+    skipped = {"state": camera_model.RECORDING_SKIPPED}
+    skipped.update({f"{name}_path": path for name, path in outputs.items()})
+    if file_to_upload.to_exclude:
+        size = os.path.getsize(file_to_upload.filename)
+        exclude_video_files(file_to_upload.filename, ["_compressed_.mp4"])
+        metrics.inc("ipcam_motion_skipped_bytes_total", size)
+        skipped.update(local=False, compressed_path=None)
+    camera_model.update_recording(file_to_upload.filename, **skipped)
+    logging.info(f"Sem movimento, só a miniatura de {file_to_upload.filename} mantida")
+
+
+def process_upload(file_to_upload: camera_model.UploadQueue):
+    camera_data = camera_model.get_camera_data(file_to_upload.camera_id)
+    recording = camera_model.get_recording(file_to_upload.filename)
+
+    # Uma sessão já iniciada segue com o arquivo que começou a enviar
+    if not file_to_upload.upload_session_uri and os.path.exists(
+        file_to_upload.filename
+    ):
+        policy = triage_segment(file_to_upload, camera_data, recording)
+        if policy == camera_model.MOTION_THUMBNAIL:
+            return keep_thumbnail_only(file_to_upload)
+        if policy == camera_model.MOTION_COMPRESS and not file_to_upload.to_compress:
+            file_to_upload.save_compress(True)
+
+    if (
+        not file_to_upload.upload_session_uri
+        and not file_to_upload.to_compress
+        and backpressure.is_active(backpressure.POLICY_COMPRESS)
+    ):
+        # Com o backlog crescendo, envia a cópia comprimida no lugar do original
+        file_to_upload.save_compress(True)
+        metrics.inc("ipcam_backpressure_compressed_uploads_total")
+
+    compressed_path = file_to_upload.filename.replace(".mp4", "_compressed_.mp4")
+    # Uma sessão retomada precisa dos mesmos bytes já comprimidos
+    resuming = bool(file_to_upload.upload_session_uri) and os.path.exists(
+        compressed_path
+    )
+
+    outputs = {}
+    try:
+        outputs = process_segment(
+            file_to_upload.filename,
+            compress=file_to_upload.to_compress and not resuming,
+            preview=GENERATE_PREVIEW,
+        )
+    except Exception as err:
+        logging.error(err)
+
+    if outputs:
+        camera_model.update_recording(
+            file_to_upload.filename,
+            **{f"{name}_path": path for name, path in outputs.items()},
+        )
 
+    drive_id = upload_video(
+        file_to_upload.filename,
+        file_to_upload.camera_id,
+        camera_data.name,
+        to_compress=file_to_upload.to_compress,
+        to_exclude=file_to_upload.to_exclude,
+        suffix_to_exclude=["_processed_.mp4", "_compressed_.mp4"],
+        resume_uri=(
+            None if "compressed" in outputs else file_to_upload.upload_session_uri
+        ),
+        on_chunk=file_to_upload.save_upload_progress,
+        compressed_path=outputs.get("compressed"),
+        record_date=recording.start_time.date() if recording else None,
+    )
+
+    if not drive_id:
+        # O segmento sumiu do disco (spill ou retenção) antes de ser enviado
+        logging.warning(f"{file_to_upload.filename} não existe mais, upload descartado")
+        camera_model.update_recording(
+            file_to_upload.filename, state=camera_model.RECORDING_FAILED, local=False
+        )
+        return
+
+    uploaded = {"state": camera_model.RECORDING_UPLOADED, "drive_id": drive_id}
+    if file_to_upload.to_exclude:
+        uploaded.update(local=False, compressed_path=None, preview_path=None)
+    camera_model.update_recording(file_to_upload.filename, **uploaded)
+
+
+def worker():
+    while not stop_event.is_set():
+        claimed = camera_model.claim(1, max_per_camera=UPLOADS_PER_CAMERA)
+        if not claimed:
+            stop_event.wait(IDLE_INTERVAL)
+            continue
+
+        file_to_upload = claimed[0]
         try:
-            upload_video(
-                file_to_upload.filename,
-                file_to_upload.camera_id,
-                camera_data.name,
-                to_compress=file_to_upload.to_compress,
-                to_exclude=file_to_upload.to_exclude,
-                suffix_to_exclude=["_processed_.mp4", "_compressed_.mp4"],
-            )
+            process_upload(file_to_upload)
         except Exception as err:
             logging.error(err)
-            file_to_upload.put()
-        
+            # A sessão concluída com bytes errados não pode ser retomada
+            file_to_upload.nack(
+                str(err), reset_session=isinstance(err, ChecksumMismatch)
+            )
+            if file_to_upload.status == camera_model.QUEUE_DEAD:
+                camera_model.update_recording(
+                    file_to_upload.filename, state=camera_model.RECORDING_FAILED
+                )
+                logging.error(
+                    f"Upload de {file_to_upload.filename} movido para dead-letter "
+                    f"após {file_to_upload.attempts} tentativas"
+                )
+            continue
+
+        file_to_upload.ack()
+
+
+def stop(signum=None, frame=None):
+    logging.warning("🛑 Encerrando workers de upload...")
+    stop_event.set()
+
+
+def main(workers: int = UPLOAD_WORKERS):
+    threads = [
+        threading.Thread(target=worker, name=f"uploader-{index}")
+        for index in range(workers)
+    ]
+    # O monitor de backpressure acompanha a fila que estes workers drenam
+    threads.append(
+        threading.Thread(
+            target=backpressure.run, args=(stop_event,), name="backpressure"
+        )
+    )
+    for thread in threads:
+        thread.start()
+
+    logging.info(
+        f"{workers} workers de upload iniciados ({UPLOADS_PER_CAMERA} por câmera)"
+    )
+    for thread in threads:
+        thread.join()
+
 
 if __name__ == "__main__":
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
     main()
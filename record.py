@@ -2,19 +2,77 @@ import datetime
 import logging
 import os
 import signal
+import socket
 import subprocess
 import sys
-from typing import Optional
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional
 from pathlib import Path
-from queue import Queue
+from queue import PriorityQueue, Queue
 import argparse
 
+import backpressure
 import camera_model
-from drive_client import create_camera_path, create_date_path, upload_file
+import metrics
+from utils import duration_to_seconds, file_md5
 
 base_dir = "shared/recs"
+# Data e hora de início no nome do segmento: nomes únicos e em ordem cronológica
+SEGMENT_TIME_FORMAT = "%Y-%m-%d_%H-%M-%S"
 upload_queue = Queue()
 camera = None
+recorder_process: Optional[subprocess.Popen] = None
+# Parada pedida: o código de saída do ffmpeg encerrado não é erro
+_stopping = False
+
+# Jobs de transcodificação dividem os núcleos sem competir com as gravações
+TRANSCODE_WORKERS = int(
+    os.environ.get("TRANSCODE_WORKERS", max((os.cpu_count() or 1) // 2, 1))
+)
+TRANSCODE_THREADS = int(
+    os.environ.get(
+        "TRANSCODE_THREADS", max((os.cpu_count() or 1) // TRANSCODE_WORKERS, 1)
+    )
+)
+TRANSCODE_NICE = int(os.environ.get("TRANSCODE_NICE", 10))
+
+# Microssegundos que o ffmpeg analisa o stream antes de gravar; o padrão (5 s)
+# atrasa o primeiro frame de cada gravador iniciado
+RTSP_ANALYZE_DURATION = os.environ.get("RTSP_ANALYZE_DURATION", "1000000")
+RTSP_INPUT_OPTIONS = [
+    "-rtsp_transport",
+    "tcp",
+    "-analyzeduration",
+    RTSP_ANALYZE_DURATION,
+]
+
+PRIORITY_THUMBNAIL = 0
+PRIORITY_UPLOAD = 1
+PRIORITY_PREVIEW = 2
+# Rótulo "job" das métricas de ffmpeg por prioridade
+TRANSCODE_JOBS = {
+    PRIORITY_THUMBNAIL: "thumbnail",
+    PRIORITY_UPLOAD: "upload",
+    PRIORITY_PREVIEW: "preview",
+}
+
+transcode_queue = PriorityQueue()
+transcode_stats = {
+    "running": 0,
+    "completed": 0,
+    "failed": 0,
+    "durations": deque(maxlen=100),
+}
+_transcode_lock = threading.Lock()
+_transcode_workers: List[threading.Thread] = []
+_transcode_sequence = 0
+# Identifica o pool deste processo nos gauges da fila de transcodificação
+TRANSCODE_POOL = f"{socket.gethostname()}-{os.getpid()}"
+# Horário do último segmento de cada câmera, para medir os intervalos
+_last_segment: Dict[int, float] = {}
 
 logging.basicConfig(
     level=os.environ.get("LOG_LEVEL", logging.INFO),
@@ -30,26 +88,62 @@ def upload_video(
     to_compress: Optional[bool] = False,
     to_exclude: Optional[bool] = False,
     suffix_to_exclude: Optional[list] = ["_compressed_.mp4"],
+    resume_uri: Optional[str] = None,
+    on_chunk: Optional[Callable[[str, int], None]] = None,
+    compressed_path: Optional[str] = None,
+    record_date: Optional[datetime.date] = None,
 ):
     if not os.path.exists(video_path):
         logging.warning("Video nao encontrado")
         return
 
+    # O cliente do Drive (googleapiclient, google-auth) só é carregado por quem envia
+    from drive_client import create_camera_path, create_date_path, upload_file
+
     camera_remote_folder_id = create_camera_path(camera_name)
 
     camera_data = camera_model.get_camera_data(camera_id)
     camera_data.set_uri(camera_remote_folder_id)
 
-    file_to_upload = video_path
-    if to_compress:
-        logging.debug(f"Comprimindo {video_path}...")
-        file_to_upload = compress_video(video_path)
+    if record_date is None:
+        # Sem a data do catálogo, usa a do fechamento do arquivo
+        record_date = datetime.date.fromtimestamp(os.path.getmtime(video_path))
+    date_folder_id = create_date_path(camera_remote_folder_id, record_date)
 
-    upload_file(file_to_upload, camera_remote_folder_id)
+    file_to_upload = video_path
+    if compressed_path:
+        # Cópia comprimida já gerada pelo process_segment
+        file_to_upload = compressed_path
+    elif to_compress:
+        compressed_path = video_path.replace(".mp4", "_compressed_.mp4")
+        if resume_uri and os.path.exists(compressed_path):
+            # A sessão retomada pertence ao arquivo já comprimido
+            file_to_upload = compressed_path
+        else:
+            logging.debug(f"Comprimindo {video_path}...")
+            resume_uri = None
+            file_to_upload = compress_video(video_path)
+
+    # Manifesto gravado antes do envio, para a conferência com o md5Checksum
+    md5 = file_md5(file_to_upload)
+    camera_model.update_recording(
+        video_path, md5=md5, uploaded_size=os.path.getsize(file_to_upload)
+    )
+    file_id = upload_file(
+        file_to_upload,
+        date_folder_id,
+        resume_uri=resume_uri,
+        on_chunk=on_chunk,
+        md5=md5,
+    )
+    # upload_file só retorna depois que o Drive confirmou o mesmo MD5
+    camera_model.update_recording(video_path, verified_at=time.time())
 
     if to_exclude:
         exclude_video_files(video_path, suffix_to_exclude)
 
+    return file_id
+
 
 def exclude_video_files(video_path: str, files_suffix: Optional[list] = []):
     if video_path.endswith("_.mp4"):
@@ -64,114 +158,484 @@ def exclude_video_files(video_path: str, files_suffix: Optional[list] = []):
             logging.debug(f"Arquivo removido: {f}")
 
 
+def __transcode_worker():
+    while True:
+        priority, _, cmd, future, submitted, job = transcode_queue.get()
+        if not future.set_running_or_notify_cancel():
+            continue
+
+        job = job or TRANSCODE_JOBS.get(priority, str(priority))
+        with _transcode_lock:
+            transcode_stats["running"] += 1
+        __publish_transcode_stats()
+        started = time.monotonic()
+        metrics.observe("ipcam_transcode_wait_seconds", started - submitted, job=job)
+        try:
+            result = subprocess.run(
+                cmd,
+                check=True,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+            )
+            future.set_result(result)
+            outcome = "completed"
+        except Exception as err:
+            future.set_exception(err)
+            outcome = "failed"
+
+        duration = time.monotonic() - started
+        with _transcode_lock:
+            transcode_stats["running"] -= 1
+            transcode_stats[outcome] += 1
+            transcode_stats["durations"].append(duration)
+        __publish_transcode_stats()
+        metrics.observe("ipcam_ffmpeg_seconds", duration, job=job, outcome=outcome)
+        logging.debug(f"Transcode {outcome} em {duration:.1f}s: {cmd[-1]}")
+
+
+def submit_transcode(
+    cmd: List[str], priority: int = PRIORITY_UPLOAD, job: Optional[str] = None
+) -> Future:
+    """Queue an ffmpeg encode on the bounded transcode pool.
+
+    Jobs run under ``nice`` so live recording always wins the CPU, and lower
+    ``priority`` values are started first. Commands should limit each output with
+    ``transcode_threads()``. ``job`` overrides the metrics label of the priority.
+    """
+    global _transcode_sequence
+
+    cmd = ["nice", "-n", str(TRANSCODE_NICE)] + cmd
+    future = Future()
+    with _transcode_lock:
+        while len(_transcode_workers) < TRANSCODE_WORKERS:
+            worker = threading.Thread(
+                target=__transcode_worker,
+                name=f"transcode-{len(_transcode_workers)}",
+                daemon=True,
+            )
+            worker.start()
+            _transcode_workers.append(worker)
+        _transcode_sequence += 1
+        transcode_queue.put(
+            (priority, _transcode_sequence, cmd, future, time.monotonic(), job)
+        )
+    __publish_transcode_stats()
+
+    return future
+
+
+def transcode_threads() -> List[str]:
+    return ["-threads", str(TRANSCODE_THREADS)]
+
+
+def get_transcode_stats() -> dict:
+    with _transcode_lock:
+        durations = list(transcode_stats["durations"])
+        return {
+            "queued": transcode_queue.qsize(),
+            "running": transcode_stats["running"],
+            "completed": transcode_stats["completed"],
+            "failed": transcode_stats["failed"],
+            "avg_duration": sum(durations) / len(durations) if durations else 0,
+            "max_duration": max(durations, default=0),
+        }
+
+
+def __publish_transcode_stats():
+    stats = get_transcode_stats()
+    metrics.set_gauge("ipcam_transcode_queued", stats["queued"], pool=TRANSCODE_POOL)
+    metrics.set_gauge("ipcam_transcode_running", stats["running"], pool=TRANSCODE_POOL)
+
+
+COMPRESS_OPTIONS = ["-vcodec", "libx264", "-crf", "28", "-preset", "fast"]
+PREVIEW_OPTIONS = [
+    "-c:v",
+    "mpeg4",
+    "-b:v",
+    "500k",
+    "-c:a",
+    "aac",
+    "-movflags",
+    "+faststart",
+]
+THUMBNAIL_OPTIONS = ["-frames:v", "1", "-q:v", "5"]
+# Miniaturas em dois tamanhos: a média é aberta no painel, a pequena vira um
+# quadro da folha de contato (sprite) da hora e depois é apagada
+THUMBNAIL_MEDIUM_WIDTH = int(os.environ.get("THUMBNAIL_MEDIUM_WIDTH", 480))
+THUMBNAIL_SMALL_WIDTH = int(os.environ.get("THUMBNAIL_SMALL_WIDTH", 160))
+THUMBNAIL_SMALL_HEIGHT = int(os.environ.get("THUMBNAIL_SMALL_HEIGHT", 90))
+# Quadros de tamanho fixo (com bordas) para que o sprite seja uma grade regular
+THUMBNAIL_SMALL_FILTER = (
+    f"scale={THUMBNAIL_SMALL_WIDTH}:{THUMBNAIL_SMALL_HEIGHT}"
+    ":force_original_aspect_ratio=decrease,"
+    f"pad={THUMBNAIL_SMALL_WIDTH}:{THUMBNAIL_SMALL_HEIGHT}:(ow-iw)/2:(oh-ih)/2"
+)
+THUMBNAIL_SEEK = "trim=start=1,setpts=PTS-STARTPTS"
+
+
 def compress_video(input_path: str):
     output_path = input_path.replace(".mp4", "_compressed_.mp4")
     cmd = [
         "ffmpeg",
+        "-y",
         "-i",
         input_path,
-        "-vcodec",
-        "libx264",
-        "-crf",
-        "28",
-        "-preset",
-        "fast",
+        *COMPRESS_OPTIONS,
+        *transcode_threads(),
         output_path,
     ]
-    subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    submit_transcode(cmd, PRIORITY_UPLOAD).result()
     return output_path
 
 
-def prepare_video_to_view(video_path: str):
-    cmd = [
-        "ffmpeg",
-        "-i",
-        video_path,
-        "-vf",
-        "scale=640:-2",
-        "-c:v",
-        "mpeg4",
-        "-b:v",
-        "500k",
-        "-c:a",
-        "aac",
-        "-movflags",
-        "+faststart",
-        video_path.replace(".mp4", "_processed_.mp4"),
-    ]
-    subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
-
+def process_segment(
+    video_path: str,
+    thumbnail: bool = True,
+    compress: bool = False,
+    preview: bool = False,
+) -> Dict[str, str]:
+    """Write the thumbnails, compressed copy and preview from a single decode.
+
+    One ffmpeg filter graph splits the decoded video into every requested output,
+    instead of one ffmpeg run (and one decode) per output. Returns the paths
+    written, keyed by ``thumbnail`` (medium tier), ``thumbnail_small``,
+    ``compressed`` and ``preview``.
+    """
+    branches = {
+        "thumbnail": (
+            thumbnail,
+            f"{THUMBNAIL_SEEK},scale={THUMBNAIL_MEDIUM_WIDTH}:-2",
+            [*THUMBNAIL_OPTIONS],
+            video_path.replace(".mp4", ".jpg"),
+        ),
+        "thumbnail_small": (
+            thumbnail,
+            f"{THUMBNAIL_SEEK},{THUMBNAIL_SMALL_FILTER}",
+            [*THUMBNAIL_OPTIONS],
+            video_path.replace(".mp4", "_small_.jpg"),
+        ),
+        "compressed": (
+            compress,
+            "null",
+            ["-map", "0:a?", *COMPRESS_OPTIONS, *transcode_threads()],
+            video_path.replace(".mp4", "_compressed_.mp4"),
+        ),
+        "preview": (
+            preview,
+            "scale=640:-2",
+            ["-map", "0:a?", *PREVIEW_OPTIONS, *transcode_threads()],
+            video_path.replace(".mp4", "_processed_.mp4"),
+        ),
+    }
+    branches = {name: branch for name, branch in branches.items() if branch[0]}
+    if not branches:
+        return {}
+
+    labels = "".join(f"[{name}_in]" for name in branches)
+    filter_graph = [f"[0:v]split={len(branches)}{labels}"]
+    outputs = []
+    for name, (_, video_filter, options, output_path) in branches.items():
+        filter_graph.append(f"[{name}_in]{video_filter}[{name}]")
+        outputs += ["-map", f"[{name}]", *options, output_path]
 
-def generate_thumbnail(video_path):
-    thumb_path = video_path.replace(".mp4", ".jpg")
-    thumb_cmd = [
+    cmd = [
         "ffmpeg",
         "-y",
-        "-ss",
-        "00:00:01",
         "-i",
         video_path,
-        "-vframes",
-        "1",
-        "-q:v",
-        "2",
-        thumb_path,
+        "-filter_complex",
+        ";".join(filter_graph),
+        "-filter_complex_threads",
+        str(TRANSCODE_THREADS),
+        *outputs,
     ]
-    subprocess.run(thumb_cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    priority = PRIORITY_UPLOAD if compress else PRIORITY_THUMBNAIL
+    submit_transcode(cmd, priority).result()
 
+    return {name: branch[3] for name, branch in branches.items()}
 
-def start_recording(rtsp_url: str, camera: camera_model.Camera):
-    now = datetime.datetime.now()
 
+def segment_path(camera: camera_model.Camera, start: datetime.datetime) -> str:
+    """Unused path for a segment of ``camera`` starting at ``start``."""
     output_dir = f"{base_dir}/{camera.normalized_name()}"
     os.makedirs(output_dir, exist_ok=True)
 
-    filename = f"{camera.normalized_name()}_{now.strftime('%H:%M')}.mp4"
-    output_path = os.path.join(output_dir, filename)
+    name = f"{camera.normalized_name()}_{start.strftime(SEGMENT_TIME_FORMAT)}"
+    output_path = os.path.join(output_dir, f"{name}.mp4")
+    # Dois segmentos no mesmo segundo (ex.: gravador reiniciado) ganham sufixo
+    index = 1
+    while os.path.exists(output_path):
+        output_path = os.path.join(output_dir, f"{name}_{index}.mp4")
+        index += 1
+    return output_path
+
+
+def segment_start_time(
+    camera: camera_model.Camera, filename: str
+) -> Optional[datetime.datetime]:
+    """Start time encoded in a segment name, if it uses ``SEGMENT_TIME_FORMAT``."""
+    stem = os.path.basename(filename)[len(camera.normalized_name()) + 1 :]
+    try:
+        return datetime.datetime.strptime(stem[:19], SEGMENT_TIME_FORMAT)
+    except ValueError:
+        return None
+
+
+def video_options(camera: camera_model.Camera, bitrate: Optional[str]) -> List[str]:
+    """Copy the camera's video stream, or re-encode it at ``bitrate``."""
+    if not bitrate:
+        return ["-vcodec", "copy"]
+
+    # Keyframes forçados no início de cada segmento para o corte do muxer
+    segment_seconds = duration_to_seconds(camera.segment_duration)
+    return [
+        "-vcodec",
+        "libx264",
+        "-preset",
+        "veryfast",
+        "-b:v",
+        bitrate,
+        "-maxrate",
+        bitrate,
+        "-bufsize",
+        bitrate,
+        "-force_key_frames",
+        f"expr:gte(t,n_forced*{segment_seconds})",
+    ]
+
+
+def start_recording(rtsp_url: str, camera: camera_model.Camera):
+    output_path = segment_path(camera, datetime.datetime.now())
+    filename = os.path.basename(output_path)
 
     logging.info(f"🎥 Gravando: {filename}")
     logging.debug(rtsp_url)
 
     cmd = [
         "ffmpeg",
-        "-rtsp_transport",
-        "tcp",
+        *RTSP_INPUT_OPTIONS,
         "-i",
         rtsp_url,
         "-t",
         camera.segment_duration,
-        "-vcodec",
-        "copy",
+        # Cada segmento é um novo ffmpeg: a política de bitrate vale já no próximo
+        *video_options(camera, backpressure.recording_bitrate()),
         "-acodec",
         "aac",
         "-strict",
         "-2",
-        "-y",
+        "-n",
         output_path,
     ]
-    subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    started = time.monotonic()
+    outcome = "failed"
+    try:
+        subprocess.run(
+            cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+        )
+        outcome = "completed"
+    finally:
+        metrics.observe(
+            "ipcam_ffmpeg_seconds",
+            time.monotonic() - started,
+            job="record",
+            outcome=outcome,
+        )
 
     return output_path
 
 
-def start_monitoring(camera: camera_model.Camera):
-    rtsp = f"rtsp://{camera.user}:{camera.passw}@{camera.ip}/stream"
+def continuous_recording_cmd(
+    rtsp_url: str, camera: camera_model.Camera, bitrate: Optional[str] = None
+):
+    """Build the segment-muxer ffmpeg command and return it with its output dir.
 
-    filename = start_recording(rtsp, camera)
+    Args:
+        bitrate (str): Re-encode the video at this bitrate instead of copying the
+            camera stream, e.g. while the upload backlog is under pressure.
+    """
+    output_dir = f"{base_dir}/{camera.normalized_name()}"
+    os.makedirs(output_dir, exist_ok=True)
+
+    output_pattern = os.path.join(
+        output_dir, f"{camera.normalized_name()}_{SEGMENT_TIME_FORMAT}.mp4"
+    )
+
+    cmd = [
+        "ffmpeg",
+        *RTSP_INPUT_OPTIONS,
+        "-i",
+        rtsp_url,
+        *video_options(camera, bitrate),
+        "-acodec",
+        "aac",
+        "-strict",
+        "-2",
+        "-f",
+        "segment",
+        "-segment_time",
+        camera.segment_duration,
+        "-segment_format",
+        "mp4",
+        "-reset_timestamps",
+        "1",
+        "-strftime",
+        "1",
+        "-segment_list",
+        "pipe:1",
+        "-segment_list_type",
+        "flat",
+        "-y",
+        output_pattern,
+    ]
+    return cmd, output_dir
+
+
+def start_continuous_recording(
+    rtsp_url: str, camera: camera_model.Camera, on_segment: Callable[[str], None]
+):
+    """Keep a single RTSP session open and roll files with ffmpeg's segment muxer.
+
+    Each closed segment is reported by ffmpeg on stdout (``-segment_list pipe:1``)
+    and handed to ``on_segment`` as soon as it is written. The bitrate policy is
+    read once here; in container mode the orchestrator recreates the recorder
+    when it changes.
+    """
+    global recorder_process
+
+    cmd, output_dir = continuous_recording_cmd(
+        rtsp_url, camera, backpressure.recording_bitrate()
+    )
+
+    logging.info(f"🎥 Gravando continuamente: {cmd[-1]}")
+    logging.debug(rtsp_url)
+
+    recorder_process = subprocess.Popen(
+        cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True, bufsize=1
+    )
+
+    for line in recorder_process.stdout:
+        segment_name = line.strip()
+        if not segment_name:
+            continue
+
+        segment_path = os.path.join(output_dir, os.path.basename(segment_name))
+        logging.info(f"🎞️ Segmento finalizado: {segment_path}")
+        try:
+            on_segment(segment_path)
+        except Exception as err:
+            logging.error(f"Erro ao enfileirar {segment_path}: {err}")
+
+    returncode = recorder_process.wait()
+    if returncode != 0 and not _stopping:
+        raise subprocess.CalledProcessError(returncode, cmd)
+
+
+def get_rtsp_url(camera: camera_model.Camera) -> str:
+    return f"rtsp://{camera.user}:{camera.passw}@{camera.ip}/stream"
+
+
+def start_monitoring(camera: camera_model.Camera):
+    filename = start_recording(get_rtsp_url(camera), camera)
 
     return filename
 
 
-def start(camera: camera_model.Camera):
+def catalog_segment(camera: camera_model.Camera, filename: str):
+    duration = duration_to_seconds(camera.segment_duration)
+    stat = os.stat(filename)
+    start_time = segment_start_time(camera, filename)
+    if start_time is None:
+        # Nomes antigos só têm a hora: o segmento é fechado ao final da gravação
+        start_time = datetime.datetime.fromtimestamp(
+            stat.st_mtime
+        ) - datetime.timedelta(seconds=duration)
+    camera_model.Recording(
+        camera_id=camera.wid,
+        path=filename,
+        start_time=start_time,
+        duration=duration,
+        size=stat.st_size,
+    ).save()
+
+
+def record_segment_metrics(camera: camera_model.Camera, filename: str):
+    """Count a closed segment and observe the gap since the camera's previous one."""
+    now = time.time()
+    previous = _last_segment.get(camera.wid)
+    _last_segment[camera.wid] = now
+
+    metrics.inc("ipcam_segments_total", camera_id=camera.wid)
+    metrics.inc(
+        "ipcam_segment_bytes_total", os.path.getsize(filename), camera_id=camera.wid
+    )
+    metrics.set_gauge("ipcam_last_segment_timestamp", now, camera_id=camera.wid)
+    if previous is not None:
+        metrics.observe(
+            "ipcam_segment_interval_seconds", now - previous, camera_id=camera.wid
+        )
+
+
+def enqueue_segment(camera: camera_model.Camera, filename: str):
+    try:
+        record_segment_metrics(camera, filename)
+    except Exception as err:
+        logging.error(f"Erro ao registrar métricas de {filename}: {err}")
+
+    try:
+        catalog_segment(camera, filename)
+    except Exception as err:
+        logging.error(f"Erro ao catalogar {filename}: {err}")
+
+    upload_queue = camera_model.UploadQueue(filename=filename, camera_id=camera.wid)
+    upload_queue.put()
+
+
+def start(camera: camera_model.Camera, continuous: bool = False):
     logging.info(
         f"Recording segments for {camera.name} with {camera.segment_duration} of duration"
     )
+    if continuous:
+        start_continuous_recording(
+            get_rtsp_url(camera),
+            camera,
+            lambda filename: enqueue_segment(camera, filename),
+        )
+        return
+
     filename = start_monitoring(camera)
-    upload_queue = camera_model.UploadQueue(filename=filename, camera_id=camera.wid)
-    upload_queue.put()
+    enqueue_segment(camera, filename)
+
+
+def stop_recorder_process():
+    global _stopping
+
+    if recorder_process is None or recorder_process.poll() is not None:
+        return
+
+    _stopping = True
+    # SIGTERM faz o ffmpeg fechar o segmento atual corretamente
+    recorder_process.terminate()
+    try:
+        recorder_process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        recorder_process.kill()
+
+
+def handle_stop_signal(signum, frame):
+    """Stop ffmpeg and let the continuous loop enqueue the segment it closes.
+
+    ffmpeg prints the last segment name on exit; ``start_continuous_recording``
+    reads it until EOF and returns, and ``cleanup_and_exit`` runs after it.
+    """
+    if recorder_process is not None and recorder_process.poll() is None:
+        stop_recorder_process()
+        return
+    cleanup_and_exit()
 
 
 def cleanup_and_exit(signum=None, frame=None):
+    stop_recorder_process()
     if camera:
         try:
             camera.set_status(False)
@@ -182,18 +646,23 @@ def cleanup_and_exit(signum=None, frame=None):
 
 
 if __name__ == "__main__":
-    signal.signal(signal.SIGTERM, cleanup_and_exit)
-    signal.signal(signal.SIGINT, cleanup_and_exit)
+    signal.signal(signal.SIGTERM, handle_stop_signal)
+    signal.signal(signal.SIGINT, handle_stop_signal)
 
     parser = argparse.ArgumentParser(prog="Record Camera", add_help=False)
     parser.add_argument("--camera", help="camera ID", type=int, required=True)
-    camera_id = parser.parse_args().camera
+    parser.add_argument(
+        "--continuous",
+        help="keep one ffmpeg session open and roll segments",
+        action="store_true",
+    )
+    args = parser.parse_args()
 
-    camera = camera_model.get_camera_data(camera_id)
+    camera = camera_model.get_camera_data(args.camera)
 
     try:
         camera.set_status(True)
-        start(camera)
+        start(camera, continuous=args.continuous)
     except Exception as err:
         logging.error(err)
     finally:
@@ -0,0 +1,201 @@
+import asyncio
+import logging
+import os
+import signal
+import time
+from typing import Dict, Optional
+
+import backpressure
+import camera_model
+from record import continuous_recording_cmd, enqueue_segment, get_rtsp_url
+from utils import duration_to_seconds
+
+logging.basicConfig(
+    level=os.environ.get("LOG_LEVEL", logging.INFO),
+    format="%(asctime)s - %(levelname)s - %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+
+# Intervalo para reler a tabela de câmeras e verificar a saúde dos gravadores
+RECONCILE_INTERVAL = int(os.environ.get("SUPERVISOR_RECONCILE_INTERVAL", 30))
+RESTART_BACKOFF_BASE = int(os.environ.get("SUPERVISOR_BACKOFF_BASE", 2))
+RESTART_BACKOFF_MAX = int(os.environ.get("SUPERVISOR_BACKOFF_MAX", 300))
+# Folga além de 2 segmentos sem novo arquivo antes de reiniciar o ffmpeg
+HEALTH_GRACE = int(os.environ.get("SUPERVISOR_HEALTH_GRACE", 30))
+
+
+def camera_signature(camera: camera_model.Camera) -> tuple:
+    return (
+        camera.name,
+        camera.ip,
+        camera.user,
+        camera.passw,
+        camera.segment_duration,
+    )
+
+
+class CameraRecorder:
+    """One camera's ffmpeg child, restarted with exponential backoff when it dies."""
+
+    def __init__(self, camera: camera_model.Camera, bitrate: Optional[str] = None):
+        self.camera = camera
+        self.signature = camera_signature(camera)
+        self.bitrate = bitrate
+        self.process: Optional[asyncio.subprocess.Process] = None
+        self.task: Optional[asyncio.Task] = None
+        self.failures = 0
+        self.last_segment_at = time.monotonic()
+
+    def start(self):
+        self.task = asyncio.create_task(self.run(), name=f"camera-{self.camera.wid}")
+
+    async def run(self):
+        while True:
+            started = time.monotonic()
+            try:
+                await self.record()
+            except asyncio.CancelledError:
+                raise
+            except Exception as err:
+                logging.error(f"Câmera {self.camera.name}: {err}")
+
+            # Uma sessão que durou mais que o backoff máximo zera as falhas
+            if time.monotonic() - started > RESTART_BACKOFF_MAX:
+                self.failures = 0
+            self.failures += 1
+            delay = min(
+                RESTART_BACKOFF_BASE * 2 ** (self.failures - 1), RESTART_BACKOFF_MAX
+            )
+            logging.warning(
+                f"Gravação da câmera {self.camera.name} parou, "
+                f"reiniciando em {delay}s (falha {self.failures})"
+            )
+            await asyncio.sleep(delay)
+
+    async def record(self):
+        cmd, output_dir = continuous_recording_cmd(
+            get_rtsp_url(self.camera), self.camera, self.bitrate
+        )
+        self.process = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL,
+        )
+        self.last_segment_at = time.monotonic()
+        logging.info(f"🎥 Gravando {self.camera.name} (pid {self.process.pid})")
+        await asyncio.to_thread(self.camera.set_status, True)
+
+        try:
+            async for line in self.process.stdout:
+                await self.handle_segment(line, output_dir)
+
+            returncode = await self.process.wait()
+            raise RuntimeError(f"ffmpeg saiu com código {returncode}")
+        finally:
+            await self.terminate()
+            # O ffmpeg informa o último segmento ao fechar
+            for line in (await self.process.stdout.read()).splitlines():
+                await self.handle_segment(line, output_dir)
+            await asyncio.to_thread(self.camera.set_status, False)
+
+    async def handle_segment(self, line: bytes, output_dir: str):
+        segment_name = line.decode().strip()
+        if not segment_name:
+            return
+
+        self.last_segment_at = time.monotonic()
+        segment_path = os.path.join(output_dir, os.path.basename(segment_name))
+        logging.info(f"🎞️ Segmento finalizado: {segment_path}")
+        try:
+            await asyncio.to_thread(enqueue_segment, self.camera, segment_path)
+        except Exception as err:
+            logging.error(f"Erro ao enfileirar {segment_path}: {err}")
+
+    def is_healthy(self) -> bool:
+        if self.process is None or self.process.returncode is not None:
+            # Aguardando o backoff; o loop de run() cuida do reinício
+            return True
+
+        max_silence = 2 * duration_to_seconds(self.camera.segment_duration)
+        return time.monotonic() - self.last_segment_at <= max_silence + HEALTH_GRACE
+
+    async def terminate(self):
+        if self.process is None or self.process.returncode is not None:
+            return
+
+        # SIGTERM faz o ffmpeg fechar o segmento atual corretamente
+        self.process.terminate()
+        try:
+            await asyncio.wait_for(self.process.wait(), timeout=10)
+        except asyncio.TimeoutError:
+            self.process.kill()
+            await self.process.wait()
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+
+
+async def reconcile(recorders: Dict[int, CameraRecorder]):
+    cameras = {
+        camera.wid: camera for camera in await asyncio.to_thread(camera_model.list_cameras)
+    }
+    bitrate = await asyncio.to_thread(backpressure.recording_bitrate)
+
+    for camera_id in set(recorders) - set(cameras):
+        recorder = recorders.pop(camera_id)
+        logging.info(f"🛑 Câmera {recorder.camera.name} removida, parando gravação")
+        await recorder.stop()
+
+    for camera_id, camera in cameras.items():
+        recorder = recorders.get(camera_id)
+        if recorder is not None and recorder.signature != camera_signature(camera):
+            logging.info(f"🔁 Câmera {camera.name} alterada, reiniciando gravação")
+            await recorder.stop()
+            recorder = None
+        elif recorder is not None and recorder.bitrate != bitrate:
+            logging.info(
+                f"🔁 Backpressure alterou o bitrate da câmera {camera.name} "
+                f"para {bitrate or 'original'}, reiniciando gravação"
+            )
+            await recorder.stop()
+            recorder = None
+
+        if recorder is None:
+            recorders[camera_id] = CameraRecorder(camera, bitrate)
+            recorders[camera_id].start()
+        elif not recorder.is_healthy():
+            logging.warning(
+                f"Câmera {camera.name} sem novos segmentos, reiniciando o ffmpeg"
+            )
+            await recorder.terminate()
+
+
+async def supervise():
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, stop_event.set)
+
+    recorders: Dict[int, CameraRecorder] = {}
+    while not stop_event.is_set():
+        try:
+            await reconcile(recorders)
+        except Exception as err:
+            logging.error(f"Erro ao reconciliar câmeras: {err}")
+
+        try:
+            await asyncio.wait_for(stop_event.wait(), timeout=RECONCILE_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+
+    logging.warning("🛑 Recebido sinal de encerramento. Parando gravações...")
+    await asyncio.gather(*(recorder.stop() for recorder in recorders.values()))
+
+
+if __name__ == "__main__":
+    asyncio.run(supervise())
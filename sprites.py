@@ -0,0 +1,159 @@
+import datetime
+import logging
+import os
+import tempfile
+from typing import List, Tuple
+
+import camera_model
+import metrics
+from record import (
+    PRIORITY_PREVIEW,
+    SEGMENT_TIME_FORMAT,
+    THUMBNAIL_OPTIONS,
+    base_dir,
+    segment_start_time,
+    submit_transcode,
+)
+
+# Grade fixa de cada folha de contato: com segmentos de 30 s uma hora cabe em uma
+SPRITE_COLUMNS = int(os.environ.get("SPRITE_COLUMNS", 10))
+SPRITE_ROWS = int(os.environ.get("SPRITE_ROWS", 12))
+SPRITE_TILES = SPRITE_COLUMNS * SPRITE_ROWS
+# Espera após o fim da hora para que os últimos segmentos sejam processados
+SPRITE_DELAY = int(os.environ.get("SPRITE_DELAY", 600))
+# Gravações lidas do catálogo por consulta
+SPRITE_BATCH = int(os.environ.get("SPRITE_BATCH", 1000))
+
+
+def sprite_dir(camera: camera_model.Camera) -> str:
+    return os.path.join(base_dir, camera.normalized_name(), "sprites")
+
+
+def sprite_path(camera: camera_model.Camera, hour: datetime.datetime) -> str:
+    """Unused path for a sprite of ``camera`` covering ``hour``."""
+    output_dir = sprite_dir(camera)
+    os.makedirs(output_dir, exist_ok=True)
+
+    name = f"{camera.normalized_name()}_{hour.strftime(SEGMENT_TIME_FORMAT)}"
+    output_path = os.path.join(output_dir, f"{name}.jpg")
+    # Segmentos que chegam depois do sprite da hora ganham uma folha própria
+    index = 1
+    while os.path.exists(output_path):
+        output_path = os.path.join(output_dir, f"{name}_{index}.jpg")
+        index += 1
+    return output_path
+
+
+def tile_position(index: int) -> Tuple[int, int]:
+    """Column and row of tile ``index`` in a sprite."""
+    return index % SPRITE_COLUMNS, index // SPRITE_COLUMNS
+
+
+def build_sprite(output_path: str, thumbnails: List[str]):
+    """Tile up to ``SPRITE_TILES`` small thumbnails into one JPEG, row by row."""
+    with tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False) as list_file:
+        for path in thumbnails:
+            escaped = os.path.abspath(path).replace("'", "'\\''")
+            list_file.write(f"file '{escaped}'\n")
+
+    cmd = [
+        "ffmpeg",
+        "-y",
+        "-loglevel",
+        "error",
+        "-f",
+        "concat",
+        "-safe",
+        "0",
+        "-i",
+        list_file.name,
+        "-vf",
+        f"tile={SPRITE_COLUMNS}x{SPRITE_ROWS}",
+        *THUMBNAIL_OPTIONS,
+        output_path,
+    ]
+    try:
+        submit_transcode(cmd, PRIORITY_PREVIEW, job="sprite").result()
+    finally:
+        os.remove(list_file.name)
+
+
+def discard_tiles(recordings: List[camera_model.Recording]):
+    """Drop the small thumbnails of a sheet that could not be built."""
+    for recording in recordings:
+        if os.path.exists(recording.thumbnail_small_path):
+            os.remove(recording.thumbnail_small_path)
+        camera_model.update_recording(recording.path, thumbnail_small_path=None)
+
+
+def build_camera_sprites(camera: camera_model.Camera, now: datetime.datetime) -> int:
+    """Merge the small thumbnails of the camera's finished hours into sprites.
+
+    The small files are deleted once their sprite is written, or discarded when
+    their sheet fails. Returns how many sprites were written.
+    """
+    end = (now - datetime.timedelta(seconds=SPRITE_DELAY)).replace(
+        minute=0, second=0, microsecond=0
+    )
+    written = 0
+    while True:
+        pending = camera_model.list_sprite_candidates(camera.wid, end, SPRITE_BATCH)
+        hours = {}
+        for recording in pending:
+            if not os.path.exists(recording.thumbnail_small_path):
+                camera_model.update_recording(recording.path, thumbnail_small_path=None)
+                continue
+            hour = recording.start_time.replace(minute=0, second=0, microsecond=0)
+            hours.setdefault(hour, []).append(recording)
+
+        for hour, recordings in hours.items():
+            for first in range(0, len(recordings), SPRITE_TILES):
+                sheet = recordings[first : first + SPRITE_TILES]
+                output_path = sprite_path(camera, hour)
+                try:
+                    build_sprite(
+                        output_path,
+                        [recording.thumbnail_small_path for recording in sheet],
+                    )
+                except Exception as err:
+                    # Sem limpar, a mesma folha voltaria à frente em toda execução
+                    logging.error(
+                        f"Erro ao criar sprite da câmera {camera.name} "
+                        f"({hour:%Y-%m-%d %H}h), miniaturas descartadas: {err}"
+                    )
+                    if os.path.exists(output_path):
+                        os.remove(output_path)
+                    discard_tiles(sheet)
+                    metrics.inc("ipcam_sprite_failures_total", camera_id=camera.wid)
+                    continue
+                camera_model.assign_sprite(
+                    output_path, [recording.path for recording in sheet]
+                )
+                for recording in sheet:
+                    os.remove(recording.thumbnail_small_path)
+                written += 1
+                metrics.inc("ipcam_sprites_written_total", camera_id=camera.wid)
+                metrics.inc(
+                    "ipcam_sprite_thumbnails_merged_total",
+                    len(sheet),
+                    camera_id=camera.wid,
+                )
+
+        if len(pending) < SPRITE_BATCH:
+            break
+
+    if written:
+        logging.info(f"{written} sprites de miniaturas da câmera {camera.name} criados")
+    return written
+
+
+def expire_sprites(camera: camera_model.Camera, cutoff: datetime.datetime):
+    """Delete the camera's sprites whose hour ended before ``cutoff``."""
+    output_dir = sprite_dir(camera)
+    if not os.path.exists(output_dir):
+        return
+
+    for file in os.listdir(output_dir):
+        hour = segment_start_time(camera, file)
+        if hour and hour + datetime.timedelta(hours=1) <= cutoff:
+            os.remove(os.path.join(output_dir, file))
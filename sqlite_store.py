@@ -0,0 +1,76 @@
+import os
+import sqlite3
+import threading
+from typing import Callable, Set
+
+BUSY_TIMEOUT = int(os.environ.get("SQLITE_BUSY_TIMEOUT", 30000))
+
+_thread_local = threading.local()
+# Bancos já migrados neste processo
+_ready: Set[str] = set()
+
+
+def connect(
+    path: str, schema_version: int, migrate: Callable[[sqlite3.Cursor], None]
+) -> sqlite3.Connection:
+    """Return this thread's connection to ``path``, opening it on first use.
+
+    Connections are reused per thread (and per process, so forked workers never
+    share a handle) and only ever used as ``with conn:`` transaction scopes. The
+    first connection of the process brings the schema up to ``schema_version``.
+    """
+    connections = getattr(_thread_local, "connections", None)
+    if connections is None or _thread_local.pid != os.getpid():
+        connections = _thread_local.connections = {}
+        _thread_local.pid = os.getpid()
+
+    conn = connections.get(path)
+    if conn is None:
+        conn = sqlite3.connect(
+            path, timeout=BUSY_TIMEOUT / 1000, check_same_thread=False
+        )
+        conn.row_factory = sqlite3.Row
+        conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT}")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        connections[path] = conn
+
+    if path not in _ready:
+        init_db(conn, schema_version, migrate)
+        _ready.add(path)
+
+    return conn
+
+
+def close(path: str):
+    """Close this thread's connection to ``path``, if any."""
+    connections = getattr(_thread_local, "connections", None) or {}
+    conn = connections.pop(path, None)
+    if conn is not None:
+        conn.close()
+
+
+def init_db(
+    conn: sqlite3.Connection,
+    schema_version: int,
+    migrate: Callable[[sqlite3.Cursor], None],
+):
+    """Run ``migrate`` once per database, when ``user_version`` is behind.
+
+    ``migrate`` must be idempotent (``IF NOT EXISTS``, column checks): it runs on
+    databases at any older version.
+    """
+    if conn.execute("PRAGMA user_version").fetchone()[0] >= schema_version:
+        return
+
+    # WAL é persistente no arquivo, basta ativar uma vez
+    conn.execute("PRAGMA journal_mode=WAL")
+
+    with conn:
+        # BEGIN IMMEDIATE serializa migrações concorrentes entre processos
+        conn.execute("BEGIN IMMEDIATE")
+        if conn.execute("PRAGMA user_version").fetchone()[0] >= schema_version:
+            return
+
+        cursor = conn.cursor()
+        migrate(cursor)
+        cursor.execute(f"PRAGMA user_version={schema_version}")
@@ -1,35 +1,68 @@
+import hashlib
+import logging
+import random
 import time
 from functools import wraps
-from typing import Callable
+from typing import Callable, Optional
 
 
-def retry(sleep_time: int = 5, max_attempts: int = 3):
-    """Execute retry of a function at 3 attempts.
+def retry(
+    sleep_time: float = 5,
+    max_attempts: int = 3,
+    max_sleep: Optional[float] = None,
+    retry_if: Optional[Callable[[Exception], bool]] = None,
+    delay_for: Optional[Callable[[Exception], Optional[float]]] = None,
+):
+    """Retry a function up to ``max_attempts`` times, then raise the last error.
 
     Args:
-        sleep_time (int): The interval of attempts
+        sleep_time (float): Base of the exponential backoff; each wait is drawn
+            between zero and ``sleep_time * 2 ** attempt`` (full jitter).
+        max_sleep (float): Upper bound of a single wait.
+        retry_if (Callable): Whether an error is worth retrying; others are
+            raised right away.
+        delay_for (Callable): Wait imposed by the error itself (e.g. Retry-After),
+            used instead of the backoff when it returns a value.
     """
 
     def decorator(f: Callable):
         @wraps(f)
         def wrapper(*args, **kwargs):
-            errors = []
             attempts = 0
-            while attempts < max_attempts:
+            while True:
                 try:
                     return f(*args, **kwargs)
                 except Exception as e:
-                    errors.append(e)
                     attempts += 1
-                    print(
-                        f"Failed to execute {f.__name__} with:"
-                        f"args {args} and kwargs {kwargs}."
-                        f"Retrying in {sleep_time} seconds (Attempt {attempts}/{max_attempts})."
+                    if attempts >= max_attempts or (retry_if and not retry_if(e)):
+                        raise
+                    delay = delay_for(e) if delay_for else None
+                    if delay is None:
+                        backoff = sleep_time * 2 ** (attempts - 1)
+                        delay = random.uniform(0, min(backoff, max_sleep or backoff))
+                    logging.warning(
+                        f"Failed to execute {f.__name__}: {e}. Retrying in "
+                        f"{delay:.1f} seconds (Attempt {attempts}/{max_attempts})."
                     )
-                    time.sleep(sleep_time)
-
-            raise Exception(errors)
+                    time.sleep(delay)
 
         return wrapper
 
     return decorator
+
+
+def duration_to_seconds(duration: str) -> int:
+    """Convert an ffmpeg style ``HH:MM:SS`` (or plain seconds) duration to seconds."""
+    seconds = 0
+    for part in str(duration).split(":"):
+        seconds = seconds * 60 + int(float(part or 0))
+    return seconds
+
+
+def file_md5(path: str, chunk_size: int = 1024 * 1024) -> str:
+    """Hex MD5 of a file, the same digest Drive reports as ``md5Checksum``."""
+    digest = hashlib.md5()
+    with open(path, "rb") as file:
+        while chunk := file.read(chunk_size):
+            digest.update(chunk)
+    return digest.hexdigest()